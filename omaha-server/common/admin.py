@@ -1,15 +1,71 @@
+import datetime
 
+from django.conf import settings
 from django.contrib import admin
-from .models import RequestLog
+from django.utils import timezone
+from .models import RequestLog, FileUpload
+from .uploads import start_upload, get_upload
+
+
+class TimeWindowFilter(admin.SimpleListFilter):
+    """
+    Restrict the list to recent days by default, so listing and searching
+    only touch the newest partitions instead of the whole table.
+    """
+    title = 'time window'
+    parameter_name = 'window'
+    all_value = 'all'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('1', 'Last day'),
+            ('7', 'Last 7 days'),
+            ('30', 'Last 30 days'),
+            (self.all_value, 'All'),
+        )
+
+    def get_days(self):
+        if self.value() == self.all_value:
+            return None
+        try:
+            return int(self.value())
+        except (TypeError, ValueError):
+            return getattr(settings, 'REQUEST_LOG_ADMIN_WINDOW_DAYS', 1)
+
+    def choices(self, changelist):
+        days = self.get_days()
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': lookup == (str(days) if days is not None else self.all_value),
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        days = self.get_days()
+        # An explicit date filter replaces the default window
+        if self.value() is None and any(key.startswith('timestamp__') for key in request.GET):
+            return queryset
+        if days is None:
+            return queryset
+        return queryset.filter(timestamp__gte=timezone.now() - datetime.timedelta(days=days))
+
 
 @admin.register(RequestLog)
 class RequestLogAdmin(admin.ModelAdmin):
     list_display = ('timestamp', 'method', 'path', 'status_code', 'user', 'ip_address')
-    list_filter = ('method', 'status_code', 'user', 'timestamp')
-    search_fields = ('path', 'query_params', 'body', 'headers', 'ip_address')
+    list_filter = (TimeWindowFilter, 'method', 'status_code', 'user', 'timestamp')
+    # body and headers are stored compressed and cannot be searched
+    search_fields = ('path', 'query_params', 'ip_address')
     readonly_fields = ('timestamp', 'method', 'path', 'query_params', 'body', 'headers', 'status_code', 'user', 'ip_address')
     actions = ['delete_selected']  # Enable bulk delete action
-    
+    # Counting every row defeats the time window
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Compressed columns are only fetched when a single log is opened
+        return super().get_queryset(request).defer('body_data', 'headers_data')
+
     def has_delete_permission(self, request, obj=None):
         return True 
         
@@ -18,3 +74,39 @@ class RequestLogAdmin(admin.ModelAdmin):
 
     def has_change_permission(self, request, obj=None):
         return False  # Prevent editing logs
+
+
+@admin.register(FileUpload)
+class FileUploadAdmin(admin.ModelAdmin):
+    list_display = ('created', 'name', 'model', 'object_id', 'status', 'progress', 'modified')
+    list_filter = ('status', 'model')
+    readonly_fields = ('model', 'object_id', 'field_name', 'name', 'path', 'size', 'uploaded', 'progress',
+                       'upload_id', 'part_size', 'enable', 'status', 'error', 'created', 'modified')
+    actions = ['resume']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='Progress, %')
+    def progress(self, obj):
+        return obj.progress
+
+    @admin.action(description='Resume the selected failed uploads')
+    def resume(self, request, queryset):
+        count = 0
+        for upload in queryset.filter(status='failed'):
+            start_upload(upload.pk)
+            count += 1
+        self.message_user(request, '%d uploads resumed' % count)
+
+
+class FileUploadMixin:
+    """
+    Show the state of the background upload of the file in the admin of
+    a model using common.uploads.
+    """
+
+    @admin.display(description='Upload')
+    def file_upload(self, obj):
+        upload = get_upload(obj) if obj.pk else None
+        return str(upload) if upload is not None else '-'
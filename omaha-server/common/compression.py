@@ -0,0 +1,71 @@
+import zlib
+
+# Stored values start with a format byte. Formats are never changed once
+# released: a new dictionary gets a new format so older rows stay readable.
+FORMAT_RAW = 0
+FORMAT_DEFLATE_V1 = 1
+
+# Preset dictionary of substrings found in Omaha update requests and in the
+# headers of their clients. Deflate finds the most matches near the end of
+# the dictionary, so the most frequent strings come last.
+DICTIONARY_V1 = (
+    '{"HTTP_ACCEPT": "*/*", "HTTP_ACCEPT_ENCODING": "gzip, deflate", '
+    '"HTTP_CONNECTION": "keep-alive", "HTTP_CONTENT_TYPE": "text/xml", '
+    '"HTTP_CONTENT_LENGTH": "", "HTTP_CACHE_CONTROL": "no-cache", '
+    '"HTTP_PRAGMA": "no-cache", "HTTP_X_FORWARDED_PROTO": "https", '
+    '"HTTP_X_FORWARDED_FOR": "", "HTTP_X_REAL_IP": "", '
+    '"HTTP_X_OLD_UID": "", "HTTP_X_LAST_HR": "", "HTTP_X_LAST_HS": "", '
+    '"HTTP_X_INTERACTIVITY": "bg", "HTTP_X_GOOG_UPDATE_INTERACTIVITY": "bg", '
+    '"HTTP_X_GOOG_UPDATE_APPID": "{", "HTTP_X_GOOG_UPDATE_UPDATER": "", '
+    '"HTTP_USER_AGENT": "Google Update/1.3.", "HTTP_HOST": "'
+    '<event eventtype="3" eventresult="1" errorcode="0" extracode1="0"/>'
+    '<event eventtype="2" eventresult="1" errorcode="0" extracode1="0"/>'
+    '<event eventtype="14" eventresult="1" errorcode="0" extracode1="0" download_time_ms="'
+    '" downloaded="" total="" update_check_time_ms="" install_time_ms="'
+    '" source_url_index="0" state_cancelled="0" time_since_update_available_ms="'
+    '" time_since_download_start_ms="" nextversion="" previousversion="'
+    '<data name="install" index="verboselogging"/><data name="untrusted"/>'
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<request protocol="3.0" version="1.3.3.0" shell_version="1.3.3.0" '
+    'ismachine="1" sessionid="{" userid="{" installsource="scheduler" '
+    'testsource="" requestid="{" dedup="cr" domainjoined="0">'
+    '<hw physmemory="16" sse="1" sse2="1" sse3="1" ssse3="1" sse41="1" sse42="1" avx="1"/>'
+    '<os platform="win" version="10.0.19045." sp="" arch="x64"/>'
+    '<os platform="mac" version="14." arch="arm64"/>'
+    '<app appid="{" version="" nextversion="" lang="en" brand="" client="" '
+    'ap="" installage="" cohort="" cohortname="" installdate="">'
+    '<updatecheck/><ping r="1" rd="" ping_freshness="{"/></app></request>'
+).encode('utf-8')
+
+
+def compress(value):
+    """
+    Return the stored form of a text value; None stays None.
+
+    >>> decompress(compress('<request protocol="3.0"/>'))
+    '<request protocol="3.0"/>'
+    >>> compress('')
+    b'\\x00'
+    """
+    if value is None:
+        return None
+    raw = value.encode('utf-8')
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS, zdict=DICTIONARY_V1)
+    data = compressor.compress(raw) + compressor.flush()
+    if len(data) < len(raw):
+        return bytes([FORMAT_DEFLATE_V1]) + data
+    return bytes([FORMAT_RAW]) + raw
+
+
+def decompress(data):
+    if data is None:
+        return None
+    data = bytes(data)
+    if data[0] == FORMAT_DEFLATE_V1:
+        decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS, zdict=DICTIONARY_V1)
+        raw = decompressor.decompress(data[1:]) + decompressor.flush()
+    elif data[0] == FORMAT_RAW:
+        raw = data[1:]
+    else:
+        raise ValueError(f"Unknown compression format {data[0]}")
+    return raw.decode('utf-8')
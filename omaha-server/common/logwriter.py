@@ -0,0 +1,124 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import RequestLog
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter(ABC):
+    """
+    Write-behind buffer.
+
+    Requests only put entries on a bounded queue; a daemon thread drains
+    it and hands batches of up to batch_size entries to write(), at the
+    latest flush_interval seconds after the first entry of a batch.
+    Entries that do not fit in the queue are counted in `dropped` instead
+    of blocking the request.
+    """
+
+    thread_name = 'buffered-writer'
+
+    def __init__(self, max_queue_size=10000, batch_size=500, flush_interval=1.0):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def ensure_started(self):
+        # A forked worker inherits the queue but not the flusher thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._thread = threading.Thread(target=self.run, name=self.thread_name, daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, entry):
+        self.ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def get_batch(self, timeout):
+        """
+        Collect entries until the batch is full or `timeout` seconds
+        have passed since the first one arrived.
+
+        Returns the batch and the Event of a flush() call that cut it
+        short, if any.
+        """
+        batch = []
+        entry = self._queue.get()
+        deadline = time.monotonic() + timeout
+        while not isinstance(entry, threading.Event):
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                return batch, None
+            try:
+                entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return batch, None
+        return batch, entry
+
+    def run(self):
+        while True:
+            batch, flushed = self.get_batch(self.flush_interval)
+            if batch:
+                self.write(batch)
+            if flushed is not None:
+                flushed.set()
+
+    @abstractmethod
+    def write(self, batch):
+        """Store a batch of entries; runs on the writer thread."""
+
+    def flush(self, timeout=5):
+        """Wait until everything submitted so far has been written."""
+        if self._pid != os.getpid():
+            return
+        flushed = threading.Event()
+        try:
+            self._queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return
+        flushed.wait(timeout)
+
+
+class RequestLogWriter(BufferedWriter):
+    """
+    Writes RequestLog rows with one bulk_create per batch.
+    """
+    thread_name = 'request-log-writer'
+
+    def write(self, batch):
+        try:
+            RequestLog.objects.bulk_create(batch)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} request logs: {e}")
+        finally:
+            close_old_connections()
+
+
+request_log_writer = RequestLogWriter(
+    max_queue_size=getattr(settings, 'REQUEST_LOG_QUEUE_SIZE', 10000),
+    batch_size=getattr(settings, 'REQUEST_LOG_BATCH_SIZE', 500),
+    flush_interval=getattr(settings, 'REQUEST_LOG_FLUSH_INTERVAL', 1.0),
+)
+atexit.register(request_log_writer.flush)
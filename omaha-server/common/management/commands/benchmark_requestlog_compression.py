@@ -0,0 +1,51 @@
+import time
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common import compression
+from common.models import RequestLog
+
+
+def plain_compress(value):
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(value.encode('utf-8')) + compressor.flush()
+
+
+def plain_decompress(data):
+    return zlib.decompress(data, wbits=-zlib.MAX_WBITS).decode('utf-8')
+
+
+class Command(BaseCommand):
+    help = ("Measure the size and speed of request log compression, with and "
+            "without the preset dictionary, on the most recent logs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000,
+                            help="Number of recent logs to sample.")
+
+    def handle(self, *args, **options):
+        values = []
+        for log in RequestLog.objects.order_by('-pk')[:options['count']]:
+            values.extend(value for value in (log.body, log.headers) if value)
+        if not values:
+            raise CommandError("No request logs to sample.")
+        raw_size = sum(len(value.encode('utf-8')) for value in values)
+        self.stdout.write(f"{len(values)} values, {raw_size} bytes")
+
+        for name, compress, decompress in (
+            ('deflate', plain_compress, plain_decompress),
+            ('deflate + dictionary', compression.compress, compression.decompress),
+        ):
+            start = time.perf_counter()
+            stored = [compress(value) for value in values]
+            compress_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for data in stored:
+                decompress(data)
+            decompress_time = time.perf_counter() - start
+            size = sum(len(data) for data in stored)
+            self.stdout.write(
+                f"{name}: {size} bytes ({raw_size / size:.1f}x), "
+                f"compress {raw_size / compress_time / 1e6:.1f} MB/s, "
+                f"decompress {raw_size / decompress_time / 1e6:.1f} MB/s")
@@ -0,0 +1,35 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common import partitions
+
+
+class Command(BaseCommand):
+    help = ("Create upcoming daily request log partitions and remove logs "
+            "older than the retention period. Meant to run daily from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int,
+            default=getattr(settings, 'REQUEST_LOG_RETENTION_DAYS', 30),
+            help="Keep request logs of this many recent days (0 keeps everything).")
+        parser.add_argument(
+            '--days-ahead', type=int,
+            default=getattr(settings, 'REQUEST_LOG_PARTITIONS_AHEAD', 3),
+            help="Create the partitions of this many upcoming days.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for day in partitions.ensure_partitions(now.date(), options['days_ahead']):
+            self.stdout.write(f"Created partition {partitions.get_partition_name(day)}")
+
+        if options['retention_days'] > 0:
+            # Cut at a day boundary so that whole partitions expire at once
+            cutoff = partitions.get_day_start(now.date() - datetime.timedelta(days=options['retention_days']))
+            dropped, deleted = partitions.prune(cutoff)
+            for name in dropped:
+                self.stdout.write(f"Dropped partition {name}")
+            self.stdout.write(f"Deleted {deleted} request logs before {cutoff:%Y-%m-%d}")
@@ -1,15 +1,85 @@
 
+import codecs
 import json
 import logging
+import random
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
 from django.utils import timezone
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.middleware import clickjacking, csrf
+from .logwriter import request_log_writer
 from .models import RequestLog
 
 logger = logging.getLogger(__name__)
 
+# Machine-to-machine endpoints (update checks, crash and feedback
+# uploads, appcasts) never use sessions, users, messages or CSRF tokens.
+PROTOCOL_PATH_PREFIXES = tuple(getattr(settings, 'PROTOCOL_PATH_PREFIXES', ('/service/',)))
+
+
+def is_protocol_request(request):
+    return request.path_info.startswith(PROTOCOL_PATH_PREFIXES)
+
+
+class ProtocolExemptMixin:
+    """
+    Pass protocol requests straight to the next middleware.
+    """
+
+    def __call__(self, request):
+        if not self.async_mode and is_protocol_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if is_protocol_request(request):
+            return await self.get_response(request)
+        return await super().__acall__(request)
+
+
+class ProtocolExemptViewMixin(ProtocolExemptMixin):
+    """
+    Also skip process_view, which the handler calls outside of __call__.
+    """
+
+    def process_view(self, request, *args, **kwargs):
+        if is_protocol_request(request):
+            return None
+        return super().process_view(request, *args, **kwargs)
+
+
+class SessionMiddleware(ProtocolExemptMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(ProtocolExemptViewMixin, csrf.CsrfViewMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(ProtocolExemptMixin, auth_middleware.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(ProtocolExemptMixin, messages_middleware.MessageMiddleware):
+    pass
+
+
+class XFrameOptionsMiddleware(ProtocolExemptMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
+
+
 class RequestLoggingMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
         # Define excluded path prefixes
         self.excluded_prefixes = [
             '/static/',
@@ -18,10 +88,17 @@ class RequestLoggingMiddleware:
         ]
         # Optionally, retrieve STATIC_URL from settings
         self.static_url = getattr(settings, 'STATIC_URL', '/static/')
+        # Share of requests logged per path prefix, longest prefix first
+        sample_rates = getattr(settings, 'REQUEST_LOG_SAMPLE_RATES', {})
+        self.sample_rates = sorted(sample_rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_body_length = getattr(settings, 'REQUEST_LOG_MAX_BODY_LENGTH', None)
+        self.buffered = getattr(settings, 'REQUEST_LOG_BUFFERED', True)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         # Check if the request path starts with any excluded prefix
-        if self.is_excluded(request.path):
+        if self.is_excluded(request.path) or not self.is_sampled(request.path):
             return self.get_response(request)
 
         # Code to execute for each request before the view is called
@@ -30,44 +107,83 @@ class RequestLoggingMiddleware:
         response = self.get_response(request)
 
         # Code to execute for each request after the view is called
+        self.log(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if self.is_excluded(request.path) or not self.is_sampled(request.path):
+            return await self.get_response(request)
+
+        request._start_time = timezone.now()
+
+        response = await self.get_response(request)
+
+        # Protocol requests have no user to load and queued entries are
+        # not saved here, so only the other ones need a thread
+        if self.buffered and is_protocol_request(request):
+            self.log(request, response)
+        else:
+            await sync_to_async(self.log)(request, response)
+        return response
+
+    def log(self, request, response):
         try:
-            # Get authenticated user
-            user = request.user if request.user.is_authenticated else None
-
-            # Get client IP address
-            ip_address = self.get_client_ip(request)
-
-            # Extract headers
-            headers = {k: v for k, v in request.META.items() if k.startswith('HTTP_')}
-
-            # Extract request body for specific methods
-            body = ''
-            if request.method in ['POST', 'PUT', 'PATCH']:
-                try:
-                    body = request.body.decode('utf-8')
-                except UnicodeDecodeError:
-                    body = 'Binary data'
-
-            # Extract query parameters
-            query_params = request.META.get('QUERY_STRING', '')
-
-            # Create RequestLog entry
-            RequestLog.objects.create(
-                path=request.path,
-                method=request.method,
-                query_params=query_params,
-                body=body,
-                headers=json.dumps(headers),
-                status_code=response.status_code,
-                user=user,
-                ip_address=ip_address
-            )
+            entry = self.make_entry(request, response)
+            if self.buffered:
+                request_log_writer.submit(entry)
+            else:
+                entry.save()
         except Exception as e:
             logger.error(f"Error in RequestLoggingMiddleware: {e}")
             # Optionally, you can re-raise the exception to propagate it
             # raise
 
-        return response
+    def make_entry(self, request, response):
+        # Get authenticated user, protocol requests have none
+        user = getattr(request, 'user', None)
+        if user is not None and not user.is_authenticated:
+            user = None
+
+        # Get client IP address
+        ip_address = self.get_client_ip(request)
+
+        # Extract headers
+        headers = {k: v for k, v in request.META.items() if k.startswith('HTTP_')}
+
+        # Extract request body for specific methods
+        body = ''
+        if request.method in ['POST', 'PUT', 'PATCH']:
+            raw_body = request.body
+            truncated = self.max_body_length is not None and len(raw_body) > self.max_body_length
+            if truncated:
+                raw_body = raw_body[:self.max_body_length]
+            try:
+                # A cut may split the last character, leave it out then
+                body = codecs.getincrementaldecoder('utf-8')().decode(raw_body, final=not truncated)
+            except UnicodeDecodeError:
+                body = 'Binary data'
+
+        # Extract query parameters
+        query_params = request.META.get('QUERY_STRING', '')
+
+        # Build the RequestLog entry, stamped with the request time
+        return RequestLog(
+            path=request.path,
+            method=request.method,
+            query_params=query_params,
+            body=body,
+            headers=json.dumps(headers),
+            status_code=response.status_code,
+            user=user,
+            ip_address=ip_address,
+            timestamp=request._start_time,
+        )
+
+    def is_sampled(self, path):
+        for prefix, rate in self.sample_rates:
+            if path.startswith(prefix):
+                return rate >= 1 or random.random() < rate
+        return True
 
     def is_excluded(self, path):
         # Check if the path starts with any of the excluded prefixes
@@ -0,0 +1,59 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def partition_requestlog(apps, schema_editor):
+    """
+    Turn common_requestlog into a table range partitioned by day.
+
+    The existing table is kept as the common_requestlog_legacy partition
+    covering everything up to tomorrow, so no rows are copied. Daily
+    partitions are created by the requestlog_maintenance command and a
+    DEFAULT partition takes rows until they exist.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    tomorrow = datetime.datetime.combine(timezone.now().date() + datetime.timedelta(days=1),
+                                         datetime.time.min, tzinfo=datetime.timezone.utc)
+    for sql, params in [
+        ('ALTER TABLE common_requestlog RENAME TO common_requestlog_legacy', []),
+        ('ALTER INDEX common_requestlog_pkey RENAME TO common_requestlog_legacy_pkey', []),
+        ('ALTER TABLE common_requestlog_legacy ALTER COLUMN id DROP IDENTITY IF EXISTS', []),
+        ('ALTER TABLE common_requestlog_legacy ALTER COLUMN id DROP DEFAULT', []),
+        ('DROP SEQUENCE IF EXISTS common_requestlog_id_seq', []),
+        ('CREATE TABLE common_requestlog (LIKE common_requestlog_legacy) '
+         'PARTITION BY RANGE ("timestamp")', []),
+        # The partition key has to be part of the primary key
+        ('ALTER TABLE common_requestlog ADD PRIMARY KEY (id, "timestamp")', []),
+        ('CREATE SEQUENCE common_requestlog_id_seq OWNED BY common_requestlog.id', []),
+        ("SELECT setval('common_requestlog_id_seq', COALESCE(MAX(id), 0) + 1, false) "
+         "FROM common_requestlog_legacy", []),
+        ("ALTER TABLE common_requestlog ALTER COLUMN id SET DEFAULT nextval('common_requestlog_id_seq')", []),
+        (f'ALTER TABLE common_requestlog ADD CONSTRAINT common_requestlog_user_id_fk '
+         f'FOREIGN KEY (user_id) REFERENCES "{user_table}" (id) DEFERRABLE INITIALLY DEFERRED', []),
+        ('CREATE INDEX common_requestlog_user_id_idx ON common_requestlog (user_id)', []),
+        ('ALTER TABLE common_requestlog ATTACH PARTITION common_requestlog_legacy '
+         'FOR VALUES FROM (MINVALUE) TO (%s)', [tomorrow]),
+        ('CREATE TABLE common_requestlog_default PARTITION OF common_requestlog DEFAULT', []),
+    ]:
+        schema_editor.execute(sql, params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_requestlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_requestlog, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='requestlog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:37
+
+from django.db import migrations, models, transaction
+
+from common import compression
+
+BATCH_SIZE = 1000
+
+
+def convert(apps, schema_editor, source_fields, target_fields, convert_value):
+    """
+    Rewrite the rows in pk order, BATCH_SIZE at a time, each batch in its
+    own short transaction. A batch only locks its own rows and lets
+    autovacuum reclaim the old versions while the backfill goes on.
+    """
+    RequestLog = apps.get_model('common', 'RequestLog')
+    db = schema_editor.connection.alias
+    queryset = RequestLog.objects.using(db).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            return
+        with transaction.atomic(using=db):
+            batch = list(queryset.filter(pk__in=pks).only('pk', *source_fields))
+            for log in batch:
+                for source, target in zip(source_fields, target_fields):
+                    setattr(log, target, convert_value(getattr(log, source)))
+            RequestLog.objects.using(db).bulk_update(batch, target_fields)
+        last_pk = pks[-1]
+
+
+def compress_logs(apps, schema_editor):
+    convert(apps, schema_editor, ['body', 'headers'], ['body_data', 'headers_data'], compression.compress)
+
+
+def decompress_logs(apps, schema_editor):
+    convert(apps, schema_editor, ['body_data', 'headers_data'], ['body', 'headers'], compression.decompress)
+
+
+class Migration(migrations.Migration):
+    # the backfill commits batch by batch instead of holding the whole
+    # table in one transaction
+    atomic = False
+
+    dependencies = [
+        ('common', '0003_requestlog_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlog',
+            name='body_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='headers_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_logs, decompress_logs),
+        migrations.RemoveField(
+            model_name='requestlog',
+            name='body',
+        ),
+        migrations.RemoveField(
+            model_name='requestlog',
+            name='headers',
+        ),
+    ]
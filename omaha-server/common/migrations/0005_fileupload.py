@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-17 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_requestlog_compressed_body'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=64)),
+                ('field_name', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=1024)),
+                ('path', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField()),
+                ('uploaded', models.BigIntegerField(default=0)),
+                ('upload_id', models.CharField(blank=True, max_length=1024, null=True)),
+                ('part_size', models.BigIntegerField(blank=True, null=True)),
+                ('enable', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('uploading', 'Uploading'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id'], name='common_file_model_fe8372_idx')],
+            },
+        ),
+    ]
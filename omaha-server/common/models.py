@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from . import compression
+
 class RequestLog(models.Model):
     METHOD_CHOICES = [
         ('GET', 'GET'),
@@ -14,12 +17,73 @@ class RequestLog(models.Model):
     path = models.CharField(max_length=2048)
     method = models.CharField(max_length=10, choices=METHOD_CHOICES)
     query_params = models.TextField(blank=True, null=True)
-    body = models.TextField(blank=True, null=True)
-    headers = models.TextField(blank=True, null=True)
+    # Compressed with common.compression, see the body and headers properties
+    body_data = models.BinaryField(blank=True, null=True)
+    headers_data = models.BinaryField(blank=True, null=True)
     status_code = models.IntegerField()
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set from the request start, entries are written in batches later on
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+
+    @property
+    def body(self):
+        return compression.decompress(self.body_data)
+
+    @body.setter
+    def body(self, value):
+        self.body_data = compression.compress(value)
+
+    @property
+    def headers(self):
+        return compression.decompress(self.headers_data)
+
+    @headers.setter
+    def headers(self, value):
+        self.headers_data = compression.compress(value)
 
     def __str__(self):
         return f"{self.method} {self.path} - {self.status_code}"
+
+
+class FileUpload(models.Model):
+    """
+    A file waiting in the staging directory to be written to its storage
+    by the tasks.upload_file job, see common.uploads.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('uploading', 'Uploading'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    # app_label.model_name of the object owning the file
+    model = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=64)
+    field_name = models.CharField(max_length=50)
+    name = models.CharField(max_length=1024)
+    path = models.CharField(max_length=1024)
+    size = models.BigIntegerField()
+    uploaded = models.BigIntegerField(default=0)
+    # S3 multipart upload, kept to resume after a failure
+    upload_id = models.CharField(max_length=1024, null=True, blank=True)
+    part_size = models.BigIntegerField(null=True, blank=True)
+    # is_enabled of the object when it was saved, restored once the file is stored
+    enable = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id']),
+        ]
+
+    @property
+    def progress(self):
+        return 100 * self.uploaded // self.size if self.size else 100
+
+    def __str__(self):
+        return f"{self.name} - {self.get_status_display()} {self.progress}%"
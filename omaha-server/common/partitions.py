@@ -0,0 +1,154 @@
+import datetime
+import logging
+import re
+
+from django.db import connection, transaction
+
+from .models import RequestLog
+
+logger = logging.getLogger(__name__)
+
+# On PostgreSQL common_requestlog is range partitioned by timestamp with one
+# partition per UTC day, a DEFAULT partition for rows outside of them and the
+# pre-partitioning table kept as common_requestlog_legacy (see migration
+# 0003). Other backends keep a single table, pruned through its timestamp
+# index.
+TABLE = RequestLog._meta.db_table
+LEGACY_PARTITION = f'{TABLE}_legacy'
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{8}})$')
+DELETE_BATCH_SIZE = 10000
+
+
+def is_partitioned():
+    return connection.vendor == 'postgresql'
+
+
+def get_partition_name(day):
+    return f'{TABLE}_p{day:%Y%m%d}'
+
+
+def get_day_start(day):
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+def get_partitions():
+    """
+    Return {day: table name} of the daily partitions.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass", [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions[datetime.datetime.strptime(match.group(1), '%Y%m%d').date()] = name
+    return partitions
+
+
+def get_legacy_end():
+    """
+    Return the exclusive upper bound of the legacy partition, None once it
+    is dropped.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamptz "
+            "FROM pg_class c WHERE c.oid = to_regclass(%s)", [LEGACY_PARTITION])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_partition(day):
+    name = get_partition_name(day)
+    start, end = get_day_start(day), get_day_start(day + datetime.timedelta(days=1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Rows of that day may already sit in the default partition, which
+        # would make a plain CREATE ... PARTITION OF fail. Move them first.
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+            f'WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved', [start, end])
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [start, end])
+    logger.info(f"Created request log partition {name}")
+
+
+def ensure_partitions(today, days_ahead):
+    """
+    Create the partitions of today and of the next `days_ahead` days.
+
+    Days still covered by the legacy partition, i.e. the day of the
+    migration, are skipped as their range would overlap it.
+    """
+    if not is_partitioned():
+        return []
+    existing = get_partitions()
+    legacy_end = get_legacy_end()
+    created = []
+    for offset in range(days_ahead + 1):
+        day = today + datetime.timedelta(days=offset)
+        if legacy_end is not None and get_day_start(day) < legacy_end:
+            continue
+        if day not in existing:
+            create_partition(day)
+            created.append(day)
+    return created
+
+
+def drop_partitions(cutoff):
+    """
+    Drop the daily partitions that only hold rows older than `cutoff`.
+    """
+    dropped = []
+    with connection.cursor() as cursor:
+        for day, name in sorted(get_partitions().items()):
+            if get_day_start(day + datetime.timedelta(days=1)) <= cutoff:
+                cursor.execute(f'DROP TABLE "{name}"')
+                dropped.append(name)
+        cursor.execute('SELECT to_regclass(%s)', [LEGACY_PARTITION])
+        if cursor.fetchone()[0] is not None:
+            cursor.execute(
+                f'SELECT EXISTS (SELECT 1 FROM "{LEGACY_PARTITION}" WHERE "timestamp" >= %s)', [cutoff])
+            if not cursor.fetchone()[0]:
+                cursor.execute(f'DROP TABLE "{LEGACY_PARTITION}"')
+                dropped.append(LEGACY_PARTITION)
+    for name in dropped:
+        logger.info(f"Dropped request log partition {name}")
+    return dropped
+
+
+def delete_before(cutoff, batch_size=DELETE_BATCH_SIZE):
+    """
+    Delete older rows in short transactions so writers are never
+    locked out for long.
+    """
+    deleted = 0
+    queryset = RequestLog.objects.filter(timestamp__lt=cutoff)
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += RequestLog.objects.filter(pk__in=pks).delete()[0]
+
+
+def prune(cutoff):
+    """
+    Remove request logs older than `cutoff`.
+
+    Returns (dropped partition names, number of deleted rows).
+    """
+    if not is_partitioned():
+        return [], delete_before(cutoff)
+    dropped = drop_partitions(cutoff)
+    # Only the default partition can still hold expired rows
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{DEFAULT_PARTITION}" WHERE "timestamp" < %s', [cutoff])
+        deleted = cursor.rowcount
+    return dropped, deleted
@@ -1,3 +1,34 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.handlers.asgi import ASGIHandler
+from django.test import SimpleTestCase, override_settings
+
+from common import uploads
+from common.logwriter import BufferedWriter
+
+
+class AsyncMiddlewareTest(SimpleTestCase):
+    @override_settings(DEBUG=True)
+    def test_asgi_stack_is_not_adapted(self):
+        # load_middleware logs every middleware it has to wrap in a sync adapter
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+
+class StartUploadTest(SimpleTestCase):
+    def test_stored_without_broker(self):
+        with mock.patch.object(uploads, 'signature') as signature, \
+                mock.patch.object(uploads, 'run_upload') as run_upload:
+            signature.return_value.apply_async.side_effect = ConnectionRefusedError
+            with self.assertLogs('common.uploads', 'WARNING'):
+                uploads.start_upload(42)
+        run_upload.assert_called_once_with(42)
+
+
+class BufferedWriterTest(SimpleTestCase):
+    def test_write_is_required(self):
+        class Writer(BufferedWriter):
+            pass
+
+        with self.assertRaises(TypeError):
+            Writer()
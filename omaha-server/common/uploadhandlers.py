@@ -0,0 +1,85 @@
+import base64
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class FileHashes:
+    """
+    SHA-1, SHA-256 and size of a file fed chunk by chunk, encoded the
+    way Omaha manifests carry them: `hash` is the base64 SHA-1 digest,
+    `hash_sha256` the hex SHA-256 digest.
+
+        >>> hashes = FileHashes()
+        >>> hashes.update(b'omaha')
+        >>> hashes.sha1, hashes.sha256[:16], hashes.size
+        ('29WHK7uvE9VGT50TOHK9oPtg06Y=', '4177058f40d82f4e', 5)
+    """
+
+    def __init__(self):
+        self._sha1 = hashlib.sha1()
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data):
+        self._sha1.update(data)
+        self._sha256.update(data)
+        self.size += len(data)
+
+    @property
+    def sha1(self):
+        return base64.b64encode(self._sha1.digest()).decode()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+
+class HashingUploadMixin:
+    """
+    Hash uploaded files while they stream in and attach the FileHashes to
+    the resulting UploadedFile as `hashes`, so saving a model does not
+    read the file again.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # MemoryFileUploadHandler.new_file raises StopFutureHandlers
+        self.hashes = FileHashes()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # a memory handler that declined the upload passes it on unhashed
+        if getattr(self, 'activated', True):
+            self.hashes.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.hashes = self.hashes
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def get_file_hashes(field_file):
+    """
+    FileHashes of the file assigned to a FileField: the ones computed by
+    the upload handler, or a single pass over the file for files that
+    were not uploaded through a request.
+    """
+    # _file avoids opening committed files from the storage
+    hashes = getattr(getattr(field_file, '_file', None), 'hashes', None)
+    if hashes is not None:
+        return hashes
+    hashes = FileHashes()
+    for chunk in field_file.chunks():
+        hashes.update(chunk)
+    field_file.seek(0)
+    return hashes
@@ -0,0 +1,282 @@
+import logging
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import BotoCoreError, ClientError
+from celery import signature
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.db import transaction
+from django.dispatch import Signal
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from .models import FileUpload
+
+logger = logging.getLogger(__name__)
+
+# sent with the instance once run_upload has stored its file
+upload_done = Signal()
+
+UPLOAD_IN_BACKGROUND = getattr(settings, 'UPLOAD_IN_BACKGROUND', False)
+UPLOAD_BACKGROUND_MIN_SIZE = getattr(settings, 'UPLOAD_BACKGROUND_MIN_SIZE', 8 * 1024 * 1024)
+UPLOAD_STAGING_PATH = getattr(settings, 'UPLOAD_STAGING_PATH',
+                              os.path.join(tempfile.gettempdir(), 'omaha-uploads'))
+UPLOAD_PART_SIZE = getattr(settings, 'UPLOAD_PART_SIZE', 16 * 1024 * 1024)
+UPLOAD_MAX_WORKERS = getattr(settings, 'UPLOAD_MAX_WORKERS', 4)
+UPLOAD_PART_RETRIES = getattr(settings, 'UPLOAD_PART_RETRIES', 3)
+UPLOAD_PROGRESS_INTERVAL = getattr(settings, 'UPLOAD_PROGRESS_INTERVAL', 1.0)
+
+# S3 limits of multipart uploads
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def get_label(instance):
+    return instance._meta.label_lower
+
+
+def defer_upload(instance, field_name='file'):
+    """
+    Stage the new file of instance.field_name for the tasks.upload_file
+    job instead of writing it to the storage while saving. Call from a
+    pre_save receiver; schedule_uploads then queues the job in post_save.
+
+    The field gets its final name right away, and the object is held
+    disabled until the job has stored the file. Files smaller than
+    UPLOAD_BACKGROUND_MIN_SIZE are saved as usual.
+    """
+    file = getattr(instance, field_name)
+    if not UPLOAD_IN_BACKGROUND or not file or file._committed or file.size < UPLOAD_BACKGROUND_MIN_SIZE:
+        return False
+    field = file.field
+    name = field.generate_filename(instance, file.name)
+    name = file.storage.get_available_name(name, max_length=field.max_length)
+    os.makedirs(UPLOAD_STAGING_PATH, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=UPLOAD_STAGING_PATH, suffix='.upload')
+    content = file.file
+    if hasattr(content, 'temporary_file_path'):
+        os.close(fd)
+        file_move_safe(content.temporary_file_path(), path, allow_overwrite=True)
+    else:
+        with os.fdopen(fd, 'wb') as staged:
+            for chunk in content.chunks():
+                staged.write(chunk)
+    size = os.path.getsize(path)
+    file.name = name
+    file._committed = True
+    uploads = instance.__dict__.setdefault('_deferred_uploads', [])
+    uploads.append(dict(field_name=field_name, name=name, path=path, size=size,
+                        enable=instance.is_enabled))
+    instance.is_enabled = False
+    return True
+
+
+def schedule_uploads(instance):
+    """
+    Record the files staged by defer_upload and queue their jobs once the
+    transaction saving instance commits. Call from a post_save receiver;
+    returns whether any upload was scheduled.
+    """
+    uploads = instance.__dict__.pop('_deferred_uploads', ())
+    for kwargs in uploads:
+        upload = FileUpload.objects.create(model=get_label(instance), object_id=str(instance.pk), **kwargs)
+        transaction.on_commit(lambda pk=upload.pk: start_upload(pk))
+    return bool(uploads)
+
+
+def start_upload(pk):
+    """
+    Queue the tasks.upload_file job of a FileUpload, or store the file
+    right away when the broker cannot take the job.
+    """
+    try:
+        signature('tasks.upload_file', args=(pk,)).apply_async(queue='uploads')
+    except Exception as e:
+        logger.warning('Cannot queue upload %s, storing it now: %s', pk, e)
+        try:
+            run_upload(pk)
+        except Exception:
+            # recorded on the FileUpload and logged by run_upload
+            pass
+
+
+def get_upload(instance):
+    """
+    The latest FileUpload of instance, for the admin.
+    """
+    return (FileUpload.objects.filter(model=get_label(instance), object_id=str(instance.pk))
+            .order_by('-pk').first())
+
+
+class MultipartUploader:
+    """
+    Send a staged file to S3 as a multipart upload of part_size parts,
+    max_workers parts at a time.
+
+    Each part is retried with a backoff before the upload fails. The
+    upload id is stored on the FileUpload as soon as it is created, so a
+    later run lists the parts S3 already has and only sends the missing
+    ones.
+    """
+
+    def __init__(self, storage, max_workers=UPLOAD_MAX_WORKERS, retries=UPLOAD_PART_RETRIES,
+                 progress_interval=UPLOAD_PROGRESS_INTERVAL):
+        self.storage = storage
+        # clients are thread safe, the resources of the storage are not
+        self.client = storage.connection.meta.client
+        self.bucket = storage.bucket_name
+        self.max_workers = max_workers
+        self.retries = retries
+        self.progress_interval = progress_interval
+
+    def get_key(self, name):
+        return self.storage._normalize_name(clean_name(name))
+
+    def get_part_size(self, size):
+        return max(UPLOAD_PART_SIZE, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+
+    def create(self, upload, key):
+        with open(upload.path, 'rb') as staged:
+            params = self.storage._get_write_parameters(key, File(staged, upload.name))
+        upload.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, **params)['UploadId']
+        upload.part_size = self.get_part_size(upload.size)
+        upload.save(update_fields=['upload_id', 'part_size', 'modified'])
+
+    def list_parts(self, upload, key):
+        paginator = self.client.get_paginator('list_parts')
+        parts = {}
+        for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=upload.upload_id):
+            for part in page.get('Parts', ()):
+                parts[part['PartNumber']] = (part['ETag'], part['Size'])
+        return parts
+
+    def upload_part(self, upload, key, number):
+        offset = (number - 1) * upload.part_size
+        with open(upload.path, 'rb') as staged:
+            staged.seek(offset)
+            data = staged.read(upload.part_size)
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload.upload_id,
+                                                   PartNumber=number, Body=data)
+                return response['ETag'], len(data)
+            except (BotoCoreError, ClientError) as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning('Retrying part %d of %s: %s', number, key, e)
+                time.sleep(2 ** attempt)
+
+    def upload(self, upload):
+        key = self.get_key(upload.name)
+        parts = {}
+        if upload.upload_id:
+            try:
+                parts = self.list_parts(upload, key)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'NoSuchUpload':
+                    raise
+                # aborted or expired by a lifecycle rule
+                upload.upload_id = None
+        if not upload.upload_id:
+            self.create(upload, key)
+        count = max(1, math.ceil(upload.size / upload.part_size))
+        uploaded = sum(size for etag, size in parts.values())
+        self.report(upload, uploaded)
+        reported = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = dict((executor.submit(self.upload_part, upload, key, number), number)
+                           for number in range(1, count + 1) if number not in parts)
+            try:
+                for future in as_completed(futures):
+                    parts[futures[future]] = future.result()
+                    uploaded += parts[futures[future]][1]
+                    if time.monotonic() - reported >= self.progress_interval:
+                        self.report(upload, uploaded)
+                        reported = time.monotonic()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                self.report(upload, uploaded)
+                raise
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload.upload_id,
+            MultipartUpload=dict(Parts=[dict(PartNumber=number, ETag=parts[number][0])
+                                        for number in sorted(parts)]))
+        return upload.name
+
+    def abort(self, upload):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.get_key(upload.name),
+                                               UploadId=upload.upload_id)
+        except ClientError as e:
+            logger.warning('Cannot abort the upload of %s: %s', upload.name, e)
+
+    def report(self, upload, uploaded):
+        upload.uploaded = uploaded
+        FileUpload.objects.filter(pk=upload.pk).update(uploaded=uploaded)
+
+
+def get_object(upload):
+    model = apps.get_model(upload.model)
+    return model.objects.filter(pk=upload.object_id).first()
+
+
+def discard(upload, storage):
+    if upload.upload_id and isinstance(storage, S3Boto3Storage):
+        MultipartUploader(storage).abort(upload)
+    if os.path.exists(upload.path):
+        os.remove(upload.path)
+
+
+def run_upload(pk):
+    """
+    Store the file of a FileUpload, then enable its object again.
+    Failures are recorded on the FileUpload and raised, the next run
+    resumes from the parts already stored.
+    """
+    upload = FileUpload.objects.get(pk=pk)
+    if upload.status == 'done':
+        return
+    instance = get_object(upload)
+    storage = apps.get_model(upload.model)._meta.get_field(upload.field_name).storage
+    if instance is None or getattr(instance, upload.field_name).name != upload.name:
+        # the object was deleted or given another file meanwhile
+        discard(upload, storage)
+        upload.status, upload.error = 'failed', 'The file was replaced or its object deleted'
+        upload.save(update_fields=['status', 'error', 'modified'])
+        return
+    upload.status, upload.error = 'uploading', ''
+    upload.save(update_fields=['status', 'error', 'modified'])
+    try:
+        if isinstance(storage, S3Boto3Storage):
+            name = MultipartUploader(storage).upload(upload)
+        else:
+            with open(upload.path, 'rb') as staged:
+                name = storage.save(upload.name, File(staged))
+    except Exception as e:
+        logger.exception('Upload of %s failed', upload.name)
+        upload.status, upload.error = 'failed', str(e)
+        upload.save(update_fields=['status', 'error', 'modified'])
+        raise
+    os.remove(upload.path)
+    model = apps.get_model(upload.model)
+    if name != upload.name:
+        model.objects.filter(pk=upload.object_id).update(**{upload.field_name: name})
+    # reloaded, the object may have been edited during the upload
+    instance = get_object(upload)
+    if instance is not None:
+        if upload.enable:
+            instance.is_enabled = True
+        # saving also invalidates what is cached for the object
+        instance.save()
+    upload.status, upload.uploaded = 'done', upload.size
+    upload.save(update_fields=['status', 'uploaded', 'modified'])
+    logger.info('Stored %s, %d bytes', name, upload.size)
+    if instance is not None:
+        upload_done.send(sender=model, instance=instance, field_name=upload.field_name)
@@ -0,0 +1,4 @@
+# Loaded with Django so that tasks are sent through the project's app
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,18 @@
+"""
+Celery app of the project.
+
+Workers run with `celery --workdir omaha-server -A config worker` and
+consume the queues the web tier sends jobs to, `celery ... beat` runs
+CELERY_BEAT_SCHEDULE. Tasks are found in the tasks modules of the
+installed apps.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+app = Celery('omaha')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()  # Add this after imports
@@ -57,17 +58,36 @@ INSTALLED_APPS = [
     'common',
 ]
 
+# The common.middleware variants skip their work for PROTOCOL_PATH_PREFIXES
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'common.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'common.middleware.CsrfViewMiddleware',
+    'common.middleware.AuthenticationMiddleware',
+    'common.middleware.MessageMiddleware',
+    'common.middleware.XFrameOptionsMiddleware',
     'common.middleware.RequestLoggingMiddleware',
 ]
 
+PROTOCOL_PATH_PREFIXES = ['/service/']
+
+# RequestLoggingMiddleware queues entries and writes them in batches from a
+# background thread; entries beyond the queue size are dropped and counted.
+REQUEST_LOG_BUFFERED = True
+REQUEST_LOG_QUEUE_SIZE = 10000
+REQUEST_LOG_BATCH_SIZE = 500
+REQUEST_LOG_FLUSH_INTERVAL = 1.0
+# Share of requests logged per path prefix, e.g. {'/service/update2': 0.01}
+REQUEST_LOG_SAMPLE_RATES = {}
+REQUEST_LOG_MAX_BODY_LENGTH = 16 * 1024
+# Kept by the requestlog_maintenance command, which also creates the daily
+# partitions ahead of time on PostgreSQL
+REQUEST_LOG_RETENTION_DAYS = 30
+REQUEST_LOG_PARTITIONS_AHEAD = 3
+# The admin list only covers this many recent days unless asked otherwise
+REQUEST_LOG_ADMIN_WINDOW_DAYS = 1
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -138,6 +158,23 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'static'
 
+# Uploaded files carry the SHA-1, SHA-256 and size computed while they stream in
+FILE_UPLOAD_HANDLERS = [
+    'common.uploadhandlers.HashingMemoryFileUploadHandler',
+    'common.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
+# With UPLOAD_IN_BACKGROUND=True, builds from UPLOAD_BACKGROUND_MIN_SIZE up
+# are moved to UPLOAD_STAGING_PATH and written to their storage by the
+# tasks.upload_file job ('uploads' queue); the staging directory must be
+# shared with the workers. Off by default, files are stored while saving.
+UPLOAD_IN_BACKGROUND = os.getenv('UPLOAD_IN_BACKGROUND', 'False') == 'True'
+UPLOAD_BACKGROUND_MIN_SIZE = 8 * 1024 * 1024
+UPLOAD_STAGING_PATH = os.getenv('UPLOAD_STAGING_PATH', os.path.join(tempfile.gettempdir(), 'omaha-uploads'))
+UPLOAD_PART_SIZE = 16 * 1024 * 1024
+UPLOAD_MAX_WORKERS = 4
+UPLOAD_PART_RETRIES = 3
+
 
 # Crash
 
@@ -219,4 +256,24 @@ CACHEOPS = {
     'omaha.*': {'ops': (), 'timeout': 10},
     'sparkle.*': {'ops': (), 'timeout': 10},
     'crash.*': {'ops': (), 'timeout': 10},
-}
\ No newline at end of file
+}
+
+# Celery, see config/celery.py. Workers consume the default, transient
+# (statistics), uploads and patches queues.
+
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', '{REDIS_AUTH}{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}'.format(
+    REDIS_AUTH=REDIS_AUTH,
+    REDIS_PORT=REDIS_PORT,
+    REDIS_HOST=REDIS_HOST,
+    REDIS_DB=os.getenv('CELERY_REDIS_DB', 3)))
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+
+CELERY_BEAT_SCHEDULE = {
+    'refresh_rollups': {
+        'task': 'tasks.refresh_rollups',
+        'schedule': float(os.getenv('ROLLUP_REFRESH_INTERVAL', 300)),
+    },
+}
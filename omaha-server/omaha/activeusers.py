@@ -0,0 +1,231 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+Per-day bitmaps of the users that sent an update request.
+
+Bit n of a day's bitmap is set when the user with integer id n was seen
+that day. A user is active for a period when the bit is set in any of
+the bitmaps of the days before today; that union is built once per day
+and period, so a check is a single bit lookup.
+"""
+
+import atexit
+import datetime
+import logging
+import threading
+
+from django.utils.module_loading import import_string
+
+from common.logwriter import BufferedWriter
+from omaha.catalog import get_day
+from omaha.rollout import normalize_userid
+from omaha.settings import (
+    TRACK_ACTIVE_USERS,
+    ACTIVE_USERS_BACKEND,
+    ACTIVE_USERS_QUEUE_SIZE,
+    ACTIVE_USERS_BATCH_SIZE,
+    ACTIVE_USERS_FLUSH_INTERVAL,
+)
+
+
+__all__ = ['PERIOD_DAYS', 'LocalBackend', 'RedisBackend', 'get_backend',
+           'is_user_active', 'active_users_writer']
+
+
+logger = logging.getLogger(__name__)
+
+
+# ACTIVE_USERS_DICT_CHOICES: all, week, month
+PERIOD_DAYS = {0: None, 1: 7, 2: 30}
+RETENTION_DAYS = max(days for days in PERIOD_DAYS.values() if days) + 1
+
+
+def get_window(day, days):
+    return [day - datetime.timedelta(days=offset) for offset in range(1, days + 1)]
+
+
+class LocalBackend(object):
+    """
+    In-process ids and bitmaps, for a single process or development.
+
+        >>> backend = LocalBackend()
+        >>> today = datetime.date(2016, 3, 4)
+        >>> backend.mark(['{D0BBD725-742D-44ae-8D46-0231E881D58E}'], today - datetime.timedelta(days=3))
+        >>> backend.is_active('{D0BBD725-742D-44ae-8D46-0231E881D58E}', 7, today)
+        True
+        >>> backend.is_active('{D0BBD725-742D-44ae-8D46-0231E881D58E}', 2, today)
+        False
+        >>> backend.is_active('{8C65E04C-0383-4AE2-893F-4EC7C58F70DC}', 7, today)
+        False
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._bitmaps = {}
+        self._unions = {}
+
+    def get_id(self, userid):
+        with self._lock:
+            return self._ids.setdefault(userid, len(self._ids) + 1)
+
+    def mark(self, userids, day):
+        ids = [self.get_id(userid) for userid in userids]
+        with self._lock:
+            bitmap = self._bitmaps.setdefault(day, bytearray())
+            for id in ids:
+                byte = id >> 3
+                if byte >= len(bitmap):
+                    bitmap.extend(bytes(byte + 1 - len(bitmap)))
+                bitmap[byte] |= 1 << (id & 7)
+            # a late write for a past day invalidates the unions covering it
+            for key in [key for key in self._unions if key[1] - datetime.timedelta(days=key[0]) <= day < key[1]]:
+                del self._unions[key]
+            oldest = max(self._bitmaps) - datetime.timedelta(days=RETENTION_DAYS)
+            for old_day in [old_day for old_day in self._bitmaps if old_day < oldest]:
+                del self._bitmaps[old_day]
+
+    def get_union(self, days, day):
+        union = self._unions.get((days, day))
+        if union is None:
+            with self._lock:
+                value = 0
+                for window_day in get_window(day, days):
+                    value |= int.from_bytes(self._bitmaps.get(window_day, b''), 'little')
+                union = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+                self._unions[(days, day)] = union
+        return union
+
+    def is_active(self, userid, days, day):
+        id = self._ids.get(userid)
+        if id is None:
+            return False
+        union = self.get_union(days, day)
+        byte = id >> 3
+        return byte < len(union) and bool(union[byte] >> (id & 7) & 1)
+
+
+# KEYS: user id key, union key, day keys; ARGV: union ttl
+IS_ACTIVE_SCRIPT = """
+local id = redis.call('GET', KEYS[1])
+if not id then
+    return 0
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('BITOP', 'OR', KEYS[2], unpack(KEYS, 3))
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+end
+return redis.call('GETBIT', KEYS[2], id)
+"""
+
+
+class RedisBackend(object):
+    """
+    Ids and bitmaps in the 'statistics' Redis, shared by all processes.
+
+    A check is one script call: it reads the user id, builds the union
+    of the window on first use and reads the bit.
+    """
+    key_prefix = 'active'
+
+    def __init__(self):
+        from omaha.utils import redis, get_ids
+        self.redis = redis
+        self.get_ids = get_ids
+        self._is_active = None
+
+    def get_day_key(self, day):
+        return '%s:%s' % (self.key_prefix, day.isoformat())
+
+    def get_union_key(self, days, day):
+        return '%s:%d:%s' % (self.key_prefix, days, day.isoformat())
+
+    def mark(self, userids, day):
+        ids = self.get_ids(list(userids))
+        key = self.get_day_key(day)
+        with self.redis.pipeline(transaction=False) as pipe:
+            for id in ids:
+                pipe.setbit(key, id, 1)
+            pipe.expire(key, RETENTION_DAYS * 24 * 60 * 60)
+            pipe.execute()
+
+    def is_active(self, userid, days, day):
+        from omaha.settings import KEY_PREFIX
+        if self._is_active is None:
+            self._is_active = self.redis.register_script(IS_ACTIVE_SCRIPT)
+        keys = ['{}:{}'.format(KEY_PREFIX, userid), self.get_union_key(days, day)]
+        keys.extend(self.get_day_key(window_day) for window_day in get_window(day, days))
+        return bool(self._is_active(keys=keys, args=[24 * 60 * 60]))
+
+
+BACKENDS = dict(
+    local='omaha.activeusers.LocalBackend',
+    redis='omaha.activeusers.RedisBackend',
+)
+
+backend = None
+backend_lock = threading.Lock()
+
+
+def get_backend():
+    global backend
+    if backend is None:
+        with backend_lock:
+            if backend is None:
+                backend = import_string(BACKENDS.get(ACTIVE_USERS_BACKEND, ACTIVE_USERS_BACKEND))()
+    return backend
+
+
+def is_user_active(period, userid, date=None):
+    """
+    Whether the user sent an update request during the period before the
+    day of date. Every user passes while tracking is off, so partial
+    updates keep reaching everyone until the bitmaps are being filled.
+    """
+    days = PERIOD_DAYS[period]
+    if days is None or not TRACK_ACTIVE_USERS:
+        return True
+    if not userid:
+        return False
+    return get_backend().is_active(normalize_userid(userid), days, get_day(date or datetime.datetime.now()))
+
+
+class ActiveUsersWriter(BufferedWriter):
+    """
+    Marks the users of update requests off the request thread.
+    """
+    thread_name = 'active-users-writer'
+
+    def write(self, batch):
+        days = {}
+        for userid, date in batch:
+            days.setdefault(get_day(date), set()).add(normalize_userid(userid))
+        try:
+            for day, userids in days.items():
+                get_backend().mark(userids, day)
+        except Exception as e:
+            logger.error('Error marking %d active users: %s', len(batch), e)
+
+
+active_users_writer = ActiveUsersWriter(
+    max_queue_size=ACTIVE_USERS_QUEUE_SIZE,
+    batch_size=ACTIVE_USERS_BATCH_SIZE,
+    flush_interval=ACTIVE_USERS_FLUSH_INTERVAL,
+)
+atexit.register(active_users_writer.flush)
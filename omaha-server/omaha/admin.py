@@ -26,7 +26,8 @@ from django.utils.encoding import smart_str
 from dynamic_preferences.models import GlobalPreferenceModel
 from versionfield import VersionField
 
-from omaha.models import Channel, Platform, Application, Version, Action, PartialUpdate, Data
+from common.admin import FileUploadMixin
+from omaha.models import Channel, Platform, Application, Version, Action, PartialUpdate, Data, RequestRollup, Mirror, Patch
 from omaha.forms import ApplicationAdminForm, VersionAdminForm, ActionAdminForm, DataAdminForm
 
 
@@ -61,18 +62,29 @@ class ActionInline(admin.StackedInline):
     form = ActionAdminForm
 
 
+class PatchInline(admin.TabularInline):
+    model = Patch
+    fk_name = 'version'
+    extra = 0
+    fields = ('base', 'status', 'file', 'file_size', 'file_hash_sha256', 'error', 'modified')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 class PartialUpdateInline(admin.StackedInline):
     model = PartialUpdate
     extra = 0
 
 
 @admin.register(Version)
-class VersionAdmin(admin.ModelAdmin):
-    inlines = (ActionInline, PartialUpdateInline,)
+class VersionAdmin(FileUploadMixin, admin.ModelAdmin):
+    inlines = (ActionInline, PartialUpdateInline, PatchInline,)
     list_display = ( 'app', 'version', 'channel', 'platform','created', 'modified', 'is_enabled', 'is_critical',)
     list_display_links = ('app', 'version',)
     list_filter = ('channel__name', 'platform__name', 'app__name',)
-    readonly_fields = ('file_hash',)
+    readonly_fields = ('file_hash', 'file_hash_sha256', 'file_upload',)
     form = VersionAdminForm
 
     def clean_file(self):
@@ -85,6 +97,27 @@ class VersionAdmin(admin.ModelAdmin):
         return file
 
 
+@admin.register(Mirror)
+class MirrorAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'priority', 'is_enabled',)
+    list_editable = ('priority', 'is_enabled',)
+
+
+@admin.register(RequestRollup)
+class RequestRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'appid', 'version', 'channel', 'platform', 'os_version',
+                    'requests', 'installs', 'updates',)
+    list_filter = ('appid', 'channel', 'platform',)
+    date_hierarchy = 'day'
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 def my_display_for_field(value, field, *args, **kwargs):
     if isinstance(field, VersionField):
         return smart_str(value)
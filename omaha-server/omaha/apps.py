@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class OmahaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'omaha'
+
+    def ready(self):
+        # connect the release catalog and fragment cache signal handlers
+        import omaha.catalog  # noqa
+        import omaha.fragments  # noqa
@@ -18,93 +18,72 @@ License for the specific language governing permissions and limitations under
 the License.
 """
 
-from builtins import filter
 from functools import partial, reduce
-from uuid import UUID
 
 from django.utils.timezone import now
-from django.db.models import Q
-
-from lxml import etree
-from cacheops import cached_as
 
 # from omaha import tasks
 from omaha.models import Version
-from omaha.parser import parse_request
-from omaha import parser
-# from omaha.statistics import is_user_active
+from omaha.catalog import release_catalog, data_index
+from omaha.parser import parse_root, get_update_request
+from omaha import rollout
+from omaha.activeusers import is_user_active, active_users_writer
+from omaha.pings import ping_writer
+from omaha.mirrors import get_region, mirror_ranking, served_orders
+from omaha.patches import patch_index
+
+from omaha.fragments import updatecheck_fragments
+from omaha.statistics import statistics_writer
+from omaha.settings import RESPONSE_SERIALIZER, COLLECT_STATISTICS, TRACK_ACTIVE_USERS, COUNT_PINGS
+from omaha import core, stringcore
+
 
-from omaha.core import (Response, App, Updatecheck_negative, Manifest, Updatecheck_positive,
-                        Packages, Package, Actions, Action, Event, Data)
+__all__ = ['build_response', 'SERIALIZERS']
 
 
-__all__ = ['build_response']
+SERIALIZERS = dict(
+    lxml=core,
+    template=stringcore,
+)
 
 
-def on_event(event_list, event):
-    event_list.append(Event())
+def on_event(event_list, event, serializer=core):
+    event_list.append(serializer.Event())
     return event_list
 
 
-def on_data(data_list, data, version):
-    name = data.get('name')
+def on_data(data_list, data, app_id, serializer=core):
+    name, index = data
     if name == 'untrusted':
-        _data = Data('untrusted')
+        _data = serializer.Data('untrusted')
     elif name == 'install':
-        index = data.get('index')
-        data_obj_list = filter(lambda d: d.index == index, version.app.data_set.all())
         try:
-            _data = Data('install', index=index, text=next(data_obj_list).value)
-        except StopIteration:
-            _data = Data('install', index=index, status='error-nodata')
+            _data = serializer.Data('install', index=index, text=data_index[app_id, index])
+        except KeyError:
+            _data = serializer.Data('install', index=index, status='error-nodata')
+    else:
+        # names the protocol does not define get no answer
+        return data_list
 
     data_list.append(_data)
     return data_list
 
 
-def on_action(action_list, action):
-    action = Action(
-        event=action.get_event_display(),
-        **action.get_attributes()
-    )
-    action_list.append(action)
-    return action_list
-
-
 def is_new_user(version):
     if version == '':
         return True
     return False
 
 
-# @cached_as(Version, timeout=60)
 def _get_version(partialupdate, app_id, platform, channel, version, date=None):
     date = date or now()
+    critical_version, new_version = release_catalog.lookup(
+        partialupdate, app_id, platform, channel, version, date=date)
 
-    qs = Version.objects.select_related('app')
-    qs = qs.filter_by_enabled(app=app_id,
-                              platform__name=platform,
-                              channel__name=channel)
-    qs = qs.filter(version__gt=version) if version else qs
-    qs = qs.prefetch_related("actions", "partialupdate")
-
-    if partialupdate:
-        try:
-            qs = qs.filter(partialupdate__is_enabled=True,
-                           partialupdate__start_date__lte=date,
-                           partialupdate__end_date__gte=date)
-            critical_version = qs.filter(is_critical=True).order_by('version').cache().first()
-            new_version = qs.cache().latest('version')
-        except Version.DoesNotExist:
+    if new_version is None:
+        if partialupdate:
             return None
-    else:
-        qs = qs.filter(Q(partialupdate__isnull=True)
-                       | Q(partialupdate__is_enabled=False))
-        try:
-            critical_version = qs.filter(is_critical=True).order_by('version').cache().first()
-            new_version = qs.cache().latest('version')
-        except:
-            raise Version.DoesNotExist
+        raise Version.DoesNotExist
     if not is_new_user(version) and critical_version:
         return critical_version
     return new_version
@@ -120,12 +99,11 @@ def get_version(app_id, platform, channel, version, userid, date=None):
         if new_version.partialupdate.exclude_new_users and is_new_user(version):
             raise Version.DoesNotExist
 
-        # if not is_user_active(new_version.partialupdate.active_users, userid):
-        #     raise Version.DoesNotExist
+        if not is_user_active(new_version.partialupdate.active_users, userid, date=date):
+            raise Version.DoesNotExist
 
-        userid_int = UUID(userid).int
         percent = new_version.partialupdate.percent
-        if not (userid_int % int(100 / percent)) == 0:
+        if not rollout.is_in_rollout(userid, rollout.get_salt(new_version), percent):
             raise Version.DoesNotExist
     except Version.DoesNotExist:
         new_version = _get_version(False, app_id, platform, channel, version, date=date)
@@ -133,41 +111,40 @@ def get_version(app_id, platform, channel, version, userid, date=None):
     return new_version
 
 
-def on_app(apps_list, app, os, userid):
-    app_id = app.get('appid')
-    version = app.get('version')
-    platform = os.get('platform')
-    channel = parser.get_channel(app)
-    ping = bool(app.findall('ping'))
-    events = reduce(on_event, app.findall('event'), [])
-    build_app = partial(App, app_id, status='ok', ping=ping, events=events)
-    updatecheck = app.findall('updatecheck')
+def get_versions(apps, platform, userid, date=None):
+    """
+    Resolve every <app> of a request in one pass over the release catalog.
 
-    try:
-        version = get_version(app_id, platform, channel, version, userid)
-    except Version.DoesNotExist:
+    Returns the matched Version, or None, for each app in request order.
+    """
+    date = date or now()
+    versions = []
+    for app in apps:
+        try:
+            versions.append(get_version(app.appid, platform, app.channel, app.version, userid, date=date))
+        except Version.DoesNotExist:
+            versions.append(None)
+    return versions
+
+
+def on_app(apps_list, app_version, serializer=core, mirrors=()):
+    app, version = app_version
+    app_id = app.appid
+    events = reduce(partial(on_event, serializer=serializer), app.events, [])
+    build_app = partial(serializer.App, app_id, status='ok', ping=app.ping, events=events)
+    updatecheck = app.updatecheck
+
+    if version is None:
         apps_list.append(
-            build_app(updatecheck=Updatecheck_negative() if updatecheck else None))
+            build_app(updatecheck=serializer.Updatecheck_negative() if updatecheck else None))
         return apps_list
 
-    data_list = reduce(partial(on_data, version=version), app.findall('data'), [])
+    data_list = reduce(partial(on_data, app_id=version.app_id, serializer=serializer), app.data, [])
     build_app = partial(build_app, data_list=data_list)
 
     if updatecheck:
-        actions = reduce(on_action, version.actions.all(), [])
-        updatecheck = Updatecheck_positive(
-            urls=[version.file_url],
-            manifest=Manifest(
-                version=str(version.version),
-                packages=Packages([Package(
-                    name=version.file_package_name,
-                    required='true',
-                    size=str(version.file_size),
-                    hash=version.file_hash,
-                )]),
-                actions=Actions(actions) if actions else None,
-            )
-        )
+        patch = patch_index.lookup(version, app.version, app.fp)
+        updatecheck = serializer.Fragment(updatecheck_fragments.get(version, mirrors, patch))
         apps_list.append(build_app(updatecheck=updatecheck))
     else:
         apps_list.append(build_app())
@@ -175,11 +152,28 @@ def on_app(apps_list, app, os, userid):
     return apps_list
 
 
-def build_response(request, pretty_print=True, ip=None):
-    obj = parse_request(request)
-    # tasks.collect_statistics.apply_async(args=(request, ip), queue='transient')
-    userid = obj.get('userid')
-    apps = obj.findall('app')
-    apps_list = reduce(partial(on_app, os=obj.os, userid=userid), apps, [])
-    response = Response(apps_list, date=now())
-    return etree.tostring(response, pretty_print=pretty_print, xml_declaration=True, encoding='UTF-8')
+def build_response(request, pretty_print=True, ip=None, serializer=None):
+    serializer = SERIALIZERS[serializer or RESPONSE_SERIALIZER]
+    root = parse_root(request)
+    obj = get_update_request(root)
+    date = now()
+    if COLLECT_STATISTICS:
+        statistics_writer.submit((root, ip, date))
+    if TRACK_ACTIVE_USERS and obj.userid:
+        active_users_writer.submit((obj.userid, date))
+    if COUNT_PINGS and obj.userid:
+        pings = [(app.appid, app.version, app.channel, obj.platform) for app in obj.apps if app.ping]
+        if pings:
+            ping_writer.submit((obj.userid, date, pings))
+    versions = get_versions(obj.apps, obj.platform, obj.userid, date=date)
+    mirrors = mirror_ranking.get(get_region(ip))
+    apps_list = reduce(partial(on_app, serializer=serializer, mirrors=mirrors),
+                       zip(obj.apps, versions), [])
+    if obj.userid and len(mirrors) > 1:
+        # download events index into the codebases of this response
+        served = [app.appid for app, version in zip(obj.apps, versions)
+                  if app.updatecheck and version is not None]
+        if served:
+            served_orders.submit((obj.userid, served, mirrors))
+    response = serializer.Response(apps_list, date=date)
+    return serializer.tostring(response, pretty_print=pretty_print)
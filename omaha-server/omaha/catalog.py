@@ -0,0 +1,308 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+"""
+
+import datetime
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from versionfield.utils import convert_version_string_to_int
+
+from omaha.models import Version, Action, PartialUpdate, Application, Platform, Channel, Data
+from omaha.settings import CATALOG_TIMEOUT
+
+
+__all__ = ['ReleaseCatalog', 'release_catalog', 'DataIndex', 'data_index',
+           'get_day', 'version_to_int']
+
+
+VERSION_NUMBER_BITS = Version._meta.get_field('version').number_bits
+
+Entry = namedtuple('Entry', ['key', 'number', 'version', 'is_critical', 'partialupdate'])
+Compiled = namedtuple('Compiled', ['numbers', 'entries', 'criticals'])
+
+
+def get_day(date):
+    """
+    Return the date used to match PartialUpdate start/end boundaries
+
+    >>> get_day(datetime.datetime(year=2016, month=3, day=4, hour=23))
+    datetime.date(2016, 3, 4)
+    >>> get_day(datetime.date(year=2016, month=3, day=4))
+    datetime.date(2016, 3, 4)
+    """
+    if isinstance(date, datetime.datetime):
+        if timezone.is_aware(date):
+            date = timezone.localtime(date)
+        return date.date()
+    return date
+
+
+def version_to_int(version):
+    """
+    Return the packed VersionField value of a version string
+
+    >>> version_to_int('1.0.0.1')
+    1099511627777
+    """
+    return convert_version_string_to_int(version, VERSION_NUMBER_BITS)
+
+
+def is_partial_entry(entry, day):
+    partialupdate = entry.partialupdate
+    return (partialupdate is not None and partialupdate.is_enabled
+            and partialupdate.start_date <= day <= partialupdate.end_date)
+
+
+def is_regular_entry(entry):
+    return entry.partialupdate is None or not entry.partialupdate.is_enabled
+
+
+def compile_entries(entries):
+    """
+    Build the bisect index for entries sorted by version.
+
+    criticals[i] holds the position of the lowest critical version
+    at or after i, so both lookups of _get_version are O(log n).
+    """
+    criticals = [None] * (len(entries) + 1)
+    for i in range(len(entries) - 1, -1, -1):
+        criticals[i] = i if entries[i].is_critical else criticals[i + 1]
+    return Compiled([entry.number for entry in entries], entries, criticals)
+
+
+class BaseCatalog(ABC):
+    """
+    In-process data shared by all requests of a worker.
+
+    Subclasses are patched from model signals in this process and are
+    reloaded every `timeout` seconds so that changes made by other
+    processes are picked up as well.
+    """
+
+    def __init__(self, timeout=CATALOG_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._loaded_at = None
+
+    @abstractmethod
+    def load(self):
+        """Rebuild the whole catalog and set _loaded_at."""
+
+    def is_loaded(self):
+        return self._loaded_at is not None
+
+    def is_expired(self):
+        if self._loaded_at is None:
+            return True
+        return bool(self.timeout) and time.monotonic() - self._loaded_at > self.timeout
+
+    def ensure_loaded(self):
+        if self.is_expired():
+            with self._lock:
+                if self.is_expired():
+                    self.load()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+class ReleaseCatalog(BaseCatalog):
+    """
+    Index of enabled versions by (app, platform, channel).
+
+    Entries are kept sorted by the packed VersionField value and are
+    refreshed one version at a time.
+    """
+
+    def __init__(self, timeout=CATALOG_TIMEOUT):
+        super(ReleaseCatalog, self).__init__(timeout=timeout)
+        self._entries = {}
+        self._keys = {}
+        self._compiled = {}
+
+    def get_queryset(self):
+        return (Version.objects.filter_by_enabled()
+                .select_related('app', 'platform', 'channel')
+                .prefetch_related('actions', 'partialupdate'))
+
+    def make_entry(self, version):
+        try:
+            partialupdate = version.partialupdate
+        except PartialUpdate.DoesNotExist:
+            partialupdate = None
+        key = (version.app_id, version.platform.name, version.channel.name)
+        return Entry(key, int(version.version), version, version.is_critical, partialupdate)
+
+    def load(self):
+        entries = dict((version.pk, self.make_entry(version)) for version in self.get_queryset())
+        keys = {}
+        for entry in entries.values():
+            keys.setdefault(entry.key, []).append(entry)
+        with self._lock:
+            self._entries = entries
+            self._keys = dict((key, sorted(items, key=lambda e: e.number)) for key, items in keys.items())
+            self._compiled = {}
+            self._loaded_at = time.monotonic()
+
+    def refresh_version(self, pk):
+        if not self.is_loaded():
+            return
+        version = self.get_queryset().filter(pk=pk).first()
+        with self._lock:
+            if not self.is_loaded():
+                return
+            old = self._entries.pop(pk, None)
+            keys = set()
+            if old is not None:
+                keys.add(old.key)
+            if version is not None:
+                entry = self.make_entry(version)
+                self._entries[pk] = entry
+                keys.add(entry.key)
+            for key in keys:
+                items = [e for e in self._keys.get(key, []) if e.version.pk != pk]
+                if version is not None and entry.key == key:
+                    items.append(entry)
+                self._keys[key] = sorted(items, key=lambda e: e.number)
+                self._compiled.pop((key, True), None)
+                self._compiled.pop((key, False), None)
+
+    def get_compiled(self, key, partialupdate, day):
+        # Key lists are replaced, never mutated, so comparing identities
+        # discards an index compiled from a list a writer has since swapped.
+        source = self._keys.get(key, [])
+        cached = self._compiled.get((key, partialupdate))
+        if cached is not None and cached[0] is source and (not partialupdate or cached[1] == day):
+            return cached[2]
+        if partialupdate:
+            entries = [entry for entry in source if is_partial_entry(entry, day)]
+        else:
+            entries = [entry for entry in source if is_regular_entry(entry)]
+        compiled = compile_entries(entries)
+        self._compiled[(key, partialupdate)] = (source, day, compiled)
+        return compiled
+
+    def lookup(self, partialupdate, app_id, platform, channel, version, date=None):
+        """
+        Return (critical_version, new_version) newer than `version`.
+
+        Either item is None when nothing matches, mirroring the
+        .first()/.latest() pair previously run against Version.
+        """
+        self.ensure_loaded()
+        day = get_day(date or timezone.now())
+        compiled = self.get_compiled((app_id, platform, channel), partialupdate, day)
+        start = bisect_right(compiled.numbers, version_to_int(version)) if version else 0
+        if start >= len(compiled.entries):
+            return None, None
+        critical = compiled.criticals[start]
+        critical_version = compiled.entries[critical].version if critical is not None else None
+        return critical_version, compiled.entries[-1].version
+
+
+class DataIndex(BaseCatalog):
+    """
+    (app_id, index) -> value map of the Data rows of all applications.
+
+    When several rows share an index the oldest one wins.
+
+        >>> data_index = DataIndex()
+        >>> data_index._values = {('{430FD4D0-B729-4F61-AA34-91526481799D}', 'verboselogging'): '{}'}
+        >>> data_index._loaded_at = time.monotonic()
+        >>> data_index['{430FD4D0-B729-4F61-AA34-91526481799D}', 'verboselogging']
+        '{}'
+    """
+
+    def __init__(self, timeout=CATALOG_TIMEOUT):
+        super(DataIndex, self).__init__(timeout=timeout)
+        self._values = {}
+
+    @staticmethod
+    def get_values(queryset):
+        values = {}
+        for app_id, index, value in queryset.order_by('pk').values_list('app_id', 'index', 'value'):
+            values.setdefault((app_id, index), value)
+        return values
+
+    def load(self):
+        values = self.get_values(Data.objects.all())
+        with self._lock:
+            self._values = values
+            self._loaded_at = time.monotonic()
+
+    def refresh_app(self, app_id):
+        if not self.is_loaded():
+            return
+        app_values = self.get_values(Data.objects.filter(app_id=app_id))
+        with self._lock:
+            values = dict((key, value) for key, value in self._values.items() if key[0] != app_id)
+            values.update(app_values)
+            self._values = values
+
+    def __getitem__(self, key):
+        self.ensure_loaded()
+        return self._values[key]
+
+
+release_catalog = ReleaseCatalog()
+data_index = DataIndex()
+
+
+def refresh_on_commit(pk):
+    transaction.on_commit(lambda: release_catalog.refresh_version(pk))
+
+
+@receiver(post_save, sender=Version)
+@receiver(post_delete, sender=Version)
+def on_version_change(sender, instance, **kwargs):
+    refresh_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Action)
+@receiver(post_delete, sender=Action)
+@receiver(post_save, sender=PartialUpdate)
+@receiver(post_delete, sender=PartialUpdate)
+def on_version_related_change(sender, instance, **kwargs):
+    refresh_on_commit(instance.version_id)
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_save, sender=Platform)
+@receiver(post_save, sender=Channel)
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=Platform)
+@receiver(post_delete, sender=Channel)
+def on_catalog_key_change(sender, instance, **kwargs):
+    transaction.on_commit(release_catalog.invalidate)
+
+
+@receiver(post_save, sender=Data)
+@receiver(post_delete, sender=Data)
+def on_data_change(sender, instance, **kwargs):
+    app_id = instance.app_id
+    transaction.on_commit(lambda: data_index.refresh_app(app_id))
@@ -0,0 +1,252 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+Compact binary encoding of batches of statistics records.
+
+A batch is a schema version byte followed by a varint record count and
+the records. Every field of the schema is written in order:
+
+* integers as zigzag varints shifted by one, 0 standing for None;
+* strings as a varint reference into a table built along the batch,
+  0 for None, 1 for a new string (varint length and UTF-8 bytes follow),
+  n + 2 for the n-th string seen before. App ids, versions and platforms
+  repeat across a batch and cost one or two bytes after the first time.
+
+Schemas are never changed once released. A new layout gets a new version
+and decode_batch keeps reading the old ones.
+"""
+
+import base64
+import datetime
+
+
+__all__ = ['SCHEMA_VERSION', 'encode_batch', 'decode_batch', 'dumps', 'loads']
+
+
+SCHEMA_VERSION = 1
+
+INT, STR = 'int', 'str'
+
+REQUEST_SCHEMA_V1 = (
+    ('version', STR), ('ismachine', INT), ('sessionid', STR), ('userid', STR),
+    ('installsource', STR), ('originurl', STR), ('testsource', STR),
+    ('updaterchannel', STR), ('ip', STR),
+)
+OS_SCHEMA_V1 = (('platform', STR), ('version', STR), ('sp', STR), ('arch', STR))
+HW_SCHEMA_V1 = (
+    ('sse', INT), ('sse2', INT), ('sse3', INT), ('ssse3', INT), ('sse41', INT),
+    ('sse42', INT), ('avx', INT), ('physmemory', INT),
+)
+APP_SCHEMA_V1 = (
+    ('appid', STR), ('version', STR), ('nextversion', STR), ('lang', STR),
+    ('tag', STR), ('installage', INT),
+)
+EVENT_SCHEMA_V1 = (
+    ('eventtype', INT), ('eventresult', INT), ('errorcode', INT), ('extracode1', INT),
+    ('download_time_ms', INT), ('downloaded', INT), ('total', INT),
+    ('update_check_time_ms', INT), ('install_time_ms', INT), ('source_url_index', STR),
+    ('state_cancelled', INT), ('time_since_update_available_ms', INT),
+    ('time_since_download_start_ms', INT), ('nextversion', STR), ('previousversion', STR),
+)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Writer(object):
+    def __init__(self):
+        self.buffer = bytearray()
+        self.strings = {}
+
+    def varint(self, value):
+        buffer = self.buffer
+        while value > 0x7f:
+            buffer.append(value & 0x7f | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    def int(self, value):
+        if value is None:
+            self.varint(0)
+        else:
+            self.varint((value << 1 if value >= 0 else (-value << 1) - 1) + 1)
+
+    def str(self, value):
+        if value is None:
+            self.varint(0)
+            return
+        index = self.strings.get(value)
+        if index is not None:
+            self.varint(index + 2)
+            return
+        self.strings[value] = len(self.strings)
+        data = value.encode('utf-8')
+        self.varint(1)
+        self.varint(len(data))
+        self.buffer += data
+
+    def values(self, schema, values):
+        for name, kind in schema:
+            getattr(self, kind)(values[name])
+
+    def key(self, schema, key):
+        # Os and Hw keys are tuples, present or not as a whole
+        self.varint(0 if key is None else 1)
+        if key is not None:
+            self.values(schema, dict(zip((name for name, kind in schema), key)))
+
+
+class Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+        self.strings = []
+
+    def varint(self):
+        data = self.data
+        result = shift = 0
+        while True:
+            byte = data[self.position]
+            self.position += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def int(self):
+        value = self.varint()
+        if value == 0:
+            return None
+        value -= 1
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def str(self):
+        ref = self.varint()
+        if ref == 0:
+            return None
+        if ref > 1:
+            return self.strings[ref - 2]
+        length = self.varint()
+        value = bytes(self.data[self.position:self.position + length]).decode('utf-8')
+        self.position += length
+        self.strings.append(value)
+        return value
+
+    def values(self, schema):
+        return dict((name, getattr(self, kind)()) for name, kind in schema)
+
+    def key(self, schema):
+        if not self.varint():
+            return None
+        values = self.values(schema)
+        return tuple(values[name] for name, kind in schema)
+
+
+def to_microseconds(date):
+    if date is None:
+        return None
+    delta = date - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_microseconds(value):
+    if value is None:
+        return None
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+
+def encode_batch(records):
+    """
+    Pack records built by omaha.statistics.get_request_record.
+
+        >>> event = dict.fromkeys(name for name, kind in EVENT_SCHEMA_V1)
+        >>> event.update(eventtype=3, eventresult=1, errorcode=-2147024894)
+        >>> record = dict(
+        ...     request=dict(version='1.3.23.0', ismachine=0, sessionid=None, userid='{D0BBD725}',
+        ...                  installsource='scheduler', originurl=None, testsource=None,
+        ...                  updaterchannel=None, ip='8.8.8.8',
+        ...                  created=datetime.datetime(2016, 3, 4, tzinfo=datetime.timezone.utc)),
+        ...     os=('win', '6.1', None, 'x64'), hw=None,
+        ...     apps=[dict(app=dict(appid='{430FD4D0}', version='1.2.23.0', nextversion=None,
+        ...                         lang='en', tag='beta', installage=-1),
+        ...                events=[event])])
+        >>> data = encode_batch([record, record])
+        >>> len(data)
+        180
+        >>> decode_batch(data) == [record, record]
+        True
+    """
+    writer = Writer()
+    writer.buffer.append(SCHEMA_VERSION)
+    writer.varint(len(records))
+    for record in records:
+        request = record['request']
+        writer.values(REQUEST_SCHEMA_V1, request)
+        writer.int(to_microseconds(request.get('created')))
+        writer.key(OS_SCHEMA_V1, record['os'])
+        writer.key(HW_SCHEMA_V1, record['hw'])
+        writer.varint(len(record['apps']))
+        for app in record['apps']:
+            writer.values(APP_SCHEMA_V1, app['app'])
+            writer.varint(len(app['events']))
+            for event in app['events']:
+                writer.values(EVENT_SCHEMA_V1, event)
+    return bytes(writer.buffer)
+
+
+def decode_batch_v1(reader):
+    records = []
+    for _ in range(reader.varint()):
+        request = reader.values(REQUEST_SCHEMA_V1)
+        created = from_microseconds(reader.int())
+        if created is not None:
+            request['created'] = created
+        os = reader.key(OS_SCHEMA_V1)
+        hw = reader.key(HW_SCHEMA_V1)
+        apps = []
+        for _ in range(reader.varint()):
+            app = reader.values(APP_SCHEMA_V1)
+            events = [reader.values(EVENT_SCHEMA_V1) for _ in range(reader.varint())]
+            apps.append(dict(app=app, events=events))
+        records.append(dict(request=request, os=os, hw=hw, apps=apps))
+    return records
+
+
+DECODERS = {
+    1: decode_batch_v1,
+}
+
+
+def decode_batch(data):
+    version = data[0]
+    if version not in DECODERS:
+        raise ValueError('Unknown statistics schema version %d' % version)
+    return DECODERS[version](Reader(memoryview(data)[1:]))
+
+
+def dumps(records):
+    """
+    Text form for task arguments: Celery's JSON serializer cannot carry
+    arbitrary bytes.
+    """
+    return base64.b64encode(encode_batch(records)).decode('ascii')
+
+
+def loads(data):
+    return decode_batch(base64.b64decode(data))
+
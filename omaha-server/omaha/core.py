@@ -20,8 +20,10 @@ the License.
 
 
 
+import re
 from datetime import datetime
 
+from lxml import etree
 from lxml.builder import E
 
 from omaha.utils import get_sec_since_midnight, get_days_since_20070101
@@ -30,10 +32,34 @@ from omaha.utils import get_sec_since_midnight, get_days_since_20070101
 __all__ = [
     'Response', 'Url', 'Urls', 'Package', 'Packages', 'Data',
     'Action', 'Actions', 'Manifest', 'App', 'Updatecheck',
-    'Updatecheck_positive', 'Updatecheck_negative', 'Event'
+    'Updatecheck_positive', 'Updatecheck_negative', 'Event',
+    'Fragment', 'tostring'
 ]
 
 
+FRAGMENT_TARGET = 'omaha-fragment'
+FRAGMENT_RE = re.compile(rb'<\?omaha-fragment (.*?)\?>', re.DOTALL)
+
+
+def Fragment(data):
+    """
+    Placeholder of an already serialized subtree, e.g. from
+    omaha.fragments, which tostring splices in without parsing it again.
+    Serialized elements never contain '?>', lxml escapes '>' in text and
+    attribute values.
+
+        >>> app = App('{430FD4D0-B729-4F61-AA34-91526481799D}', updatecheck=Fragment(b'<updatecheck status="noupdate"/>'))
+        >>> tostring(app, pretty_print=False).splitlines()[1]
+        b'<app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" status="ok"><updatecheck status="noupdate"/></app>'
+    """
+    return etree.ProcessingInstruction(FRAGMENT_TARGET, data.decode('utf-8'))
+
+
+def tostring(response, pretty_print=True):
+    data = etree.tostring(response, pretty_print=pretty_print, xml_declaration=True, encoding='UTF-8')
+    return FRAGMENT_RE.sub(lambda match: match.group(1), data)
+
+
 def Response(apps_list, protocol='3.0', date=None, server='prod'):
     date = date or datetime.utcnow()
     elapsed_seconds = get_sec_since_midnight(date)
@@ -83,16 +109,18 @@ def Data(name, status='ok', index=None, text=None):
     return data
 
 
-def Url(url):
+def Url(url, diff=False):
     """
         >>> from lxml import etree as ET
         >>> ET.tostring(Url('http://cache.pack.google.com/edgedl/chrome/install/782.112/'))
         b'<url codebase="http://cache.pack.google.com/edgedl/chrome/install/782.112/"/>'
+        >>> ET.tostring(Url('http://cache.pack.google.com/edgedl/chrome/patch/782.112/', diff=True))
+        b'<url codebasediff="http://cache.pack.google.com/edgedl/chrome/patch/782.112/"/>'
     """
-    return E.url(dict(codebase=url))
+    return E.url({'codebasediff' if diff else 'codebase': url})
 
 
-def Urls(urls_list):
+def Urls(urls_list, diff_urls_list=()):
     """
         >>> from lxml import etree as ET
         >>> print(ET.tostring(Urls(['http://cache.pack.google.com/edgedl/chrome/install/782.112/',
@@ -104,10 +132,12 @@ def Urls(urls_list):
     """
     urls = E.urls()
     list([urls.append(Url(url)) for url in urls_list])
+    list([urls.append(Url(url, diff=True)) for url in diff_urls_list])
     return urls
 
 
-def Package(name, required, size, hash, fp=None):
+def Package(name, required, size, hash, fp=None, hash_sha256=None,
+            namediff=None, sizediff=None, hashdiff_sha256=None):
     """
         >>> from lxml import etree as ET
         >>> print(ET.tostring(Package(
@@ -123,8 +153,12 @@ def Package(name, required, size, hash, fp=None):
         size=size,
         hash=hash
     )
+    if hash_sha256:
+        attrs['hash_sha256'] = hash_sha256
     if fp:
         attrs['fp'] = fp
+    if namediff:
+        attrs.update(namediff=namediff, sizediff=sizediff, hashdiff_sha256=hashdiff_sha256)
     package = E.package(attrs)
     return package
 
@@ -216,7 +250,7 @@ def Updatecheck_negative():
     return Updatecheck()
 
 
-def Updatecheck_positive(urls, manifest):
+def Updatecheck_positive(urls, manifest, diff_urls=()):
     """
         >>> from lxml import etree as ET
         >>> manifest = Manifest(
@@ -249,7 +283,7 @@ def Updatecheck_positive(urls, manifest):
           </manifest>
         </updatecheck>'
     """
-    return Updatecheck(status='ok', urls=Urls(urls), manifest=manifest)
+    return Updatecheck(status='ok', urls=Urls(urls, diff_urls), manifest=manifest)
 
 
 def App(app_id, status='ok', experiments='', updatecheck=None, ping=False,
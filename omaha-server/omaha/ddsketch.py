@@ -0,0 +1,98 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+"""
+
+import math
+
+
+__all__ = ['DDSketch']
+
+
+class DDSketch(object):
+    """
+    Quantiles of non-negative values within a relative error.
+
+    Values fall into logarithmic bins, gamma ** (key - 1) < value <=
+    gamma ** key; a quantile is the middle of its bin. Sketches with the
+    same accuracy merge by adding bin counts, so merged results are as
+    accurate as a single sketch. Millisecond timings up to 2 ** 32 need
+    about 1100 bins at 1%.
+
+        >>> sketch = DDSketch()
+        >>> for value in range(1, 1001):
+        ...     sketch.add(value)
+        >>> abs(sketch.quantile(0.5) - 500) <= 5, abs(sketch.quantile(0.99) - 990) <= 10
+        (True, True)
+        >>> other = DDSketch.from_dict(DDSketch().to_dict())
+        >>> other.add(0)
+        >>> other.merge(sketch)
+        >>> other.count, other.quantile(0)
+        (1001, 0.0)
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + weight
+        self.count += weight
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches of accuracy %s and %s' %
+                             (self.relative_accuracy, other.relative_accuracy))
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self):
+        # JSON keys are strings
+        return dict(accuracy=self.relative_accuracy, zero=self.zero_count,
+                    bins=dict((str(key), count) for key, count in self.bins.items()))
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['accuracy'])
+        sketch.zero_count = data['zero']
+        sketch.bins = dict((int(key), count) for key, count in data['bins'].items())
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
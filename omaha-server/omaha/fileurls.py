@@ -0,0 +1,114 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+URLs of stored builds.
+
+The codebase and package name of a build only change with its file, so
+they are resolved once when a Version is saved. Presigned links are
+cached until OMAHA_PRESIGNED_URL_REFRESH of their lifetime has passed,
+so a cached link is always valid for a while after it is handed out.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from furl import furl
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from omaha.settings import PRESIGNED_URL_EXPIRES, PRESIGNED_URL_REFRESH, PRESIGNED_URL_CACHE_SIZE
+
+
+__all__ = ['get_absolute_url', 'get_file_location', 'presigned_urls']
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_absolute_url(file):
+    url = furl(file.url)
+    if not url.scheme:
+        url = '%s%s' % (settings.OMAHA_URL_PREFIX, url)
+    return str(url)
+
+
+def get_file_location(file):
+    """
+    Return the codebase and the package name of a stored file.
+
+        >>> from django.core.files.storage import FileSystemStorage
+        >>> from django.db.models.fields.files import FieldFile
+        >>> storage = FileSystemStorage(base_url='http://example.com/media/')
+        >>> get_file_location(FieldFile(None, type('Field', (), dict(storage=storage)), 'build/chrome/setup.exe'))
+        ('http://example.com/media/build/chrome/', 'setup.exe')
+    """
+    url = furl(get_absolute_url(file))
+    if url.port and url.port != 80:
+        codebase = '%s://%s:%d%s/' % (url.scheme, url.host, url.port, os.path.dirname(url.pathstr))
+    else:
+        codebase = '%s://%s%s/' % (url.scheme, url.host, os.path.dirname(url.pathstr))
+    return codebase, os.path.basename(url.pathstr)
+
+
+def presign(file, expires_in):
+    storage = file.storage
+    if isinstance(storage, S3Boto3Storage):
+        return storage.url(file.name, expire=expires_in)
+    return storage.url(file.name)
+
+
+class PresignedUrls(object):
+    """
+    LRU of presigned links, each reissued once refresh of its lifetime
+    has passed.
+    """
+
+    def __init__(self, expires_in=PRESIGNED_URL_EXPIRES, refresh=PRESIGNED_URL_REFRESH,
+                 max_size=PRESIGNED_URL_CACHE_SIZE):
+        self.expires_in = expires_in
+        self.refresh = refresh
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._urls = OrderedDict()
+
+    def get(self, file):
+        key = (file.storage, file.name)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._urls.get(key)
+            if cached is not None and cached[0] > now:
+                self._urls.move_to_end(key)
+                return cached[1]
+        url = presign(file, self.expires_in)
+        with self._lock:
+            self._urls[key] = (now + self.expires_in * self.refresh, url)
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.max_size:
+                self._urls.popitem(last=False)
+        return url
+
+    def clear(self):
+        with self._lock:
+            self._urls = OrderedDict()
+
+
+presigned_urls = PresignedUrls()
@@ -33,6 +33,9 @@ import logging
 __all__ = ['ApplicationAdminForm', 'VersionAdminForm', 'ActionAdminForm', 'DataAdminForm']
 
 
+logger = logging.getLogger(__name__)
+
+
 class ApplicationAdminForm(ModelForm):
     def clean_id(self):
         return self.cleaned_data["id"].upper()
@@ -0,0 +1,128 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+"""
+
+import threading
+from functools import reduce
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from lxml import etree
+
+from omaha.models import Version
+from omaha.core import (Manifest, Updatecheck_positive, Packages, Package, Actions, Action)
+from omaha.fileurls import get_file_location
+from omaha.mirrors import get_codebases
+
+
+__all__ = ['UpdatecheckFragments', 'updatecheck_fragments', 'build_updatecheck', 'on_action']
+
+
+def on_action(action_list, action):
+    action = Action(
+        event=action.get_event_display(),
+        **action.get_attributes()
+    )
+    action_list.append(action)
+    return action_list
+
+
+def get_patch_attrs(patch):
+    if patch is None:
+        return dict(diff_urls=[])
+    codebase, name = get_file_location(patch.file)
+    return dict(diff_urls=[codebase], namediff=name, sizediff=str(patch.file_size),
+                hashdiff_sha256=patch.file_hash_sha256)
+
+
+def build_updatecheck(version, mirrors=(), patch=None):
+    actions = reduce(on_action, version.actions.all(), [])
+    diff = get_patch_attrs(patch)
+    return Updatecheck_positive(
+        urls=get_codebases(version, mirrors),
+        diff_urls=diff.pop('diff_urls'),
+        manifest=Manifest(
+            version=str(version.version),
+            packages=Packages([Package(
+                name=version.file_package_name,
+                required='true',
+                size=str(version.file_size),
+                hash=version.file_hash,
+                hash_sha256=version.file_hash_sha256,
+                fp=version.file_fingerprint,
+                **diff
+            )]),
+            actions=Actions(actions) if actions else None,
+        )
+    )
+
+
+def get_stamp(version):
+    """
+    Everything the serialized <updatecheck> depends on.
+
+    Actions come from the prefetch cache when the version was loaded by
+    the release catalog, so computing the stamp does not hit the database.
+    """
+    actions = tuple((action.pk, action.modified) for action in version.actions.all())
+    return (version.modified, version.file.name, actions)
+
+
+class UpdatecheckFragments(object):
+    """
+    Serialized UTF-8 <updatecheck status="ok"> subtrees keyed by Version
+    and by the order of the mirrors in its codebases.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fragments = {}
+
+    def get(self, version, mirrors=(), patch=None):
+        stamp = get_stamp(version)
+        key = (mirrors, (patch.pk, patch.modified) if patch is not None else None)
+        fragments = self._fragments.get(version.pk)
+        if fragments is not None and fragments[0] == stamp:
+            fragment = fragments[1].get(key)
+            if fragment is not None:
+                return fragment
+        else:
+            fragments = (stamp, {})
+        fragment = etree.tostring(build_updatecheck(version, mirrors, patch), encoding='UTF-8')
+        with self._lock:
+            fragments[1][key] = fragment
+            self._fragments[version.pk] = fragments
+        return fragment
+
+    def invalidate(self, pk):
+        with self._lock:
+            self._fragments.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._fragments = {}
+
+
+updatecheck_fragments = UpdatecheckFragments()
+
+
+@receiver(post_delete, sender=Version)
+def on_version_delete(sender, instance, **kwargs):
+    updatecheck_fragments.invalidate(instance.pk)
@@ -0,0 +1,113 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+"""
+
+import hashlib
+import math
+
+
+__all__ = ['HyperLogLog']
+
+
+class HyperLogLog(object):
+    """
+    Distinct count estimate in 2 ** precision one-byte registers.
+
+    The default precision is the one of Redis' PFADD/PFCOUNT: 16 KB per
+    sketch and a standard error of 0.81%.
+
+        >>> hll = HyperLogLog()
+        >>> hll.update('user%d' % i for i in range(1000))
+        >>> hll.add('user1')
+        >>> hll.count()
+        1000
+        >>> other = HyperLogLog()
+        >>> other.update('user%d' % i for i in range(500, 1500))
+        >>> abs(HyperLogLog.union([hll, other]).count() - 1500) < 15
+        True
+    """
+
+    def __init__(self, precision=14, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    @staticmethod
+    def hash(value):
+        return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def add(self, value):
+        hash = self.hash(value)
+        index = hash & (self.size - 1)
+        rank = 64 - self.precision - (hash >> self.precision).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of precision %d and %d' % (self.precision, other.precision))
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    @classmethod
+    def union(cls, sketches, precision=14):
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def count(self):
+        # Ertl's improved estimator, as in Redis: no bias in the range
+        # where the raw estimate hands over to linear counting.
+        registers = bytes(self.registers)
+        size = self.size
+        q = 64 - self.precision
+        counts = [registers.count(rank) for rank in range(q + 2)]
+        z = size * tau(1 - counts[q + 1] / size)
+        for rank in range(q, 0, -1):
+            z = 0.5 * (z + counts[rank])
+        z += size * sigma(counts[0] / size)
+        return int(round(0.5 / math.log(2) * size * size / z))
+
+
+def sigma(x):
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
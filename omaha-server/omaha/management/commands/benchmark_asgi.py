@@ -0,0 +1,154 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from django.urls import path
+
+from omaha import views
+
+
+REQUEST = b'''<?xml version="1.0" encoding="UTF-8"?>
+<request protocol="3.0" version="1.3.23.0" ismachine="0" userid="{D0BBD725-742D-44ae-8D46-0231E881D58E}">
+    <os platform="win" version="6.1" sp="" arch="x64"/>
+    <app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" version="1.0.0.0" nextversion="" lang="en">
+        <updatecheck/>
+        <ping r="1"/>
+    </app>
+</request>'''
+
+
+class SyncUrls:
+    urlpatterns = [path('service/update2/', views.UpdateView.as_view(), name='update')]
+
+
+class AsyncUrls:
+    urlpatterns = [path('service/update2/', views.AsyncUpdateView.as_view(), name='update')]
+
+
+class SlowInput:
+    """
+    wsgi.input of a client sending the body in chunks, `delay` seconds
+    apart. Like the input of a WSGI server, read blocks until size bytes
+    or the whole body arrived.
+    """
+
+    def __init__(self, chunks, delay):
+        self.chunks = list(chunks)
+        self.delay = delay
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while self.chunks and (size is None or size < 0 or len(self.buffer) < size):
+            time.sleep(self.delay)
+            self.buffer += self.chunks.pop(0)
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+class Command(BaseCommand):
+    help = ("Compare update checks from slow clients served by the sync view "
+            "under WSGI with a thread pool, and by the async view under ASGI. "
+            "Requests go through the configured middleware.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--body', help="File with the update request to send.")
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8,
+                            help="WSGI worker threads, as with gunicorn --threads.")
+        parser.add_argument('--chunks', type=int, default=4)
+        parser.add_argument('--delay', type=float, default=0.05,
+                            help="Seconds between the body chunks of a client.")
+
+    def handle(self, *args, **options):
+        body = REQUEST
+        if options['body']:
+            with open(options['body'], 'rb') as f:
+                body = f.read()
+        size = -(-len(body) // options['chunks'])
+        self.chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        self.body = body
+        self.options = options
+
+        with override_settings(ROOT_URLCONF=SyncUrls):
+            self.report('WSGI, sync view', *self.run_wsgi())
+        with override_settings(ROOT_URLCONF=AsyncUrls):
+            self.report('ASGI, async view', *asyncio.run(self.run_asgi()))
+
+    def run_wsgi(self):
+        application = get_wsgi_application()
+
+        def client(i):
+            environ = {
+                'REQUEST_METHOD': 'POST', 'PATH_INFO': '/service/update2/', 'QUERY_STRING': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'REMOTE_ADDR': '127.0.0.1',
+                'CONTENT_TYPE': 'text/xml', 'CONTENT_LENGTH': str(len(self.body)),
+                'wsgi.input': SlowInput(self.chunks, self.options['delay']),
+                'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+            }
+            statuses = []
+            response = application(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            response.close()
+            return statuses[0], time.perf_counter()
+
+        # all clients connect at once, latencies include the wait for a thread
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.options['threads']) as executor:
+            results = list(executor.map(client, range(self.options['clients'])))
+        return results, start
+
+    async def run_asgi(self):
+        application = get_asgi_application()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'POST', 'scheme': 'http', 'path': '/service/update2/', 'raw_path': b'/service/update2/',
+            'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            'headers': [(b'content-type', b'text/xml'), (b'content-length', str(len(self.body)).encode())],
+        }
+
+        async def client(i):
+            chunks = list(self.chunks)
+            statuses = []
+            done = asyncio.Event()
+
+            async def receive():
+                if not chunks:
+                    # the handler listens for a disconnect once the body is read
+                    await done.wait()
+                    return {'type': 'http.disconnect'}
+                await asyncio.sleep(self.options['delay'])
+                chunk = chunks.pop(0)
+                return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append('%d' % message['status'])
+                elif not message.get('more_body'):
+                    done.set()
+
+            await application(dict(scope), receive, send)
+            return statuses[0], time.perf_counter()
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[client(i) for i in range(self.options['clients'])])
+        return results, start
+
+    def report(self, name, results, start):
+        failed = [status for status, finished in results if not status.startswith('200')]
+        if failed:
+            raise CommandError(f"{name}: {len(failed)} requests failed, e.g. {failed[0]}")
+        latencies = sorted(finished - start for status, finished in results)
+        elapsed = latencies[-1]
+        p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+        self.stdout.write(f"{name}: {len(results)} requests in {elapsed:.2f}s, "
+                          f"{len(results) / elapsed:.0f} req/s, p50 {p50 * 1e3:.0f} ms, p99 {p99 * 1e3:.0f} ms")
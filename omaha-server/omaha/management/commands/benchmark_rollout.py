@@ -0,0 +1,47 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from omaha import rollout
+
+
+class Command(BaseCommand):
+    help = ("Check the shares and monotonicity of omaha.rollout over random "
+            "userids and compare its cost with the former UUID modulo check.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--salt', default='{430FD4D0-B729-4F61-AA34-91526481799D}:13.0.782.112')
+
+    def handle(self, *args, **options):
+        users = ['{%s}' % str(uuid.uuid4()).upper() for i in range(options['users'])]
+        salt = options['salt']
+
+        for percent in (1, 5, 33.3, 50):
+            share = sum(rollout.is_in_rollout(userid, salt, percent) for userid in users) * 100 / len(users)
+            self.stdout.write(f"{percent}%: {share:.2f}% of users")
+
+        previous = set()
+        for percent in range(0, 101, 5):
+            current = set(userid for userid in users if rollout.is_in_rollout(userid, salt, percent))
+            if not previous <= current:
+                raise CommandError(f"Users left the rollout when it was widened to {percent}%")
+            previous = current
+        self.stdout.write("Widening from 0 to 100% only adds users")
+
+        # UUID(userid).int % int(100 / percent) == 0 was the former check
+        self.timeit('UUID modulo', lambda userid: uuid.UUID(userid).int % int(100 / 33) == 0, users)
+        rollout.get_bucket.cache_clear()
+        self.timeit('bucket, uncached', lambda userid: rollout.get_bucket.__wrapped__(userid, salt) < 3300, users)
+        cached = users[:rollout.get_bucket.cache_info().maxsize or len(users)]
+        for userid in cached:
+            rollout.is_in_rollout(userid, salt, 33)
+        self.timeit('bucket, cached', lambda userid: rollout.is_in_rollout(userid, salt, 33), cached)
+
+    def timeit(self, name, check, users):
+        start = time.perf_counter()
+        for userid in users:
+            check(userid)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name}: {elapsed * 1e6 / len(users):.2f} us per check")
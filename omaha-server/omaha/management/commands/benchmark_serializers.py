@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from omaha import core, stringcore
+
+
+APP_ID = '{430FD4D0-B729-4F61-AA34-91526481799D}'
+
+
+class Command(BaseCommand):
+    help = ("Compare the time omaha.core (lxml) and omaha.stringcore (templates) "
+            "take to build and serialize responses of a given number of apps.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apps', type=int, nargs='+', default=[1, 5, 20])
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for count in options['apps']:
+            for name, serializer, pretty_print in (('lxml pretty', core, True),
+                                                   ('lxml compact', core, False),
+                                                   ('template', stringcore, False)):
+                start = time.perf_counter()
+                for i in range(options['repeat']):
+                    body = serializer.tostring(self.build(serializer, count), pretty_print=pretty_print)
+                elapsed = (time.perf_counter() - start) / options['repeat']
+                self.stdout.write(f"{count} apps, {name}: {elapsed * 1e6:.1f} us, {len(body)} bytes")
+
+    def build(self, s, count):
+        apps = []
+        for i in range(count):
+            if i % 2:
+                updatecheck = s.Updatecheck_negative()
+            else:
+                package = s.Package('chrome_installer.exe', required='true', size='23963192',
+                                    hash='VXriGUVI0TNqfLlU02vBel4Q3Zo=', hash_sha256='ab' * 32)
+                actions = s.Actions([s.Action('install', run='chrome_installer.exe',
+                                              arguments='--do-not-launch-chrome')])
+                updatecheck = s.Updatecheck_positive(
+                    urls=['http://cache.pack.google.com/edgedl/chrome/install/782.112/'],
+                    manifest=s.Manifest('13.0.782.112', packages=s.Packages([package]), actions=actions))
+            apps.append(s.App(APP_ID, updatecheck=updatecheck, ping=True,
+                              data_list=[s.Data('install', index='verboselogging', text='{}')]))
+        return s.Response(apps)
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from kombu.utils.json import dumps, loads
+
+from common.models import RequestLog
+from omaha import codec
+from omaha.parser import parse_request, parse_root
+from omaha.statistics import get_request_record
+
+
+class Command(BaseCommand):
+    help = ("Compare the broker size and worker cost of statistics batches "
+            "sent as raw XML and as omaha.codec records, using logged update "
+            "requests.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000,
+                            help="Number of recent update requests to sample.")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        logs = (RequestLog.objects.filter(method='POST', path=reverse('update'))
+                .order_by('-pk')[:options['count']])
+        bodies = [log.body.encode('utf-8') for log in logs if log.body]
+        if not bodies:
+            raise CommandError("No logged update requests to sample.")
+        batch_size = options['batch_size']
+        batches = [bodies[i:i + batch_size] for i in range(0, len(bodies), batch_size)]
+        created = timezone.now()
+        self.stdout.write(f"{len(bodies)} requests in {len(batches)} batches")
+
+        # Raw XML: the worker parses and validates every body
+        start = time.perf_counter()
+        messages = [dumps([[(body, '127.0.0.1', created) for body in batch]]) for batch in batches]
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for message in messages:
+            for body, ip, date in loads(message)[0]:
+                get_request_record(parse_request(body), ip=ip, created=date)
+        self.report('raw XML', messages, encode_time, time.perf_counter() - start)
+
+        # Packed records: the web tier reuses the tree parsed for the response
+        roots = [[parse_root(body) for body in batch] for batch in batches]
+        start = time.perf_counter()
+        messages = [dumps([codec.dumps([get_request_record(root, ip='127.0.0.1', created=created)
+                                        for root in batch])]) for batch in roots]
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for message in messages:
+            codec.loads(loads(message)[0])
+        self.report(f'codec v{codec.SCHEMA_VERSION}', messages, encode_time, time.perf_counter() - start)
+
+    def report(self, name, messages, encode_time, decode_time):
+        size = sum(len(message) for message in messages)
+        self.stdout.write(
+            f"{name}: {size} broker bytes, web tier {encode_time * 1e3:.1f} ms, "
+            f"worker {decode_time * 1e3:.1f} ms")
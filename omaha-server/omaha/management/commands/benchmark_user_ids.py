@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from redis.exceptions import WatchError
+
+from omaha.utils import redis, allocate_ids
+
+
+class Command(BaseCommand):
+    help = ("Allocate user ids from concurrent threads with the former "
+            "WATCH/MULTI loop, the allocation script and batched allocation, "
+            "and check that ids come out unique and dense. Keys live under "
+            "their own prefix and are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--users', type=int, default=2000,
+                            help="New users per thread.")
+        parser.add_argument('--shared', type=float, default=0.1,
+                            help="Fraction of the users every thread allocates, "
+                                 "as when several processes see the same new user.")
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        shared_count = int(options['users'] * options['shared'])
+        if not 0 <= shared_count <= options['users']:
+            raise CommandError("--shared must be between 0 and 1.")
+        for name in ('watch', 'script', 'batch'):
+            prefix = f'benchmark:{uuid.uuid4().hex}'
+            shared = [f'{prefix}:{uuid.uuid4()}' for _ in range(shared_count)]
+            keys = [shared + [f'{prefix}:{uuid.uuid4()}' for _ in range(options['users'] - shared_count)]
+                    for _ in range(options['threads'])]
+            try:
+                self.run(name, keys, f'{prefix}:last_id', options['batch_size'])
+            finally:
+                for batch in self.chunks(list(redis.scan_iter(f'{prefix}:*')), 1000):
+                    redis.delete(*batch)
+
+    def run(self, name, keys, last_id_key, batch_size):
+        results, retries = [], []
+
+        def watch_worker(keys):
+            ids, count = [], 0
+            for key in keys:
+                id = redis.get(key)
+                while id is None:
+                    with redis.pipeline() as pipe:
+                        try:
+                            pipe.watch(last_id_key)
+                            next_id = int(pipe.get(last_id_key) or 0) + 1
+                            pipe.multi()
+                            pipe.set(last_id_key, next_id)
+                            pipe.execute()
+                            redis.set(key, next_id)
+                            id = next_id
+                        except WatchError:
+                            count += 1
+                ids.append(int(id))
+            results.append(dict(zip(keys, ids)))
+            retries.append(count)
+
+        def script_worker(keys):
+            ids = [allocate_ids([key], last_id_key)[0] for key in keys]
+            results.append(dict(zip(keys, ids)))
+
+        def batch_worker(keys):
+            ids = []
+            for batch in self.chunks(keys, batch_size):
+                ids.extend(allocate_ids(batch, last_id_key))
+            results.append(dict(zip(keys, ids)))
+
+        worker = dict(watch=watch_worker, script=script_worker, batch=batch_worker)[name]
+        threads = [threading.Thread(target=worker, args=(thread_keys,)) for thread_keys in keys]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        requested = sum(len(thread_keys) for thread_keys in keys)
+        distinct = set(key for thread_keys in keys for key in thread_keys)
+        ids = {}
+        conflicts = 0
+        for result in results:
+            for key, id in result.items():
+                conflicts += ids.setdefault(key, id) != id
+        allocated = set(ids.values())
+        dense = allocated == set(range(1, len(distinct) + 1))
+        line = (f"{name}: {requested / elapsed:.0f} ids/s, {len(allocated)} ids for "
+                f"{len(distinct)} users, dense={dense}, conflicts={conflicts}")
+        if retries:
+            line += f", WATCH retries={sum(retries)}"
+        self.stdout.write(line)
+
+    @staticmethod
+    def chunks(items, size):
+        return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from omaha.fileurls import get_absolute_url, get_file_location, presign, PresignedUrls
+from omaha.models import Version
+from omaha.settings import PRESIGNED_URL_EXPIRES
+
+
+class Command(BaseCommand):
+    help = ("Time build URL resolution and presigning per access against "
+            "the stored locations and the presigned link cache. Point the "
+            "storage at a local S3 stand-in (moto server, MinIO) through "
+            "AWS_S3_ENDPOINT_URL to measure it offline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100,
+                            help="Number of versions with a file to sample.")
+        parser.add_argument('--iterations', type=int, default=100)
+
+    def handle(self, *args, **options):
+        versions = list(Version.objects.exclude(file='').exclude(file__isnull=True)[:options['count']])
+        if not versions:
+            raise CommandError("No versions with a file to sample.")
+        cache = PresignedUrls()
+
+        def resolve(version):
+            # what the properties did on every access
+            get_absolute_url(version.file)
+            get_file_location(version.file)
+
+        def stored(version):
+            version.file_url, version.file_package_name
+
+        for name, func in (
+            ('codebase resolved per access', resolve),
+            ('codebase stored on save', stored),
+            ('presigned per call', lambda version: presign(version.file, PRESIGNED_URL_EXPIRES)),
+            ('presigned cached', lambda version: cache.get(version.file)),
+        ):
+            start = time.perf_counter()
+            for _ in range(options['iterations']):
+                for version in versions:
+                    func(version)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name}: {elapsed / options['iterations'] / len(versions) * 1e6:.1f} us per version")
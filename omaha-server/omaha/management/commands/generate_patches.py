@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from omaha.models import Version
+from omaha.patches import generate_patches
+from omaha.settings import PATCH_BASES
+
+
+class Command(BaseCommand):
+    help = ("Diff the files of versions against their most requested previous "
+            "versions, e.g. for versions published before patches were enabled.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('version_ids', nargs='+', type=int, help="Version ids.")
+        parser.add_argument('--bases', type=int, default=PATCH_BASES,
+                            help="Previous versions to diff against.")
+
+    def handle(self, *args, **options):
+        for pk in options['version_ids']:
+            version = Version.objects.filter(pk=pk).first()
+            if version is None:
+                raise CommandError(f"Version {pk} does not exist")
+            for patch in generate_patches(version, count=options['bases']):
+                self.stdout.write(f"{patch}: {patch.get_status_display()}, {patch.file_size or 0} bytes")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from omaha.rollups import refresh_rollups
+from omaha.settings import ROLLUP_CHUNK_SIZE, ROLLUP_SAFETY_LAG
+
+
+class Command(BaseCommand):
+    help = ("Fold the update statistics recorded since the last run into the "
+            "daily rollups read by the reports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=ROLLUP_CHUNK_SIZE,
+                            help="App requests folded per transaction.")
+        parser.add_argument('--lag', type=float, default=ROLLUP_SAFETY_LAG,
+                            help="Only fold app requests recorded this many seconds before, "
+                                 "0 folds everything committed.")
+
+    def handle(self, *args, **options):
+        count = refresh_rollups(chunk_size=options['chunk_size'], lag=options['lag'])
+        self.stdout.write(f"Rolled up {count} app requests")
@@ -3,6 +3,21 @@
 from django.db import migrations
 
 
+def alter_column(schema_editor, column_type):
+    # other backends, e.g. SQLite for the tests, have 64-bit integers already
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'ALTER TABLE versions ALTER COLUMN version TYPE {column_type};')
+
+
+def forwards(apps, schema_editor):
+    alter_column(schema_editor, 'BIGINT')
+
+
+def backwards(apps, schema_editor):
+    alter_column(schema_editor, 'INTEGER')
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -10,8 +25,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(
-            sql='ALTER TABLE versions ALTER COLUMN version TYPE BIGINT;',
-            reverse_sql='ALTER TABLE versions ALTER COLUMN version TYPE INTEGER;',
-        ),
+        migrations.RunPython(forwards, backwards),
     ]
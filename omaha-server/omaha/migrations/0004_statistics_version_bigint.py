@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# VersionField columns are created as 32-bit integers, too small for the
+# packed (8, 8, 16, 16) values, see 0003 for the versions table.
+COLUMNS = (
+    ('omaha_request', 'version'),
+    ('omaha_apprequest', 'version'),
+    ('omaha_apprequest', 'nextversion'),
+)
+
+
+def alter_columns(schema_editor, column_type):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in COLUMNS:
+        schema_editor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE {column_type}')
+
+
+def forwards(apps, schema_editor):
+    alter_columns(schema_editor, 'BIGINT')
+
+
+def backwards(apps, schema_editor):
+    alter_columns(schema_editor, 'INTEGER')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0003_alter_version_field'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
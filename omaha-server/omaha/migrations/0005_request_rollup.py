@@ -0,0 +1,58 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:51
+
+import versionfield.fields
+from django.db import migrations, models
+
+
+# Same widening as 0004 for the packed version values
+def alter_version_column(schema_editor, column_type):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'ALTER TABLE omaha_requestrollup ALTER COLUMN version TYPE {column_type}')
+
+
+def forwards(apps, schema_editor):
+    alter_version_column(schema_editor, 'BIGINT')
+
+
+def backwards(apps, schema_editor):
+    alter_version_column(schema_editor, 'INTEGER')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0004_statistics_version_bigint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=40, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('appid', models.CharField(max_length=38)),
+                ('version', versionfield.fields.VersionField(default=0, help_text='Format: 255.255.65535.65535')),
+                ('channel', models.CharField(blank=True, default='', max_length=40)),
+                ('platform', models.CharField(blank=True, default='', max_length=10)),
+                ('os_version', models.CharField(blank=True, default='', max_length=16)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('installs', models.PositiveIntegerField(default=0)),
+                ('updates', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['appid', 'day'], name='omaha_reque_appid_f0b1a7_idx')],
+                'unique_together': {('day', 'appid', 'version', 'channel', 'platform', 'os_version')},
+            },
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
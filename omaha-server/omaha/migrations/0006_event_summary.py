@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:53
+
+import jsonfield.fields
+import versionfield.fields
+from django.db import migrations, models
+
+
+# Same widening as 0004 for the packed version values
+def alter_version_column(schema_editor, column_type):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'ALTER TABLE omaha_eventsummary ALTER COLUMN version TYPE {column_type}')
+
+
+def forwards(apps, schema_editor):
+    alter_version_column(schema_editor, 'BIGINT')
+
+
+def backwards(apps, schema_editor):
+    alter_version_column(schema_editor, 'INTEGER')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0005_request_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('appid', models.CharField(max_length=38)),
+                ('version', versionfield.fields.VersionField(default=0, help_text='Format: 255.255.65535.65535')),
+                ('eventtype', models.PositiveSmallIntegerField()),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('sketches', jsonfield.fields.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['appid', 'day'], name='omaha_event_appid_1d1f48_idx')],
+                'unique_together': {('day', 'appid', 'version', 'eventtype')},
+            },
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:55
+
+import django.db.models.deletion
+import django_extensions.db.fields
+from django.db import migrations, models
+
+
+def create_storage_mirror(apps, schema_editor):
+    Mirror = apps.get_model('omaha', 'Mirror')
+    Mirror.objects.get_or_create(name='storage', defaults=dict(url=''))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0006_event_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Mirror',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('name', models.CharField(max_length=40, unique=True)),
+                ('url', models.URLField(blank=True, help_text='Base URL serving the same paths as the build storage. Leave blank for the build storage itself.')),
+                ('priority', models.PositiveSmallIntegerField(default=0, help_text='Order of mirrors without enough download reports, lowest first')),
+                ('is_enabled', models.BooleanField(default=True)),
+            ],
+            options={
+                'db_table': 'mirrors',
+                'ordering': ['priority', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MirrorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('region', models.CharField(blank=True, default='', max_length=16)),
+                ('downloads', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('time_ms', models.BigIntegerField(default=0)),
+                ('mirror', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='omaha.mirror')),
+            ],
+            options={
+                'unique_together': {('day', 'region', 'mirror')},
+            },
+        ),
+        migrations.RunPython(create_storage_mirror, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:57
+
+from django.db import migrations, models
+
+
+def resolve_locations(apps, schema_editor):
+    from omaha.fileurls import get_file_location
+    Version = apps.get_model('omaha', 'Version')
+    for version in Version.objects.exclude(file='').exclude(file__isnull=True).iterator():
+        try:
+            codebase, package = get_file_location(version.file)
+        except Exception:
+            # left to the first save, the properties resolve it meanwhile
+            continue
+        Version.objects.filter(pk=version.pk).update(file_codebase=codebase, file_package=package)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0007_mirrors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='file_codebase',
+            field=models.CharField(blank=True, editable=False, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='file_package',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(resolve_locations, migrations.RunPython.noop),
+    ]
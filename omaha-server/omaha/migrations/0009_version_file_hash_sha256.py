@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0008_version_file_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='file_hash_sha256',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-17 12:06
+
+import django.db.models.deletion
+import django_extensions.db.fields
+import omaha.models
+import storages.backends.s3
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0009_version_file_hash_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Patch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('file', models.FileField(blank=True, null=True, storage=storages.backends.s3.S3Storage(), upload_to=omaha.models._patch_upload_to)),
+                ('file_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('file_hash_sha256', models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('skipped', 'Skipped'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='omaha.version')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patches', to='omaha.version')),
+            ],
+            options={
+                'db_table': 'patches',
+                'unique_together': {('version', 'base')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-17 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omaha', '0010_patch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupmark',
+            name='pending_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rollupmark',
+            name='pending_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
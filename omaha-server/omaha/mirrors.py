@@ -0,0 +1,324 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+Download mirrors ordered by the throughput clients report.
+
+Clients try the codebases of an <updatecheck> in order and report the
+index of the one they used in the source_url_index of their download
+events, usually in a later request. The order served with an update is
+kept per userid and appid for OMAHA_MIRROR_ORDER_TTL seconds in the
+OMAHA_MIRROR_ORDER_CACHE cache, and statistics workers resolve the index
+through it before adding the bytes, time and failures to MirrorStats.
+The order per region ranks mirrors by measured throughput over the last
+days, falling back to the figures of all regions, and to
+Mirror.priority for mirrors without enough reports. Orders are cached
+for OMAHA_MIRROR_RANKING_TTL seconds, and an expired one keeps being
+served while a single thread computes its successor.
+"""
+
+import atexit
+import datetime
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+from django.core.cache import caches
+from django.db.models import Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from furl import furl
+
+from common.logwriter import BufferedWriter
+from omaha.catalog import get_day
+from omaha.models import Mirror, MirrorStats, is_error_event
+from omaha.rollout import normalize_userid
+from omaha.settings import (
+    MIRROR_ORDER_TTL,
+    MIRROR_ORDER_CACHE,
+    MIRROR_RANKING_TTL,
+    MIRROR_RANKING_DAYS,
+    MIRROR_MIN_SAMPLES,
+    MIRROR_REGION_RESOLVER,
+)
+
+
+__all__ = ['get_country', 'get_region', 'mirror_ranking', 'served_orders', 'get_codebases', 'add_records']
+
+
+logger = logging.getLogger(__name__)
+
+geoip = None
+geoip_lock = threading.Lock()
+
+
+def get_geoip():
+    global geoip
+    if geoip is None:
+        with geoip_lock:
+            if geoip is None:
+                try:
+                    from django.contrib.gis.geoip2 import GeoIP2
+                    geoip = GeoIP2()
+                except Exception as e:
+                    logger.info('Mirror rankings are global, GeoIP2 is unavailable: %s', e)
+                    geoip = False
+    return geoip
+
+
+def get_country(ip):
+    """
+    Country code of ip from the GeoIP2 database of GEOIP_PATH; '' when
+    the database or the address is unknown, which selects the global
+    ranking.
+    """
+    geoip = get_geoip()
+    if not geoip or not ip:
+        return ''
+    try:
+        return geoip.country_code(ip) or ''
+    except Exception:
+        return ''
+
+
+@lru_cache(maxsize=65536)
+def get_region(ip):
+    return import_string(MIRROR_REGION_RESOLVER)(ip)
+
+
+def get_score(stats):
+    """
+    Bytes per millisecond actually delivered: throughput scaled down by
+    the share of failed downloads.
+
+        >>> get_score(dict(downloads=90, failures=10, bytes=9000, time_ms=90))
+        90.0
+    """
+    attempts = stats['downloads'] + stats['failures']
+    throughput = stats['bytes'] / stats['time_ms'] if stats['time_ms'] else 0
+    return throughput * stats['downloads'] / attempts if attempts else 0
+
+
+class MirrorRanking(object):
+    """
+    Ordered (pk, url) pairs of the enabled mirrors, per region.
+    """
+
+    def __init__(self, ttl=MIRROR_RANKING_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._orders = {}
+
+    def get(self, region):
+        cached = self._orders.get(region)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        if not self._lock.acquire(blocking=cached is None):
+            # another thread is computing, the expired order serves meanwhile
+            return cached[1]
+        try:
+            cached = self._orders.get(region)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+            order = self.compute(region)
+            self._orders[region] = (time.monotonic() + self.ttl, order)
+            return order
+        finally:
+            self._lock.release()
+
+    def get_stats(self, since, region=None):
+        stats = MirrorStats.objects.filter(day__gte=since)
+        if region is not None:
+            stats = stats.filter(region=region)
+        rows = stats.values('mirror').annotate(downloads=Sum('downloads'), failures=Sum('failures'),
+                                               bytes=Sum('bytes'), time_ms=Sum('time_ms'))
+        return dict((row['mirror'], row) for row in rows
+                    if row['downloads'] + row['failures'] >= MIRROR_MIN_SAMPLES)
+
+    def compute(self, region):
+        mirrors = list(Mirror.objects.filter(is_enabled=True).values_list('pk', 'url'))
+        if len(mirrors) < 2:
+            return tuple(mirrors)
+        since = get_day(timezone.now()) - datetime.timedelta(days=MIRROR_RANKING_DAYS)
+        scores = dict((pk, get_score(stats)) for pk, stats in self.get_stats(since).items())
+        if region:
+            scores.update((pk, get_score(stats)) for pk, stats in self.get_stats(since, region).items())
+        # measured mirrors first, fastest first; the others keep Mirror.ordering
+        return tuple(sorted(mirrors, key=lambda mirror: (mirror[0] not in scores, -scores.get(mirror[0], 0))))
+
+    def clear(self):
+        with self._lock:
+            self._orders = {}
+
+
+mirror_ranking = MirrorRanking()
+
+
+@receiver(post_save, sender=Mirror)
+@receiver(post_delete, sender=Mirror)
+def on_mirror_change(sender, **kwargs):
+    mirror_ranking.clear()
+
+
+class ServedOrders(BufferedWriter):
+    """
+    Mirror pks in the order served to a userid for an appid. Entries are
+    (userid, appids, order) tuples, written with one set_many per batch.
+    """
+    thread_name = 'mirror-order-writer'
+
+    def __init__(self, cache=MIRROR_ORDER_CACHE, ttl=MIRROR_ORDER_TTL, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.ttl = ttl
+
+    @staticmethod
+    def get_key(userid, appid):
+        return 'mirrors:served:%s:%s' % (normalize_userid(userid), appid.upper())
+
+    def write(self, batch):
+        orders = {}
+        for userid, appids, order in batch:
+            for appid in appids:
+                orders[self.get_key(userid, appid)] = tuple(pk for pk, url in order)
+        try:
+            caches[self.cache].set_many(orders, self.ttl)
+        except Exception as e:
+            logger.error('Error saving %d served mirror orders: %s', len(orders), e)
+
+    def get_many(self, keys):
+        """
+        Served orders of (userid, appid) keys; unknown keys are left out.
+        """
+        names = dict((self.get_key(userid, appid), (userid, appid)) for userid, appid in keys)
+        if not names:
+            return {}
+        try:
+            found = caches[self.cache].get_many(list(names))
+        except Exception as e:
+            logger.error('Error loading %d served mirror orders: %s', len(names), e)
+            return {}
+        return dict((names[name], order) for name, order in found.items())
+
+
+served_orders = ServedOrders()
+atexit.register(served_orders.flush)
+
+
+def get_codebases(version, order):
+    """
+    Codebases of version in the order of (pk, url) mirrors; a blank url
+    is the build storage itself.
+    """
+    if not order:
+        return [version.file_url]
+    path = os.path.dirname(furl(version.file_url).pathstr)
+    return [url.rstrip('/') + path + '/' if url else version.file_url for pk, url in order]
+
+
+def to_index(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_served_orders(records):
+    """
+    Orders served to the clients of records reporting a source_url_index,
+    by (userid, appid).
+    """
+    keys = set()
+    for record in records:
+        userid = record['request']['userid']
+        if not userid:
+            continue
+        for app in record['apps']:
+            appid = app['app']['appid']
+            if appid and any(to_index(event['source_url_index']) is not None for event in app['events']):
+                keys.add((userid, appid))
+    return served_orders.get_many(keys)
+
+
+def add_records(records):
+    """
+    Add the download reports of records built by omaha.statistics to
+    MirrorStats. Run inside the transaction inserting the records.
+
+    Indexes resolve through the order served to the client. Without one,
+    only a single enabled mirror leaves no doubt about the one used.
+    """
+    totals = {}
+    now = timezone.now()
+    orders = get_served_orders(records)
+    for record in records:
+        request = record['request']
+        region = None
+        for app in record['apps']:
+            order = None
+            for event in app['events']:
+                index = to_index(event['source_url_index'])
+                if index is None:
+                    continue
+                if region is None:
+                    region = get_region(request['ip'])
+                if order is None:
+                    order = orders.get((request['userid'], app['app']['appid']))
+                    if order is None:
+                        current = mirror_ranking.get(region)
+                        order = tuple(pk for pk, url in current) if len(current) == 1 else ()
+                if not 0 <= index < len(order):
+                    continue
+                key = (get_day(request.get('created') or now), region, order[index])
+                total = totals.get(key)
+                if total is None:
+                    total = totals[key] = dict(downloads=0, failures=0, bytes=0, time_ms=0)
+                if is_error_event(event['eventtype'], event['eventresult'], event['errorcode']):
+                    total['failures'] += 1
+                elif event['downloaded'] and event['download_time_ms']:
+                    total['downloads'] += 1
+                    total['bytes'] += event['downloaded']
+                    total['time_ms'] += event['download_time_ms']
+    if not totals:
+        return
+    # a mirror deleted since its order was served
+    existing = set(Mirror.objects.filter(pk__in=set(key[2] for key in totals)).values_list('pk', flat=True))
+    totals = dict((key, total) for key, total in totals.items() if key[2] in existing)
+    if not totals:
+        return
+    MirrorStats.objects.bulk_create(
+        [MirrorStats(day=day, region=region, mirror_id=mirror) for day, region, mirror in totals],
+        ignore_conflicts=True)
+    rows = (MirrorStats.objects.select_for_update()
+            .filter(day__in=set(key[0] for key in totals),
+                    region__in=set(key[1] for key in totals),
+                    mirror__in=set(key[2] for key in totals))
+            .order_by('pk'))
+    updated = []
+    for row in rows:
+        total = totals.get((row.day, row.region, row.mirror_id))
+        if total is None:
+            continue
+        for name, value in total.items():
+            setattr(row, name, getattr(row, name) + value)
+        updated.append(row)
+    MirrorStats.objects.bulk_update(updated, ['downloads', 'failures', 'bytes', 'time_ms'])
@@ -20,18 +20,20 @@ the License.
 
 
 import os
-import hashlib
-import base64
 import logging
 
-from django.db import models
-from django.conf import settings
+from celery import signature
+from django.db import models, transaction
 from django.dispatch import receiver
-from django.db.models.signals import pre_save, pre_delete
+from django.db.models.signals import pre_save, post_save, pre_delete
 from django.utils.timezone import now as datetime_now
 
 from omaha.managers import VersionManager
+from omaha.fileurls import get_absolute_url, get_file_location, presigned_urls
+from common.uploadhandlers import get_file_hashes
+from common.uploads import defer_upload, schedule_uploads, upload_done
 from omaha.fields import PercentField
+from omaha.settings import GENERATE_PATCHES
 # Comment out S3 import for later use
 # from omaha_server.s3utils import public_read_storage
 
@@ -46,16 +48,20 @@ from django_extensions.db.fields import (
 )
 from jsonfield import JSONField
 from versionfield import VersionField
-from furl import furl
 from storages.backends.s3boto3 import S3Boto3Storage
 
 
 __all__ = ['Application', 'Channel', 'Platform', 'Version',
            'Action', 'EVENT_DICT_CHOICES', 'EVENT_CHOICES',
            'Data', 'AppRequest', 'Request', 'PartialUpdate',
+           'RequestRollup', 'RollupMark', 'EventSummary', 'is_error_event',
+           'Mirror', 'MirrorStats', 'Patch',
            'BaseModel', 'version_upload_to', 'NAME_DATA_DICT_CHOICES']
 
 
+logger = logging.getLogger(__name__)
+
+
 class BaseModel(models.Model):
     created = CreationDateTimeField('created')
     modified = ModificationDateTimeField('modified')
@@ -124,7 +130,12 @@ class Version(BaseModel):
     )
     file_hash = models.CharField(verbose_name='Hash', max_length=140,
                                 null=True, blank=True)
+    file_hash_sha256 = models.CharField(verbose_name='SHA-256', max_length=64,
+                                        null=True, blank=True)
     file_size = models.PositiveIntegerField(null=True, blank=True)
+    # resolved from file when the version is saved, see on_version_save
+    file_codebase = models.CharField(max_length=1024, null=True, blank=True, editable=False)
+    file_package = models.CharField(max_length=255, null=True, blank=True, editable=False)
 
     objects = VersionManager()
 
@@ -143,23 +154,22 @@ class Version(BaseModel):
 
     @property
     def file_absolute_url(self):
-        url = furl(self.file.url)
-        if not url.scheme:
-            url = '%s%s' % (settings.OMAHA_URL_PREFIX, url)
-        return str(url)
+        if self.file_codebase and self.file_package:
+            return self.file_codebase + self.file_package
+        return get_absolute_url(self.file)
 
     @property
     def file_package_name(self):
-        url = furl(self.file_absolute_url)
-        return os.path.basename(url.pathstr)
+        return self.file_package or get_file_location(self.file)[1]
 
     @property
     def file_url(self):
-        url = furl(self.file_absolute_url)
-        if url.port and url.port != 80:
-            return '%s://%s:%d%s/' % (url.scheme, url.host, url.port, os.path.dirname(url.pathstr))
-        else:
-            return '%s://%s%s/' % (url.scheme, url.host, os.path.dirname(url.pathstr))
+        return self.file_codebase or get_file_location(self.file)[0]
+
+    @property
+    def file_fingerprint(self):
+        # the fp clients send back in <packages> for differential updates
+        return '1.' + self.file_hash_sha256 if self.file_hash_sha256 else None
 
     @property
     def size(self):
@@ -169,21 +179,47 @@ class Version(BaseModel):
         """Generate a temporary URL for file download"""
         if self.file:
             try:
-                s3_client = self.file.storage.connection
-                return s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={
-                        'Bucket': self.file.storage.bucket_name,
-                        'Key': self.file.name
-                    },
-                    ExpiresIn=3600  # URL valid for 1 hour
-                )
+                return presigned_urls.get(self.file)
             except Exception as e:
                 logger.error(f"Error generating presigned URL: {str(e)}")
                 return None
         return None
 
 
+class Mirror(BaseModel):
+    name = models.CharField(max_length=40, unique=True)
+    url = models.URLField(blank=True, help_text='Base URL serving the same paths as the build storage. '
+                                                'Leave blank for the build storage itself.')
+    priority = models.PositiveSmallIntegerField(default=0, help_text='Order of mirrors without enough '
+                                                                     'download reports, lowest first')
+    is_enabled = models.BooleanField(default=True)
+
+    class Meta:
+        db_table = 'mirrors'
+        ordering = ['priority', 'id']
+
+    def __str__(self):
+        return self.name
+
+
+class MirrorStats(models.Model):
+    """
+    Download reports per day, client region and mirror.
+    """
+    day = models.DateField()
+    region = models.CharField(max_length=16, blank=True, default='')
+    mirror = models.ForeignKey(Mirror, on_delete=models.CASCADE)
+    downloads = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+    time_ms = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            ('day', 'region', 'mirror'),
+        )
+
+
 EVENT_DICT_CHOICES = dict(
     preinstall=0,
     install=1,
@@ -256,6 +292,47 @@ class PartialUpdate(models.Model):
         choices=ACTIVE_USERS_CHOICES, default=1)
 
 
+def patch_upload_to(obj, filename):
+    version = obj.version
+    return os.path.join('patch', version.app.name, version.channel.name,
+                        version.platform.name, str(version.version), filename)
+
+
+def _patch_upload_to(*args, **kwargs):
+    return patch_upload_to(*args, **kwargs)
+
+
+class Patch(BaseModel):
+    """
+    Binary diff from the file of base to the file of version, see
+    omaha.patches.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    )
+
+    version = models.ForeignKey(Version, related_name='patches', on_delete=models.CASCADE)
+    base = models.ForeignKey(Version, related_name='+', on_delete=models.CASCADE)
+    file = models.FileField(upload_to=_patch_upload_to, null=True, blank=True,
+                            storage=Version._meta.get_field('file').storage)
+    file_size = models.PositiveIntegerField(null=True, blank=True)
+    file_hash_sha256 = models.CharField(verbose_name='SHA-256', max_length=64, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'patches'
+        unique_together = (
+            ('version', 'base'),
+        )
+
+    def __str__(self):
+        return "{version} from {base}".format(version=self.version, base=self.base.version)
+
+
 NAME_DATA_DICT_CHOICES = dict(
     install=0,
     untrusted=1,
@@ -309,6 +386,16 @@ class Request(models.Model):
     ip = models.GenericIPAddressField(blank=True, null=True, protocol='IPv4')
 
 
+def is_error_event(eventtype, eventresult, errorcode):
+    if eventtype in (100, 102, 103):
+        return True
+    elif eventresult not in (1, 2, 3):
+        return True
+    elif errorcode != 0:
+        return True
+    return False
+
+
 class Event(models.Model):
     eventtype = models.PositiveSmallIntegerField(db_index=True)
     eventresult = models.PositiveSmallIntegerField()
@@ -328,13 +415,7 @@ class Event(models.Model):
 
     @property
     def is_error(self):
-        if self.eventtype in (100, 102, 103):
-            return True
-        elif self.eventresult not in (1, 2, 3):
-            return True
-        elif self.errorcode != 0:
-            return True
-        return False
+        return is_error_event(self.eventtype, self.eventresult, self.errorcode)
 
 
 class AppRequest(models.Model):
@@ -350,6 +431,67 @@ class AppRequest(models.Model):
     events = models.ManyToManyField(Event)
 
 
+class RequestRollup(models.Model):
+    """
+    AppRequest counts per day and app version, channel and OS, kept up
+    to date by omaha.rollups so reports never scan the raw statistics.
+    Missing values are stored as '' and 0 to keep the key unique.
+    """
+    day = models.DateField()
+    appid = models.CharField(max_length=38)
+    version = VersionField(help_text='Format: 255.255.65535.65535',
+                           number_bits=(8, 8, 16, 16), default=0)
+    channel = models.CharField(max_length=40, blank=True, default='')
+    platform = models.CharField(max_length=10, blank=True, default='')
+    os_version = models.CharField(max_length=16, blank=True, default='')
+    requests = models.PositiveIntegerField(default=0)
+    installs = models.PositiveIntegerField(default=0)
+    updates = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            ('day', 'appid', 'version', 'channel', 'platform', 'os_version'),
+        )
+        indexes = [
+            models.Index(fields=['appid', 'day']),
+        ]
+
+
+class EventSummary(models.Model):
+    """
+    Event counts and timing sketches per day, app version and event
+    type, updated by omaha.timings as statistics are written.
+    """
+    day = models.DateField()
+    appid = models.CharField(max_length=38)
+    version = VersionField(help_text='Format: 255.255.65535.65535',
+                           number_bits=(8, 8, 16, 16), default=0)
+    eventtype = models.PositiveSmallIntegerField()
+    events = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    sketches = JSONField(default=dict, blank=True)
+
+    class Meta:
+        unique_together = (
+            ('day', 'appid', 'version', 'eventtype'),
+        )
+        indexes = [
+            models.Index(fields=['appid', 'day']),
+        ]
+
+
+class RollupMark(models.Model):
+    """
+    Last AppRequest id folded into the rollups, and the highest id seen
+    at pending_at, folded once OMAHA_ROLLUP_SAFETY_LAG has passed.
+    """
+    name = models.CharField(max_length=40, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    pending_id = models.BigIntegerField(default=0)
+    pending_at = models.DateTimeField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+
 @receiver(pre_save, sender=Version)
 def pre_version_save(sender, instance, *args, **kwargs):
     if instance.pk:
@@ -363,11 +505,39 @@ def pre_version_save(sender, instance, *args, **kwargs):
                 pass
             finally:
                 old.file_size = 0
-    sha1 = hashlib.sha1()
-    for chunk in instance.file.chunks():
-        sha1.update(chunk)
-    instance.file.seek(0)
-    instance.file_hash = base64.b64encode(sha1.digest()).decode()
+    instance._new_file = True
+    hashes = get_file_hashes(instance.file)
+    instance.file_hash = hashes.sha1
+    instance.file_hash_sha256 = hashes.sha256
+    instance.file_size = hashes.size
+    defer_upload(instance)
+
+
+def start_patches(pk):
+    try:
+        signature('tasks.generate_patches', args=(pk,)).apply_async(queue='patches')
+    except Exception as e:
+        # the version is served in full meanwhile
+        logger.warning('Cannot queue patches of version %s, run manage.py generate_patches %s: %s', pk, pk, e)
+
+
+@receiver(post_save, sender=Version)
+def on_version_save(sender, instance, *args, **kwargs):
+    deferred = schedule_uploads(instance)
+    # a build stored in the background is diffed once it is, see on_version_upload
+    if instance.__dict__.pop('_new_file', False) and GENERATE_PATCHES and not deferred:
+        transaction.on_commit(lambda pk=instance.pk: start_patches(pk))
+    # the storage picks the final file name while saving
+    location = get_file_location(instance.file) if instance.file else (None, None)
+    if location != (instance.file_codebase, instance.file_package):
+        instance.file_codebase, instance.file_package = location
+        sender.objects.filter(pk=instance.pk).update(file_codebase=location[0], file_package=location[1])
+
+
+@receiver(upload_done, sender=Version)
+def on_version_upload(sender, instance, **kwargs):
+    if GENERATE_PATCHES:
+        transaction.on_commit(lambda pk=instance.pk: start_patches(pk))
 
 
 @receiver(pre_delete, sender=Version)
@@ -376,3 +546,10 @@ def pre_version_delete(sender, instance, **kwargs):
     if name:
         storage.delete(name)
 
+
+
+@receiver(pre_delete, sender=Patch)
+def pre_patch_delete(sender, instance, **kwargs):
+    storage, name = instance.file.storage, instance.file.name
+    if name:
+        storage.delete(name)
@@ -19,19 +19,58 @@ the License.
 """
 
 import os
+import threading
+from collections import namedtuple
 
 from lxml import etree, objectify
-from omaha.settings import DEFAULT_CHANNEL
+from omaha.settings import (DEFAULT_CHANNEL, VALIDATE_REQUEST, MAX_REQUEST_SIZE,
+                            MAX_REQUEST_APPS, MAX_APP_ELEMENTS)
 
-__all__ = ['parser', 'parse_request', 'get_channel']
+__all__ = ['get_schema', 'get_parser', 'get_fast_parser', 'parse_request', 'get_channel',
+           'parse_update_request', 'parse_root', 'get_update_request', 'UpdateRequest',
+           'RequestApp', 'RequestError']
 
 
 BASE_DIR = os.path.dirname(__file__)
 
-with open(os.path.join(BASE_DIR, 'request.xsd')) as f:
-    schema = etree.XMLSchema(file=f)
+with open(os.path.join(BASE_DIR, 'request.xsd'), 'rb') as f:
+    schema_document = etree.fromstring(f.read())
 
-parser = objectify.makeparser(schema=schema)
+# lxml parsers and schemas must not be used by several threads at once,
+# so every worker thread lazily builds and keeps its own set.
+local = threading.local()
+
+
+def get_thread_local(name, factory):
+    value = getattr(local, name, None)
+    if value is None:
+        value = factory()
+        setattr(local, name, value)
+    return value
+
+
+def get_schema():
+    return get_thread_local('schema', lambda: etree.XMLSchema(schema_document))
+
+
+def get_parser():
+    return get_thread_local('parser', lambda: objectify.makeparser(schema=get_schema()))
+
+
+def get_fast_parser():
+    return get_thread_local('fast_parser', lambda: etree.XMLParser(
+        resolve_entities=False, no_network=True, remove_comments=True, remove_pis=True))
+
+
+UpdateRequest = namedtuple('UpdateRequest', ['userid', 'version', 'platform', 'apps'])
+RequestApp = namedtuple('RequestApp', ['appid', 'version', 'channel', 'updatecheck',
+                                       'ping', 'events', 'data', 'fp'])
+
+
+class RequestError(ValueError):
+    """
+    The request body is well-formed XML but not a usable update request.
+    """
 
 
 def parse_request(request):
@@ -79,7 +118,7 @@ def parse_request(request):
         '{D0AB2EBC-931B-4013-9FEB-C9C4C2225C8C}'
     """
 
-    obj = objectify.fromstring(request, parser)
+    obj = objectify.fromstring(request, get_parser())
 
     # Check if this is coming from update_engine, which handles machines not applications
     if obj.get('userid') is None and obj.app.get('machineid') is not None:
@@ -94,3 +133,102 @@ def parse_request(request):
 
 def get_channel(app):
     return app.get('tag') or app.get('ap') or DEFAULT_CHANNEL
+
+
+def parse_update_request(request, validate=VALIDATE_REQUEST):
+    """
+    Parse only what the update builder needs into an UpdateRequest.
+
+    The body goes through a plain etree parser and a few structural
+    checks. XSD validation via parse_request is opt-in through
+    OMAHA_VALIDATE_REQUEST, mostly for debugging clients.
+
+        >>> request = b'''<?xml version="1.0" encoding="UTF-8"?>
+        ... <request protocol="3.0" updaterversion="1.3.23.0" ismachine="0">
+        ...     <os platform="win" version="6.1" sp="" arch="x64"/>
+        ...     <app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" version="1.2.23.0" ap="beta"
+        ...          machineid="{D0BBD725-742D-44ae-8D46-0231E881D58E}">
+        ...         <updatecheck/>
+        ...         <data name="install" index="verboselogging"/>
+        ...     </app>
+        ... </request>'''
+        >>> request_obj = parse_update_request(request)
+        >>> request_obj.userid, request_obj.version, request_obj.platform
+        ('{D0BBD725-742D-44ae-8D46-0231E881D58E}', '1.3.23.0', 'win')
+        >>> app = request_obj.apps[0]
+        >>> app.channel, app.updatecheck, app.ping, app.data
+        ('beta', True, False, (('install', 'verboselogging'),))
+    """
+    return get_update_request(parse_root(request, validate=validate))
+
+
+def parse_root(request, validate=VALIDATE_REQUEST):
+    if len(request) > MAX_REQUEST_SIZE:
+        raise RequestError('Request body exceeds %d bytes' % MAX_REQUEST_SIZE)
+    if validate:
+        return parse_request(request)
+    return etree.fromstring(request, get_fast_parser())
+
+
+REQUEST_TAGS = ('os', 'app', 'updatecheck', 'ping', 'event', 'data', 'package')
+
+
+def get_update_request(root):
+    """
+    Collect an UpdateRequest in a single pass over the tree.
+    """
+    if root.tag != 'request':
+        raise RequestError('Unexpected root element <%s>' % root.tag)
+    os = None
+    apps = []
+    app = None
+    for element in root.iter(*REQUEST_TAGS):
+        tag = element.tag
+        if tag == 'app':
+            if len(apps) == MAX_REQUEST_APPS:
+                raise RequestError('More than %d <app> elements' % MAX_REQUEST_APPS)
+            app = get_request_app(element)
+            apps.append(app)
+        elif tag == 'os':
+            os = element
+        elif app is None:
+            raise RequestError('<%s> outside of <app>' % tag)
+        elif tag == 'updatecheck':
+            app['updatecheck'] = True
+        elif tag == 'ping':
+            app['ping'] = True
+        elif tag == 'package':
+            # the fingerprint of the installed file, from our last manifest
+            if app['fp'] is None:
+                app['fp'] = element.get('fp')
+        else:
+            if len(app['events']) + len(app['data']) == MAX_APP_ELEMENTS:
+                raise RequestError('More than %d <event>/<data> elements in <app>' % MAX_APP_ELEMENTS)
+            if tag == 'event':
+                app['events'].append(dict(element.attrib))
+            else:
+                name = element.get('name')
+                if name is None:
+                    raise RequestError('<data> requires a name attribute')
+                app['data'].append((name, element.get('index')))
+    if os is None or not apps:
+        raise RequestError('Request must contain <os> and at least one <app>')
+    userid = root.get('userid')
+    version = root.get('version')
+    return UpdateRequest(
+        userid=apps[0]['machineid'] if userid is None else userid,
+        version=root.get('updaterversion') if version is None else version,
+        platform=os.get('platform'),
+        apps=[RequestApp(app['appid'], app['version'], app['channel'], app['updatecheck'],
+                         app['ping'], tuple(app['events']), tuple(app['data']), app['fp'])
+              for app in apps],
+    )
+
+
+def get_request_app(app):
+    appid, version = app.get('appid'), app.get('version')
+    if appid is None or version is None:
+        raise RequestError('<app> requires appid and version attributes')
+    return dict(appid=appid, version=version, channel=get_channel(app),
+                machineid=app.get('machineid'), updatecheck=False, ping=False,
+                events=[], data=[], fp=None)
@@ -0,0 +1,204 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+Differential updates.
+
+When a Version gets a new file, the tasks.generate_patches job diffs it
+against the files of the OMAHA_PATCH_BASES previous versions most
+requested over the last OMAHA_PATCH_POPULARITY_DAYS days according to
+the request rollups, completed with the latest previous versions. A build
+stored by a background upload is diffed once the upload is done. Patches
+are stored next to the builds. Packages carry the fp of their file,
+which clients report back for their installed version. A client running
+the base of a ready patch, known by that fp or else by its version, gets
+its codebasediff and the namediff, sizediff and hashdiff_sha256 package
+attributes along with the full package, which clients without
+differential updates keep using.
+"""
+
+import datetime
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from common.uploadhandlers import FileHashes
+from omaha.catalog import BaseCatalog, get_day, version_to_int
+from omaha.models import Version, Patch, RequestRollup
+from omaha.settings import (
+    PATCH_DIFFER,
+    PATCH_COURGETTE_PATH,
+    PATCH_BASES,
+    PATCH_POPULARITY_DAYS,
+    PATCH_MAX_RATIO,
+)
+
+
+__all__ = ['bsdiff', 'courgette', 'get_patch_bases', 'generate_patches', 'PatchIndex', 'patch_index']
+
+
+logger = logging.getLogger(__name__)
+
+
+def bsdiff(old_path, new_path, patch_path):
+    # optional dependency, only needed by the workers generating patches
+    import bsdiff4
+    bsdiff4.file_diff(old_path, new_path, patch_path)
+
+
+def courgette(old_path, new_path, patch_path):
+    subprocess.run([PATCH_COURGETTE_PATH, '-gen', old_path, new_path, patch_path], check=True)
+
+
+def get_patch_bases(version, count=PATCH_BASES):
+    """
+    Previous versions of the same app, platform and channel to diff
+    version against, most requested first.
+    """
+    previous = list(Version.objects.filter(app=version.app_id, platform=version.platform_id,
+                                           channel=version.channel_id, version__lt=version.version)
+                    .filter(file__isnull=False).exclude(file='').order_by('-version'))
+    by_number = dict((int(base.version), base) for base in previous)
+    since = get_day(timezone.now()) - datetime.timedelta(days=PATCH_POPULARITY_DAYS)
+    popular = (RequestRollup.objects.filter(appid=version.app_id, channel=version.channel.name,
+                                            platform=version.platform.name, day__gte=since)
+               .values('version').annotate(requests=Sum('requests')).order_by('-requests'))
+    bases = []
+    for row in popular:
+        base = by_number.pop(int(row['version']), None)
+        if base is not None:
+            bases.append(base)
+        if len(bases) >= count:
+            return bases
+    # not enough statistics, e.g. rollups are not refreshed
+    return bases + [base for base in previous if int(base.version) in by_number][:count - len(bases)]
+
+
+def download(file, path):
+    with file.open('rb'), open(path, 'wb') as local:
+        for chunk in file.chunks():
+            local.write(chunk)
+    return path
+
+
+def build_patch(patch, differ):
+    version = patch.version
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = download(patch.base.file, os.path.join(tmp, 'old'))
+        new_path = download(version.file, os.path.join(tmp, 'new'))
+        patch_path = os.path.join(tmp, 'patch')
+        started = time.monotonic()
+        differ(old_path, new_path, patch_path)
+        size = os.path.getsize(patch_path)
+        logger.info('Diffed %s in %.1fs: %d of %d bytes', patch, time.monotonic() - started,
+                    size, os.path.getsize(new_path))
+        if size >= os.path.getsize(new_path) * PATCH_MAX_RATIO:
+            patch.status = 'skipped'
+            patch.save()
+            return patch
+        hashes = FileHashes()
+        with open(patch_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hashes.update(chunk)
+            if patch.file:
+                patch.file.delete(save=False)
+            patch.file.save('%s_from_%s.patch' % (version.file_package_name, patch.base.version),
+                            File(f), save=False)
+    patch.file_size = hashes.size
+    patch.file_hash_sha256 = hashes.sha256
+    patch.status, patch.error = 'ready', ''
+    patch.save()
+    return patch
+
+
+def generate_patches(version, count=PATCH_BASES, differ=None):
+    """
+    Create the missing patches of version; return the Patch rows of its
+    bases.
+    """
+    differ = differ or import_string(PATCH_DIFFER)
+    patches = []
+    for base in get_patch_bases(version, count=count):
+        patch, created = Patch.objects.get_or_create(version=version, base=base)
+        if patch.status in ('pending', 'failed'):
+            try:
+                build_patch(patch, differ)
+            except Exception as e:
+                logger.exception('Cannot build %s', patch)
+                patch.status, patch.error = 'failed', str(e)
+                patch.save()
+        patches.append(patch)
+    return patches
+
+
+class PatchIndex(BaseCatalog):
+    """
+    Ready patches by target Version id and base file fingerprint or
+    packed base version.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PatchIndex, self).__init__(*args, **kwargs)
+        self._patches = {}
+
+    def load(self):
+        patches = Patch.objects.filter(status='ready').select_related('base')
+        index = {}
+        for patch in patches:
+            index[patch.version_id, int(patch.base.version)] = patch
+            if patch.base.file_fingerprint:
+                index[patch.version_id, patch.base.file_fingerprint] = patch
+        with self._lock:
+            self._patches = index
+            self._loaded_at = time.monotonic()
+
+    def lookup(self, version, client_version, client_fp=None):
+        """
+        The patch from the file the client has installed. Clients that
+        report no fingerprint, e.g. installed before manifests carried
+        one, are matched on their version.
+        """
+        if client_fp:
+            self.ensure_loaded()
+            return self._patches.get((version.pk, client_fp))
+        if not client_version:
+            return None
+        self.ensure_loaded()
+        try:
+            return self._patches.get((version.pk, version_to_int(client_version)))
+        except ValueError:
+            return None
+
+
+patch_index = PatchIndex()
+
+
+@receiver(post_save, sender=Patch)
+@receiver(post_delete, sender=Patch)
+def on_patch_change(sender, instance, **kwargs):
+    transaction.on_commit(patch_index.invalidate)
@@ -0,0 +1,207 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+Daily, weekly and monthly active users counted from <ping> elements.
+
+Each (appid, version, channel, platform, day) gets a HyperLogLog sketch
+of the user ids that pinged. Weekly and monthly numbers, and numbers
+across versions, channels or platforms, are the count of the union of
+the matching sketches.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import threading
+
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from common.logwriter import BufferedWriter
+from omaha.catalog import get_day
+from omaha.hyperloglog import HyperLogLog
+from omaha.rollout import normalize_userid
+from omaha.settings import (
+    PINGS_BACKEND,
+    PINGS_QUEUE_SIZE,
+    PINGS_BATCH_SIZE,
+    PINGS_FLUSH_INTERVAL,
+)
+
+
+__all__ = ['PERIOD_DAYS', 'LocalBackend', 'RedisBackend', 'get_backend',
+           'count_active_users', 'ping_writer']
+
+
+logger = logging.getLogger(__name__)
+
+PERIOD_DAYS = dict(day=1, week=7, month=30)
+RETENTION_DAYS = max(PERIOD_DAYS.values()) + 1
+
+
+def get_window(day, days):
+    return [day - datetime.timedelta(days=offset) for offset in range(days)]
+
+
+def get_matcher(appid, version=None, channel=None, platform=None):
+    def match(dims):
+        return (dims[0] == appid
+                and (version is None or dims[1] == version)
+                and (channel is None or dims[2] == channel)
+                and (platform is None or dims[3] == platform))
+    return match
+
+
+class LocalBackend(object):
+    """
+    In-process sketches, for a single process or development: with
+    several workers each one only counts the pings it received.
+
+        >>> backend = LocalBackend()
+        >>> day = datetime.date(2016, 3, 4)
+        >>> backend.add({(day, ('{430FD4D0}', '1.0.0.0', 'stable', 'win')): {'a', 'b'},
+        ...              (day, ('{430FD4D0}', '2.0.0.0', 'stable', 'win')): {'b', 'c'}})
+        >>> backend.count([day], get_matcher('{430FD4D0}'))
+        3
+        >>> backend.count([day], get_matcher('{430FD4D0}', version='2.0.0.0'))
+        2
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sketches = {}
+
+    def add(self, items):
+        with self._lock:
+            for (day, dims), userids in items.items():
+                sketch = self._sketches.setdefault(day, {}).get(dims)
+                if sketch is None:
+                    sketch = self._sketches[day][dims] = HyperLogLog()
+                sketch.update(userids)
+            oldest = max(self._sketches) - datetime.timedelta(days=RETENTION_DAYS)
+            for day in [day for day in self._sketches if day < oldest]:
+                del self._sketches[day]
+
+    def count(self, days, match):
+        with self._lock:
+            sketches = [sketch for day in days
+                        for dims, sketch in self._sketches.get(day, {}).items() if match(dims)]
+            if not sketches:
+                return 0
+            return HyperLogLog.union(sketches).count()
+
+
+class RedisBackend(object):
+    """
+    PFADD sketches in the 'statistics' Redis, shared by all processes.
+
+    A set per day lists the dimensions seen that day, so a report finds
+    its keys without a SCAN; PFCOUNT of several keys counts their union.
+    """
+    key_prefix = 'pings'
+
+    def __init__(self):
+        from omaha.utils import redis
+        self.redis = redis
+
+    def get_key(self, day, dims):
+        return ':'.join((self.key_prefix,) + tuple(dim or '' for dim in dims) + (day.isoformat(),))
+
+    def get_index_key(self, day):
+        return '%s:index:%s' % (self.key_prefix, day.isoformat())
+
+    def add(self, items):
+        ttl = RETENTION_DAYS * 24 * 60 * 60
+        with self.redis.pipeline(transaction=False) as pipe:
+            for (day, dims), userids in items.items():
+                key = self.get_key(day, dims)
+                pipe.pfadd(key, *userids)
+                pipe.expire(key, ttl)
+                pipe.sadd(self.get_index_key(day), json.dumps(dims))
+                pipe.expire(self.get_index_key(day), ttl)
+            pipe.execute()
+
+    def count(self, days, match):
+        with self.redis.pipeline(transaction=False) as pipe:
+            for day in days:
+                pipe.smembers(self.get_index_key(day))
+            indexes = pipe.execute()
+        keys = [self.get_key(day, dims) for day, index in zip(days, indexes)
+                for dims in (tuple(json.loads(member)) for member in index) if match(dims)]
+        if not keys:
+            return 0
+        return self.redis.pfcount(*keys)
+
+
+BACKENDS = dict(
+    local='omaha.pings.LocalBackend',
+    redis='omaha.pings.RedisBackend',
+)
+
+backend = None
+backend_lock = threading.Lock()
+
+
+def get_backend():
+    global backend
+    if backend is None:
+        with backend_lock:
+            if backend is None:
+                backend = import_string(BACKENDS.get(PINGS_BACKEND, PINGS_BACKEND))()
+    return backend
+
+
+def count_active_users(appid, period='day', day=None, version=None, channel=None, platform=None):
+    """
+    Estimated number of distinct users that pinged appid during the
+    period ending on day, today by default. version, channel and
+    platform narrow the count; left out, they count across all values.
+    """
+    day = day or get_day(timezone.now())
+    return get_backend().count(get_window(day, PERIOD_DAYS[period]),
+                               get_matcher(appid, version, channel, platform))
+
+
+class PingWriter(BufferedWriter):
+    """
+    Adds the users of <ping> elements to the sketches off the request
+    thread. Entries are (userid, date, [(appid, version, channel, platform)]).
+    """
+    thread_name = 'ping-writer'
+
+    def write(self, batch):
+        items = {}
+        for userid, date, pings in batch:
+            day = get_day(date)
+            userid = normalize_userid(userid)
+            for dims in pings:
+                items.setdefault((day, dims), set()).add(userid)
+        try:
+            get_backend().add(items)
+        except Exception as e:
+            logger.error('Error counting pings of %d requests: %s', len(batch), e)
+
+
+ping_writer = PingWriter(
+    max_queue_size=PINGS_QUEUE_SIZE,
+    batch_size=PINGS_BATCH_SIZE,
+    flush_interval=PINGS_FLUSH_INTERVAL,
+)
+atexit.register(ping_writer.flush)
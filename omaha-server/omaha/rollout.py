@@ -0,0 +1,77 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+"""
+
+import hashlib
+from functools import lru_cache
+
+from omaha.settings import ROLLOUT_CACHE_SIZE
+
+
+__all__ = ['BUCKETS', 'get_bucket', 'get_salt', 'is_in_rollout']
+
+
+BUCKETS = 10000
+
+
+def normalize_userid(userid):
+    """
+        >>> normalize_userid('{D0BBD725-742D-44AE-8D46-0231E881D58E}')
+        'd0bbd725-742d-44ae-8d46-0231e881d58e'
+    """
+    return userid.strip().strip('{}').lower()
+
+
+@lru_cache(maxsize=ROLLOUT_CACHE_SIZE)
+def get_bucket(userid, salt):
+    """
+    Map a user to one of BUCKETS buckets, stable for a given salt.
+
+        >>> get_bucket('{D0BBD725-742D-44ae-8D46-0231E881D58E}', 'app:1.0.0.0')
+        1640
+        >>> get_bucket('d0bbd725-742d-44ae-8d46-0231e881d58e', 'app:1.0.0.0')
+        1640
+    """
+    key = '%s:%s' % (salt, normalize_userid(userid))
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % BUCKETS
+
+
+def get_salt(version):
+    return '%s:%s' % (version.app_id, version.version)
+
+
+def is_in_rollout(userid, salt, percent):
+    """
+    Users whose bucket falls below the rollout share receive the update.
+
+    Raising the percentage only adds buckets, so users who already got a
+    version keep it as the rollout widens. Requests without a userid are
+    never part of a partial rollout.
+
+        >>> is_in_rollout('{D0BBD725-742D-44ae-8D46-0231E881D58E}', 'app:1.0.0.0', 16.4)
+        False
+        >>> is_in_rollout('{D0BBD725-742D-44ae-8D46-0231E881D58E}', 'app:1.0.0.0', 16.41)
+        True
+        >>> is_in_rollout(None, 'app:1.0.0.0', 100)
+        False
+    """
+    if not userid:
+        return False
+    return get_bucket(userid, salt) < int(round(percent * BUCKETS / 100))
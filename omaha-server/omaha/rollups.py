@@ -0,0 +1,176 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+Daily rollups of the update statistics.
+
+refresh_rollups folds the AppRequest rows inserted since the last run
+into RequestRollup, chunk by chunk, and records the last id folded in
+RollupMark within the same transaction. Counts are additive, so a chunk
+only adds to the rows of its days. Reports read RequestRollup alone.
+
+Ids are allocated before the inserting transaction commits, so a row
+with a lower id can show up after a higher one. A run therefore only
+folds up to the highest id it saw OMAHA_ROLLUP_SAFETY_LAG seconds
+earlier, by which time the transactions holding lower ids are over.
+"""
+
+import datetime
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from omaha.models import AppRequest, RequestRollup, RollupMark
+from omaha.settings import DEFAULT_CHANNEL, ROLLUP_CHUNK_SIZE, ROLLUP_SAFETY_LAG
+
+
+__all__ = ['refresh_rollups', 'REPORTS', 'get_report']
+
+
+logger = logging.getLogger(__name__)
+
+MARK_NAME = 'requests'
+KEY_FIELDS = ('day', 'appid', 'version', 'channel', 'platform', 'os_version')
+COUNT_FIELDS = ('requests', 'installs', 'updates')
+
+
+def get_chunk_counts(start, end):
+    rows = (AppRequest.objects.filter(pk__gt=start, pk__lte=end)
+            .annotate(day=TruncDate('request__created'))
+            .values('day', 'appid', 'version', 'tag', 'request__os__platform', 'request__os__version')
+            .annotate(requests=Count('pk', distinct=True),
+                      installs=Count('pk', distinct=True, filter=Q(events__eventtype=2, events__eventresult=1)),
+                      updates=Count('pk', distinct=True, filter=Q(events__eventtype=3, events__eventresult=1)))
+            .order_by())
+    counts = {}
+    for row in rows:
+        key = (row['day'], row['appid'], int(row['version'] or 0), row['tag'] or DEFAULT_CHANNEL,
+               row['request__os__platform'] or '', row['request__os__version'] or '')
+        total = counts.setdefault(key, dict.fromkeys(COUNT_FIELDS, 0))
+        for name in COUNT_FIELDS:
+            total[name] += row[name]
+    return counts
+
+
+def apply_counts(counts):
+    days = set(key[0] for key in counts)
+    appids = set(key[1] for key in counts)
+    existing = {}
+    for rollup in RequestRollup.objects.select_for_update().filter(day__in=days, appid__in=appids):
+        # versions are packed the same way on both sides, missing ones as 0
+        existing[tuple(int(getattr(rollup, name)) if name == 'version' else getattr(rollup, name)
+                       for name in KEY_FIELDS)] = rollup
+    created, updated = [], []
+    for key, values in counts.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            created.append(RequestRollup(**dict(zip(KEY_FIELDS, key)), **values))
+            continue
+        for name in COUNT_FIELDS:
+            setattr(rollup, name, getattr(rollup, name) + values[name])
+        updated.append(rollup)
+    RequestRollup.objects.bulk_create(created)
+    RequestRollup.objects.bulk_update(updated, COUNT_FIELDS)
+
+
+def get_end(lag):
+    """
+    Highest id a run may fold: the one recorded at least lag seconds ago,
+    which is then replaced by the current highest id.
+    """
+    with transaction.atomic():
+        mark = RollupMark.objects.select_for_update().get(name=MARK_NAME)
+        current = AppRequest.objects.aggregate(end=Max('pk'))['end'] or 0
+        if not lag:
+            return current
+        now = timezone.now()
+        if mark.pending_at is not None and now - mark.pending_at < datetime.timedelta(seconds=lag):
+            return mark.last_id
+        end = mark.pending_id if mark.pending_at is not None else mark.last_id
+        mark.pending_id, mark.pending_at = current, now
+        mark.save()
+    return end
+
+
+def refresh_rollups(chunk_size=ROLLUP_CHUNK_SIZE, lag=ROLLUP_SAFETY_LAG):
+    """
+    Fold new AppRequest rows into the rollups; return how many were read.
+
+    Concurrent runs queue on the mark row. The upper bound is taken at
+    the start, so a run ends even while statistics keep coming in.
+    """
+    RollupMark.objects.get_or_create(name=MARK_NAME)
+    end = get_end(lag)
+    total = 0
+    while True:
+        with transaction.atomic():
+            mark = RollupMark.objects.select_for_update().get(name=MARK_NAME)
+            if mark.last_id >= end:
+                break
+            chunk_end = min(mark.last_id + chunk_size, end)
+            counts = get_chunk_counts(mark.last_id, chunk_end)
+            apply_counts(counts)
+            total += sum(values['requests'] for values in counts.values())
+            mark.last_id = chunk_end
+            mark.save()
+    logger.info('Rolled up %d app requests, up to id %d', total, end)
+    return total
+
+
+def version_adoption(rollups):
+    return rollups.values('day', 'version').annotate(requests=Sum('requests')).order_by('day', 'version')
+
+
+def platform_share(rollups):
+    return (rollups.values('platform', 'os_version').annotate(requests=Sum('requests'))
+            .order_by('-requests'))
+
+
+def daily_totals(rollups):
+    return (rollups.values('day').annotate(requests=Sum('requests'), installs=Sum('installs'),
+                                           updates=Sum('updates')).order_by('day'))
+
+
+REPORTS = dict(
+    versions=version_adoption,
+    platforms=platform_share,
+    daily=daily_totals,
+)
+
+
+def get_report(name, appid, start, end, channel=None, platform=None):
+    """
+    Rows of a REPORTS entry for appid between the start and end days.
+
+        >>> list(get_report('daily', '{430FD4D0-B729-4F61-AA34-91526481799D}',
+        ...                 datetime.date(2016, 3, 1), datetime.date(2016, 3, 4)))
+        []
+    """
+    rollups = RequestRollup.objects.filter(appid=appid, day__gte=start, day__lte=end)
+    if channel:
+        rollups = rollups.filter(channel=channel)
+    if platform:
+        rollups = rollups.filter(platform=platform)
+    rows = list(REPORTS[name](rollups))
+    for row in rows:
+        if 'version' in row:
+            row['version'] = str(row['version'])
+    return rows
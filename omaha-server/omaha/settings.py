@@ -22,4 +22,46 @@ from django.conf import settings
 
 KEY_PREFIX = getattr(settings, 'OMAHA_UID_KEY_PREFIX', 'uid')
 KEY_LAST_ID = getattr(settings, 'OMAHA_KEY_LAST_ID', '{}:{}'.format(KEY_PREFIX, 'last_id'))
-DEFAULT_CHANNEL = getattr(settings, 'OMAHA_DEFAULT_CHANNEL', 'stable')
\ No newline at end of file
+USER_ID_CACHE_SIZE = getattr(settings, 'OMAHA_USER_ID_CACHE_SIZE', 100000)
+DEFAULT_CHANNEL = getattr(settings, 'OMAHA_DEFAULT_CHANNEL', 'stable')
+CATALOG_TIMEOUT = getattr(settings, 'OMAHA_CATALOG_TIMEOUT', 10)
+RESPONSE_SERIALIZER = getattr(settings, 'OMAHA_RESPONSE_SERIALIZER', 'lxml')
+VALIDATE_REQUEST = getattr(settings, 'OMAHA_VALIDATE_REQUEST', False)
+MAX_REQUEST_SIZE = getattr(settings, 'OMAHA_MAX_REQUEST_SIZE', 256 * 1024)
+MAX_REQUEST_APPS = getattr(settings, 'OMAHA_MAX_REQUEST_APPS', 100)
+MAX_APP_ELEMENTS = getattr(settings, 'OMAHA_MAX_APP_ELEMENTS', 64)
+ROLLOUT_CACHE_SIZE = getattr(settings, 'OMAHA_ROLLOUT_CACHE_SIZE', 65536)
+ASYNC_UPDATE_VIEW = getattr(settings, 'OMAHA_ASYNC_UPDATE_VIEW', False)
+ASYNC_UPDATE_WORKERS = getattr(settings, 'OMAHA_ASYNC_UPDATE_WORKERS', 4)
+COLLECT_STATISTICS = getattr(settings, 'OMAHA_COLLECT_STATISTICS', False)
+STATISTICS_QUEUE_SIZE = getattr(settings, 'OMAHA_STATISTICS_QUEUE_SIZE', 10000)
+STATISTICS_BATCH_SIZE = getattr(settings, 'OMAHA_STATISTICS_BATCH_SIZE', 200)
+STATISTICS_FLUSH_INTERVAL = getattr(settings, 'OMAHA_STATISTICS_FLUSH_INTERVAL', 5.0)
+STATISTICS_CACHE_SIZE = getattr(settings, 'OMAHA_STATISTICS_CACHE_SIZE', 4096)
+TRACK_ACTIVE_USERS = getattr(settings, 'OMAHA_TRACK_ACTIVE_USERS', False)
+ACTIVE_USERS_BACKEND = getattr(settings, 'OMAHA_ACTIVE_USERS_BACKEND', 'local')
+ACTIVE_USERS_QUEUE_SIZE = getattr(settings, 'OMAHA_ACTIVE_USERS_QUEUE_SIZE', 10000)
+ACTIVE_USERS_BATCH_SIZE = getattr(settings, 'OMAHA_ACTIVE_USERS_BATCH_SIZE', 1000)
+ACTIVE_USERS_FLUSH_INTERVAL = getattr(settings, 'OMAHA_ACTIVE_USERS_FLUSH_INTERVAL', 1.0)
+COUNT_PINGS = getattr(settings, 'OMAHA_COUNT_PINGS', False)
+PINGS_BACKEND = getattr(settings, 'OMAHA_PINGS_BACKEND', 'redis')
+PINGS_QUEUE_SIZE = getattr(settings, 'OMAHA_PINGS_QUEUE_SIZE', 10000)
+PINGS_BATCH_SIZE = getattr(settings, 'OMAHA_PINGS_BATCH_SIZE', 1000)
+PINGS_FLUSH_INTERVAL = getattr(settings, 'OMAHA_PINGS_FLUSH_INTERVAL', 1.0)
+ROLLUP_CHUNK_SIZE = getattr(settings, 'OMAHA_ROLLUP_CHUNK_SIZE', 10000)
+ROLLUP_SAFETY_LAG = getattr(settings, 'OMAHA_ROLLUP_SAFETY_LAG', 120)
+MIRROR_RANKING_TTL = getattr(settings, 'OMAHA_MIRROR_RANKING_TTL', 300)
+MIRROR_RANKING_DAYS = getattr(settings, 'OMAHA_MIRROR_RANKING_DAYS', 7)
+MIRROR_MIN_SAMPLES = getattr(settings, 'OMAHA_MIRROR_MIN_SAMPLES', 50)
+MIRROR_REGION_RESOLVER = getattr(settings, 'OMAHA_MIRROR_REGION_RESOLVER', 'omaha.mirrors.get_country')
+MIRROR_ORDER_TTL = getattr(settings, 'OMAHA_MIRROR_ORDER_TTL', 7 * 24 * 60 * 60)
+MIRROR_ORDER_CACHE = getattr(settings, 'OMAHA_MIRROR_ORDER_CACHE', 'statistics')
+PRESIGNED_URL_EXPIRES = getattr(settings, 'OMAHA_PRESIGNED_URL_EXPIRES', 3600)
+PRESIGNED_URL_REFRESH = getattr(settings, 'OMAHA_PRESIGNED_URL_REFRESH', 0.8)
+PRESIGNED_URL_CACHE_SIZE = getattr(settings, 'OMAHA_PRESIGNED_URL_CACHE_SIZE', 4096)
+GENERATE_PATCHES = getattr(settings, 'OMAHA_GENERATE_PATCHES', False)
+PATCH_DIFFER = getattr(settings, 'OMAHA_PATCH_DIFFER', 'omaha.patches.bsdiff')
+PATCH_COURGETTE_PATH = getattr(settings, 'OMAHA_PATCH_COURGETTE_PATH', 'courgette')
+PATCH_BASES = getattr(settings, 'OMAHA_PATCH_BASES', 3)
+PATCH_POPULARITY_DAYS = getattr(settings, 'OMAHA_PATCH_POPULARITY_DAYS', 14)
+PATCH_MAX_RATIO = getattr(settings, 'OMAHA_PATCH_MAX_RATIO', 0.8)
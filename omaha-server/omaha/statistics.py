@@ -0,0 +1,293 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+"""
+
+import atexit
+import logging
+from functools import lru_cache
+
+from celery import signature
+from django.db import DatabaseError, connection, models, transaction
+from lxml.etree import XMLSyntaxError
+from versionfield import VersionField
+
+from common.logwriter import BufferedWriter
+from omaha import codec, mirrors, timings
+from omaha.models import Request, AppRequest, Event, Os, Hw
+from omaha.parser import parse_request
+from omaha.settings import (
+    STATISTICS_QUEUE_SIZE,
+    STATISTICS_BATCH_SIZE,
+    STATISTICS_FLUSH_INTERVAL,
+    STATISTICS_CACHE_SIZE,
+)
+
+
+__all__ = ['get_request_record', 'write_records', 'collect_statistics',
+           'collect_statistics_batch', 'statistics_writer']
+
+
+logger = logging.getLogger(__name__)
+
+OS_FIELDS = ('platform', 'version', 'sp', 'arch')
+HW_FIELDS = ('sse', 'sse2', 'sse3', 'ssse3', 'sse41', 'sse42', 'avx', 'physmemory')
+REQUEST_FIELDS = ('version', 'ismachine', 'sessionid', 'userid', 'installsource',
+                  'originurl', 'testsource', 'updaterchannel')
+APP_FIELDS = ('appid', 'version', 'nextversion', 'lang', 'tag', 'installage')
+EVENT_FIELDS = ('eventtype', 'eventresult', 'errorcode', 'extracode1', 'download_time_ms',
+                'downloaded', 'total', 'update_check_time_ms', 'install_time_ms',
+                'source_url_index', 'state_cancelled', 'time_since_update_available_ms',
+                'time_since_download_start_ms', 'nextversion', 'previousversion')
+
+
+def get_cleaner(field):
+    """
+    Return a function coercing an attribute to what the column accepts,
+    or to None. One bad value must not fail the bulk insert of a batch.
+
+        >>> get_cleaner(Event._meta.get_field('eventresult'))('1')
+        1
+        >>> get_cleaner(Event._meta.get_field('download_time_ms'))('-1') is None
+        True
+        >>> get_cleaner(Request._meta.get_field('version'))('1.3.23.0')
+        '1.3.23.0'
+        >>> get_cleaner(Request._meta.get_field('version'))('1.3.23.0.1') is None
+        True
+    """
+    if isinstance(field, VersionField):
+        # Same rules as versionfield's converter, minus its settings lookup
+        limits = [1 << bits for bits in field.number_bits]
+
+        def clean(value):
+            parts = value.split('.')
+            if len(parts) > len(limits):
+                return None
+            try:
+                if not all(0 <= int(part) < limit for part, limit in zip(parts, limits)):
+                    return None
+            except ValueError:
+                return None
+            return value
+    elif isinstance(field, models.IntegerField):
+        min_value, max_value = connection.ops.integer_field_range(field.get_internal_type())
+
+        def clean(value):
+            try:
+                value = int(value)
+            except ValueError:
+                return None
+            if (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+                return None
+            return value
+    elif isinstance(field, models.CharField):
+        def clean(value):
+            return value[:field.max_length]
+    else:
+        def clean(value):
+            return value
+
+    def clean_value(value):
+        if value is None or value == '':
+            return None
+        return clean(value)
+    return clean_value
+
+
+@lru_cache(maxsize=None)
+def get_cleaners(model, names):
+    return dict((name, get_cleaner(model._meta.get_field(name))) for name in names)
+
+
+clean_tag = get_cleaner(AppRequest._meta.get_field('tag'))
+
+
+def get_values(model, element, names):
+    cleaners = get_cleaners(model, names)
+    values = dict.fromkeys(names)
+    # Requests only carry a few of the attributes
+    for name, value in element.items():
+        clean = cleaners.get(name)
+        if clean is not None:
+            values[name] = clean(value)
+    return values
+
+
+def get_key(model, element, names):
+    if element is None:
+        return None
+    return tuple(get_values(model, element, names)[name] for name in names)
+
+
+def get_request_record(root, ip=None, created=None):
+    """
+    Extract the statistics of a parsed request into plain values.
+
+        >>> from lxml import etree
+        >>> root = etree.fromstring(b'''<request protocol="3.0" version="1.3.23.0" ismachine="0"
+        ...          userid="{D0BBD725-742D-44ae-8D46-0231E881D58E}">
+        ...     <os platform="win" version="6.1" sp="" arch="x64"/>
+        ...     <app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" version="1.2.23.0" ap="beta">
+        ...         <event eventtype="3" eventresult="1" errorcode="0"/>
+        ...     </app>
+        ... </request>''')
+        >>> record = get_request_record(root, ip='8.8.8.8')
+        >>> record['os'], record['hw']
+        (('win', '6.1', None, 'x64'), None)
+        >>> record['request']['ismachine'], record['apps'][0]['app']['tag']
+        (0, 'beta')
+        >>> record['apps'][0]['events'][0]['eventtype']
+        3
+    """
+    request = get_values(Request, root, REQUEST_FIELDS)
+    request['ip'] = ip
+    if created is not None:
+        request['created'] = created
+    apps = []
+    for app in root.iterchildren('app'):
+        app_values = get_values(AppRequest, app, APP_FIELDS)
+        if app_values['tag'] is None:
+            app_values['tag'] = clean_tag(app.get('ap'))
+        apps.append(dict(
+            app=app_values,
+            events=[get_values(Event, event, EVENT_FIELDS) for event in app.iterchildren('event')],
+        ))
+    return dict(
+        request=request,
+        os=get_key(Os, root.find('os'), OS_FIELDS),
+        hw=get_key(Hw, root.find('hw'), HW_FIELDS),
+        apps=apps,
+    )
+
+
+@lru_cache(maxsize=STATISTICS_CACHE_SIZE)
+def get_os_id(*key):
+    os, _ = Os.objects.get_or_create(**dict(zip(OS_FIELDS, key)))
+    return os.pk
+
+
+@lru_cache(maxsize=STATISTICS_CACHE_SIZE)
+def get_hw_id(*key):
+    # Hw has no unique constraint, reuse the oldest matching row
+    values = dict(zip(HW_FIELDS, key))
+    pk = Hw.objects.filter(**values).order_by('pk').values_list('pk', flat=True).first()
+    if pk is None:
+        pk = Hw.objects.create(**values).pk
+    return pk
+
+
+def insert_records(records):
+    requests = Request.objects.bulk_create([
+        Request(os_id=get_os_id(*record['os']) if record['os'] else None,
+                hw_id=get_hw_id(*record['hw']) if record['hw'] else None,
+                **record['request'])
+        for record in records
+    ])
+    app_requests, app_events = [], []
+    for request, record in zip(requests, records):
+        for app in record['apps']:
+            app_requests.append(AppRequest(request=request, **app['app']))
+            app_events.append([Event(**event) for event in app['events']])
+    AppRequest.objects.bulk_create(app_requests)
+    Event.objects.bulk_create([event for events in app_events for event in events])
+    Through = AppRequest.events.through
+    Through.objects.bulk_create([
+        Through(apprequest_id=app_request.pk, event_id=event.pk)
+        for app_request, events in zip(app_requests, app_events)
+        for event in events
+    ])
+    timings.add_records(records)
+    mirrors.add_records(records)
+
+
+def write_records(records):
+    """
+    Insert the records with one bulk_create per table.
+
+    When the batch fails the records are retried one by one, so a single
+    bad record only loses itself.
+    """
+    try:
+        with transaction.atomic():
+            insert_records(records)
+        return
+    except DatabaseError as e:
+        logger.error('Statistics batch of %d records failed: %s', len(records), e)
+    # Os and Hw rows interned inside the rolled back transaction are gone
+    get_os_id.cache_clear()
+    get_hw_id.cache_clear()
+    for record in records:
+        try:
+            with transaction.atomic():
+                insert_records([record])
+        except DatabaseError as e:
+            logger.error('Dropped statistics record: %s', e)
+            get_os_id.cache_clear()
+            get_hw_id.cache_clear()
+
+
+def collect_statistics(request, ip=None, created=None):
+    write_records([get_request_record(request, ip=ip, created=created)])
+
+
+def collect_statistics_batch(batch):
+    """
+    Write a batch sent by StatisticsWriter.
+
+    Batches are packed with omaha.codec; a list of (body, ip, created)
+    tuples is the raw-XML form sent before it.
+    """
+    if isinstance(batch, str):
+        records = codec.loads(batch)
+    else:
+        records = []
+        for body, ip, created in batch:
+            try:
+                records.append(get_request_record(parse_request(body), ip=ip, created=created))
+            except (XMLSyntaxError, ValueError) as e:
+                logger.error('Skipped statistics of an unparsable request: %s', e)
+    if records:
+        write_records(records)
+
+
+class StatisticsWriter(BufferedWriter):
+    """
+    Sends the update requests seen by this process to the statistics
+    workers, one task per batch instead of one per request.
+
+    Entries are (root, ip, created) with the tree parsed for the
+    response; records are extracted and packed here, off the request
+    thread, so workers never see or parse XML.
+    """
+    thread_name = 'statistics-writer'
+
+    def write(self, batch):
+        try:
+            payload = codec.dumps([get_request_record(root, ip=ip, created=created)
+                                   for root, ip, created in batch])
+            signature('tasks.collect_statistics_batch', args=(payload,)).apply_async(queue='transient')
+        except Exception as e:
+            logger.error('Error sending %d update requests to statistics: %s', len(batch), e)
+
+
+statistics_writer = StatisticsWriter(
+    max_queue_size=STATISTICS_QUEUE_SIZE,
+    batch_size=STATISTICS_BATCH_SIZE,
+    flush_interval=STATISTICS_FLUSH_INTERVAL,
+)
+atexit.register(statistics_writer.flush)
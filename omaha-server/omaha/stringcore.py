@@ -0,0 +1,237 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+String-template counterpart of omaha.core.
+
+Every builder returns escaped UTF-8 bytes instead of an lxml element, and
+the response is produced by joining them. Output is always compact and
+matches omaha.core serialized with pretty_print=False byte for byte.
+"""
+
+from datetime import datetime
+
+from omaha.utils import get_sec_since_midnight, get_days_since_20070101
+
+
+__all__ = [
+    'Response', 'Url', 'Urls', 'Package', 'Packages', 'Data',
+    'Action', 'Actions', 'Manifest', 'App', 'Updatecheck',
+    'Updatecheck_positive', 'Updatecheck_negative', 'Event',
+    'Fragment', 'tostring'
+]
+
+
+XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8'?>\n"
+
+ATTRIBUTE_ESCAPE = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+    '\n': '&#10;', '\r': '&#13;', '\t': '&#9;',
+})
+TEXT_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'})
+
+RESPONSE = '<response protocol="%s" server="%s"><daystart elapsed_seconds="%d" elapsed_days="%d"/>'
+PING_OK = b'<ping status="ok"/>'
+EVENT_OK = b'<event status="ok"/>'
+UPDATECHECK_NEGATIVE = b'<updatecheck status="noupdate"/>'
+
+
+def escape(value):
+    """
+        >>> escape('a "b" & <c>')
+        'a &quot;b&quot; &amp; &lt;c&gt;'
+    """
+    return str(value).translate(ATTRIBUTE_ESCAPE)
+
+
+def attributes(attrs):
+    return ''.join(' %s="%s"' % (name, escape(value)) for name, value in attrs.items())
+
+
+def element(tag, attrs, children=(), text=None):
+    """
+        >>> element('url', dict(codebase='http://example.com/?a=1&b=2'))
+        b'<url codebase="http://example.com/?a=1&amp;b=2"/>'
+        >>> element('data', dict(name='install'), text='<json/>')
+        b'<data name="install">&lt;json/&gt;</data>'
+    """
+    head = ('<%s%s' % (tag, attributes(attrs))).encode('utf-8')
+    body = b''.join(children)
+    if text is not None:
+        body = str(text).translate(TEXT_ESCAPE).encode('utf-8') + body
+    elif not body:
+        return head + b'/>'
+    return b'%s>%s</%s>' % (head, body, tag.encode('utf-8'))
+
+
+def Fragment(data):
+    """
+    Splice an already serialized subtree, e.g. from omaha.fragments.
+    """
+    return data
+
+
+def tostring(response, pretty_print=False):
+    return XML_DECLARATION + response
+
+
+def Response(apps_list, protocol='3.0', date=None, server='prod'):
+    """
+        >>> from datetime import datetime
+        >>> Response([App('{430FD4D0-B729-4F61-AA34-91526481799D}')], date=datetime(year=2014, month=1, day=1, second=42))
+        b'<response protocol="3.0" server="prod"><daystart elapsed_seconds="42" elapsed_days="2557"/><app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" status="ok"/></response>'
+    """
+    date = date or datetime.utcnow()
+    head = RESPONSE % (escape(protocol), escape(server),
+                       get_sec_since_midnight(date), get_days_since_20070101(date))
+    return head.encode('utf-8') + b''.join(apps_list) + b'</response>'
+
+
+def Ping(status='ok'):
+    """
+        >>> Ping()
+        b'<ping status="ok"/>'
+    """
+    if status == 'ok':
+        return PING_OK
+    return element('ping', dict(status=status))
+
+
+def Event(status='ok'):
+    """
+        >>> Event()
+        b'<event status="ok"/>'
+    """
+    if status == 'ok':
+        return EVENT_OK
+    return element('event', dict(status=status))
+
+
+def Data(name, status='ok', index=None, text=None):
+    """
+        >>> Data('untrusted')
+        b'<data name="untrusted" status="ok"/>'
+        >>> Data('install', index='verboselogging', text='app-specific values here')
+        b'<data name="install" status="ok" index="verboselogging">app-specific values here</data>'
+    """
+    attrs = dict(
+        name=name,
+        status=status,
+    )
+    if index:
+        attrs['index'] = index
+    return element('data', attrs, text=text)
+
+
+def Url(url, diff=False):
+    """
+        >>> Url('http://cache.pack.google.com/edgedl/chrome/install/782.112/')
+        b'<url codebase="http://cache.pack.google.com/edgedl/chrome/install/782.112/"/>'
+        >>> Url('http://cache.pack.google.com/edgedl/chrome/patch/782.112/', diff=True)
+        b'<url codebasediff="http://cache.pack.google.com/edgedl/chrome/patch/782.112/"/>'
+    """
+    return element('url', {'codebasediff' if diff else 'codebase': url})
+
+
+def Urls(urls_list, diff_urls_list=()):
+    """
+        >>> Urls(['http://cache.pack.google.com/edgedl/chrome/install/782.112/',
+        ...       'http://cdn.pack.google.com/edgedl/chrome/install/782.112/'])
+        b'<urls><url codebase="http://cache.pack.google.com/edgedl/chrome/install/782.112/"/><url codebase="http://cdn.pack.google.com/edgedl/chrome/install/782.112/"/></urls>'
+    """
+    return element('urls', {}, [Url(url) for url in urls_list] +
+                   [Url(url, diff=True) for url in diff_urls_list])
+
+
+def Package(name, required, size, hash, fp=None, hash_sha256=None,
+            namediff=None, sizediff=None, hashdiff_sha256=None):
+    """
+        >>> Package('chrome_installer.exe', required='true', size='23963192', hash='VXriGUVI0TNqfLlU02vBel4Q3Zo=')
+        b'<package name="chrome_installer.exe" required="true" size="23963192" hash="VXriGUVI0TNqfLlU02vBel4Q3Zo="/>'
+    """
+    attrs = dict(
+        name=name,
+        required=required,
+        size=size,
+        hash=hash
+    )
+    if hash_sha256:
+        attrs['hash_sha256'] = hash_sha256
+    if fp:
+        attrs['fp'] = fp
+    if namediff:
+        attrs.update(namediff=namediff, sizediff=sizediff, hashdiff_sha256=hashdiff_sha256)
+    return element('package', attrs)
+
+
+def Packages(packages_list):
+    return element('packages', {}, packages_list)
+
+
+def Action(event, **kwargs):
+    """
+        >>> Action('install', run='chrome_installer.exe', arguments='--do-not-launch-chrome')
+        b'<action event="install" run="chrome_installer.exe" arguments="--do-not-launch-chrome"/>'
+    """
+    attrs = dict(event=event)
+    attrs.update(
+        kwargs
+    )
+    return element('action', attrs)
+
+
+def Actions(actions_list):
+    return element('actions', {}, actions_list)
+
+
+def Manifest(version, packages, actions=None):
+    children = [packages]
+    if actions is not None:
+        children.append(actions)
+    return element('manifest', dict(version=version), children)
+
+
+def Updatecheck(status='noupdate', urls=None, manifest=None):
+    children = [child for child in (urls, manifest) if child is not None]
+    return element('updatecheck', dict(status=status), children)
+
+
+def Updatecheck_negative():
+    """
+        >>> Updatecheck_negative()
+        b'<updatecheck status="noupdate"/>'
+    """
+    return UPDATECHECK_NEGATIVE
+
+
+def Updatecheck_positive(urls, manifest, diff_urls=()):
+    return Updatecheck(status='ok', urls=Urls(urls, diff_urls), manifest=manifest)
+
+
+def App(app_id, status='ok', experiments='', updatecheck=None, ping=False,
+        events=None, data_list=None):
+    attrs = dict(appid=app_id, status=status)
+    if experiments:
+        attrs['experiments'] = experiments
+    children = list(events or [])
+    children.extend(data_list or [])
+    if updatecheck is not None:
+        children.append(updatecheck)
+    if ping:
+        children.append(Ping())
+    return element('app', attrs, children)
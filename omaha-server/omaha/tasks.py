@@ -22,21 +22,11 @@ import time
 import logging
 import uuid
 
-
 from django.template import defaultfilters as filters
 
-from omaha_server.celery import app
-from omaha_server.utils import add_extra_to_log_message, get_splunk_url
-from omaha import statistics
-from omaha.parser import parse_request
-from omaha.limitation import (
-    delete_older_than,
-    delete_size_is_exceeded,
-    delete_duplicate_crashes,
-    monitoring_size,
-    raven,
-    handle_dangling_files
-)
+from config.celery import app
+from common import uploads
+from omaha import statistics, rollups, patches
 from omaha.models import Version
 from sparkle.models import SparkleVersion
 from crash.models import Crash, Symbols
@@ -44,10 +34,51 @@ from feedback.models import Feedback
 
 logger = logging.getLogger(__name__)
 
-
-@app.task(ignore_result=True)
-def collect_statistics(request, ip=None):
-    statistics.collect_statistics(parse_request(request), ip=ip)
+try:
+    from omaha_server.utils import add_extra_to_log_message, get_splunk_url
+    from omaha.limitation import (
+        delete_older_than,
+        delete_size_is_exceeded,
+        delete_duplicate_crashes,
+        monitoring_size,
+        raven,
+        handle_dangling_files
+    )
+except ImportError as e:
+    # the crash and feedback limitation tasks need these helpers, the
+    # other tasks do not
+    logger.info('Limitation tasks are unavailable: %s', e)
+
+
+@app.task(name='tasks.collect_statistics_batch', ignore_result=True)
+def collect_statistics_batch(batch):
+    statistics.collect_statistics_batch(batch)
+
+
+@app.task(name='tasks.refresh_rollups', ignore_result=True)
+def refresh_rollups():
+    rollups.refresh_rollups()
+
+
+@app.task(name='tasks.upload_file', bind=True, ignore_result=True, max_retries=5)
+def upload_file(self, pk):
+    try:
+        uploads.run_upload(pk)
+    except Exception as exc:
+        # the next run resumes from the parts already stored
+        raise self.retry(exc=exc, countdown=60)
+
+
+@app.task(name='tasks.generate_patches', ignore_result=True)
+def generate_patches(pk):
+    version = Version.objects.filter(pk=pk).first()
+    if version is None:
+        return
+    upload = uploads.get_upload(version)
+    if upload is not None and upload.status != 'done':
+        # run_upload queues the job again once the build is stored
+        return
+    patches.generate_patches(version)
 
 
 @app.task(name='tasks.auto_delete_older_then', ignore_result=True)
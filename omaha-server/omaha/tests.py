@@ -1,3 +1,537 @@
-from django.test import TestCase
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from lxml import etree
+
+from common import uploads
+from common.logwriter import BufferedWriter
+from common.models import FileUpload
+
+from omaha import builder, core, models, stringcore
+from omaha.catalog import data_index, release_catalog
+from omaha.fragments import updatecheck_fragments
+from omaha.mirrors import mirror_ranking, served_orders
+from omaha.models import (Application, AppRequest, Channel, Mirror, MirrorStats, Os, PartialUpdate, Patch, Platform,
+                          Request, RequestRollup, Version)
+from omaha.patches import patch_index
+from omaha import mirrors, pings, rollups, utils
+from omaha.parser import get_fast_parser, get_parser, get_schema, parse_request, parse_update_request
+from omaha.statistics import get_request_record
+
+
+APP_ID = '{430FD4D0-B729-4F61-AA34-91526481799D}'
+DATE = datetime(year=2014, month=1, day=1, second=42)
+
+with open(os.path.join(os.path.dirname(__file__), 'response.xsd'), 'rb') as f:
+    response_schema = etree.XMLSchema(etree.fromstring(f.read()))
+
+
+def build_responses(serializer):
+    """
+    The same response scenarios built with an omaha.core-like backend.
+    """
+    s = serializer
+
+    # lxml elements move when appended twice, so every manifest gets its own
+    def actions():
+        return s.Actions([
+            s.Action('install', run='chrome_installer.exe', arguments='--do-not-launch-chrome'),
+            s.Action('postinstall', onsuccess='exitsilentlyonlaunchcmd', version='13.0.782.112'),
+        ])
+
+    def packages():
+        return s.Packages([s.Package('chrome_installer.exe', required='true', size='23963192',
+                                     hash='VXriGUVI0TNqfLlU02vBel4Q3Zo=', fp='1.abcdef',
+                                     hash_sha256='ab' * 32)])
+
+    diff_package = s.Package('chrome_installer.exe', required='true', size='23963192',
+                             hash='VXriGUVI0TNqfLlU02vBel4Q3Zo=', hash_sha256='ab' * 32,
+                             namediff='chrome_installer_from_13.0.782.111.patch', sizediff='1024',
+                             hashdiff_sha256='cd' * 32)
+    urls = ['http://cache.pack.google.com/edgedl/chrome/install/782.112/',
+            'http://example.com/?a=1&b="2"']
+    return dict(
+        noupdate=s.Response([s.App(APP_ID, updatecheck=s.Updatecheck_negative(), ping=True)], date=DATE),
+        update=s.Response([s.App(
+            APP_ID, experiments='c=1',
+            updatecheck=s.Updatecheck_positive(
+                urls=urls, manifest=s.Manifest('13.0.782.112', packages=packages(), actions=actions())),
+        )], date=DATE),
+        # a version without actions
+        plain=s.Response([s.App(
+            APP_ID,
+            updatecheck=s.Updatecheck_positive(
+                urls=urls, manifest=s.Manifest('13.0.782.112', packages=packages())),
+        )], date=DATE),
+        diff=s.Response([s.App(
+            APP_ID,
+            updatecheck=s.Updatecheck_positive(
+                urls=urls, diff_urls=['http://cache.pack.google.com/edgedl/chrome/patch/782.112/'],
+                manifest=s.Manifest('13.0.782.112', packages=s.Packages([diff_package]),
+                                    actions=actions())),
+        )], date=DATE),
+        events=s.Response([s.App(APP_ID, events=[s.Event(), s.Event()],
+                                 data_list=[s.Data('untrusted'),
+                                            s.Data('install', index='verboselogging',
+                                                   text='<json a="1" & b/>\r\n')])], date=DATE),
+        apps=s.Response([s.App(APP_ID, updatecheck=s.Updatecheck_negative(), ping=True)
+                         for i in range(20)], date=DATE),
+    )
+
+
+class ResponseSchemaTest(SimpleTestCase):
+    def assertConforms(self, body, name):
+        document = etree.fromstring(body)
+        if not response_schema.validate(document):
+            self.fail('%s: %s' % (name, response_schema.error_log))
+
+    def test_lxml_backend(self):
+        for name, response in build_responses(core).items():
+            for pretty_print in (True, False):
+                self.assertConforms(core.tostring(response, pretty_print=pretty_print), name)
+
+    def test_template_backend(self):
+        for name, response in build_responses(stringcore).items():
+            self.assertConforms(stringcore.tostring(response), name)
+
+    def test_backends_match(self):
+        expected = build_responses(core)
+        for name, response in build_responses(stringcore).items():
+            self.assertEqual(stringcore.tostring(response),
+                             core.tostring(expected[name], pretty_print=False), name)
+
+
+UPDATE_REQUEST = b'''<?xml version="1.0" encoding="UTF-8"?>
+<request protocol="3.0" version="1.3.23.0" ismachine="0" sessionid="{5FAD27D4-6BFA-4daa-A1B3-5A1F821FEE0F}"
+         userid="{D0BBD725-742D-44ae-8D46-0231E881D58E}" installsource="scheduler" testsource="ossdev"
+         requestid="{C8F6EDF3-B623-4ee6-B2DA-1D08A0B4C665}">
+    <os platform="win" version="6.1" sp="" arch="x64"/>
+    <app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" version="%s" nextversion="" lang="en" brand="GGLS"
+         client="" installage="39" ap="%s">
+        <updatecheck/>
+        <ping r="1"/>
+        <data name="install" index="verbose"/>
+    </app>
+    <app appid="{D0AB2EBC-931B-4013-9FEB-C9C4C2225C8C}" version="2.2.2.0" nextversion="" lang="en"
+         brand="GGLS" client="" installage="6">
+        <event eventtype="3" eventresult="1" errorcode="0" extracode1="0"/>
+    </app>
+</request>'''
+
+
+class ParserThreadsTest(SimpleTestCase):
+    threads = 16
+    iterations = 200
+
+    def get_requests(self):
+        return [UPDATE_REQUEST % (version, channel)
+                for version in (b'', b'1.0.0.0', b'13.0.782.112')
+                for channel in (b'stable', b'beta')]
+
+    def test_parallel_parsing(self):
+        requests = self.get_requests()
+        expected = dict(((request, validate), parse_update_request(request, validate=validate))
+                        for request in requests for validate in (False, True))
+        parsers = []
+        errors = []
+        barrier = threading.Barrier(self.threads)
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            parsers.append((get_parser(), get_fast_parser(), get_schema()))
+            barrier.wait()
+            for i in range(self.iterations):
+                request, validate = rnd.choice(list(expected))
+                try:
+                    if parse_update_request(request, validate=validate) != expected[(request, validate)]:
+                        errors.append('mismatch')
+                    if etree.tostring(parse_request(request)) != etree.tostring(parse_request(request)):
+                        errors.append('objectify mismatch')
+                except Exception as e:
+                    errors.append(repr(e))
+                    return
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        # every thread built its own lxml objects
+        for objects in zip(*parsers):
+            self.assertEqual(len(set(map(id, objects))), self.threads)
+
+
+@override_settings(CACHEOPS_ENABLED=False)
+class VersionTestCase(TestCase):
+    """
+    An application with a stored build, kept on the local file system
+    along with its patches.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        storage = FileSystemStorage(location=cls.media_root, base_url='http://example.com/media/')
+        cls.storages = []
+        for model in (Version, Patch):
+            field = model._meta.get_field('file')
+            cls.storages.append((field, field.storage))
+            field.storage = storage
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for field, storage in cls.storages:
+            field.storage = storage
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.app = Application.objects.create(id=APP_ID, name='chrome')
+        cls.platform = Platform.objects.create(name='win')
+        cls.channel = Channel.objects.create(name='stable')
+        cls.version = cls.create_version('13.0.782.112', b'new build')
+
+    @classmethod
+    def create_version(cls, number, content):
+        version = Version(app=cls.app, platform=cls.platform, channel=cls.channel, version=number)
+        version.file.save('chrome_installer.exe', ContentFile(content), save=False)
+        version.save()
+        return version
+
+    def setUp(self):
+        # in-process indexes outlive the rolled back test transactions
+        for catalog in (release_catalog, data_index, patch_index):
+            catalog.invalidate()
+        updatecheck_fragments.clear()
+        mirror_ranking.clear()
+
+
+class BuildResponseTest(VersionTestCase):
+    def test_backends_match(self):
+        body = UPDATE_REQUEST % (b'1.0.0.0', b'stable')
+        with mock.patch.object(builder, 'now', return_value=DATE):
+            responses = [builder.build_response(body, pretty_print=False, serializer=serializer)
+                         for serializer in ('lxml', 'template')]
+        self.assertEqual(responses[0], responses[1])
+        # spliced in as cached
+        self.assertIn(updatecheck_fragments.get(self.version), responses[0])
+
+
+class RecordingWriter(BufferedWriter):
+    def __init__(self):
+        super().__init__(max_queue_size=100000)
+        self.entries = []
+
+    def write(self, batch):
+        self.entries.extend(batch)
+
+
+class BuildResponseThreadsTest(VersionTestCase):
+    threads = 16
+    iterations = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        beta = Channel.objects.create(name='beta')
+        version = Version(app=cls.app, platform=cls.platform, channel=beta, version='14.0.0.0')
+        version.file.save('chrome_installer.exe', ContentFile(b'beta build'), save=False)
+        version.save()
+        PartialUpdate.objects.create(version=version, percent=50, start_date=DATE.date(),
+                                     end_date=DATE.date() + timedelta(days=1), exclude_new_users=False)
+        Mirror.objects.create(name='first', url='http://first.example.com', priority=0)
+        Mirror.objects.create(name='second', url='http://second.example.com', priority=1)
+
+    def get_requests(self):
+        userids = ['{%s}' % uuid.UUID(int=i).hex.upper() for i in range(20)]
+        return [(UPDATE_REQUEST.replace(b'{D0BBD725-742D-44ae-8D46-0231E881D58E}', userid.encode())
+                 % (version, channel), serializer)
+                for userid in userids
+                for version in (b'', b'1.0.0.0', b'13.0.782.112')
+                for channel in (b'stable', b'beta')
+                for serializer in ('lxml', 'template')]
+
+    def test_parallel_responses(self):
+        writers = dict((name, RecordingWriter()) for name in (
+            'statistics_writer', 'active_users_writer', 'ping_writer', 'served_orders'))
+        for name, value in list(writers.items()) + [
+                ('now', mock.Mock(return_value=DATE)), ('COLLECT_STATISTICS', True),
+                ('TRACK_ACTIVE_USERS', True), ('COUNT_PINGS', True)]:
+            patcher = mock.patch.object(builder, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # single-threaded, which also loads every catalog the threads share
+        expected = dict((key, builder.build_response(key[0], serializer=key[1])) for key in self.get_requests())
+        # the partial update reaches part of the beta users
+        beta = [response for (request, serializer), response in expected.items() if b'ap="beta"' in request]
+        served = sum(b'version="14.0.0.0"' in response for response in beta)
+        self.assertTrue(0 < served < len(beta), served)
+        errors = []
+        barrier = threading.Barrier(self.threads)
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            barrier.wait()
+            for i in range(self.iterations):
+                key = rnd.choice(list(expected))
+                try:
+                    if builder.build_response(key[0], serializer=key[1]) != expected[key]:
+                        errors.append('mismatch')
+                except Exception as e:
+                    errors.append(repr(e))
+                    return
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        requests = len(expected) + self.threads * self.iterations
+        for name, writer in writers.items():
+            writer.flush()
+            self.assertEqual(writer.dropped, 0, name)
+        self.assertEqual(len(writers['statistics_writer'].entries), requests)
+        self.assertEqual(len(writers['active_users_writer'].entries), requests)
+        self.assertTrue(writers['served_orders'].entries)
+
+
+@override_settings(REQUEST_LOG_BUFFERED=False)
+class UpdateViewQueriesTest(VersionTestCase):
+    def test_protocol_request(self):
+        body = UPDATE_REQUEST % (b'1.0.0.0', b'stable')
+        # the first request loads the release catalog
+        self.client.post(reverse('update'), body, content_type='text/xml')
+        with self.assertNumQueries(1) as queries:
+            response = self.client.post(reverse('update'), body, content_type='text/xml')
+        # only the request log is written, no session or user is loaded
+        self.assertIn('INSERT INTO "common_requestlog"', queries.captured_queries[0]['sql'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies, {})
+        self.assertFalse(hasattr(response.wsgi_request, 'user'))
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertIn(b'codebase="http://example.com/media/', response.content)
+
+    def test_data_names(self):
+        body = UPDATE_REQUEST % (b'1.0.0.0', b'stable')
+        for data, status in ((b'<data index="verbose"/>', 400), (b'<data name="other" index="verbose"/>', 200)):
+            request = body.replace(b'<data name="install" index="verbose"/>', data)
+            response = self.client.post(reverse('update'), request, content_type='text/xml')
+            self.assertEqual(response.status_code, status)
+        self.assertNotIn(b'<data', response.content)
+
+
+PATCH_REQUEST = b'''<?xml version="1.0" encoding="UTF-8"?>
+<request protocol="3.0" version="1.3.23.0" ismachine="0" sessionid="{5FAD27D4-6BFA-4daa-A1B3-5A1F821FEE0F}"
+         userid="{D0BBD725-742D-44ae-8D46-0231E881D58E}" requestid="{C8F6EDF3-B623-4ee6-B2DA-1D08A0B4C665}">
+    <os platform="win" version="6.1" sp="" arch="x64"/>
+    <app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" version="%s" nextversion="" lang="en" brand="GGLS"
+         client="" ap="stable">
+        <updatecheck/>
+        <packages>
+            <package fp="%s"/>
+        </packages>
+    </app>
+</request>'''
+
+
+@override_settings(REQUEST_LOG_BUFFERED=False)
+class PatchLookupTest(VersionTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.base = cls.create_version('12.0.0.0', b'old build')
+        patch = Patch(version=cls.version, base=cls.base, status='ready', file_size=3, file_hash_sha256='cd' * 32)
+        patch.file.save('chrome_patch.bin', ContentFile(b'bsdiff'), save=False)
+        patch.save()
+
+    def get_package(self, version, fp):
+        body = PATCH_REQUEST % (version.encode(), fp.encode())
+        self.assertTrue(get_schema().validate(etree.fromstring(body)))
+        response = self.client.post(reverse('update'), body, content_type='text/xml')
+        return etree.fromstring(response.content).find('app/updatecheck/manifest/packages/package')
+
+    def test_fingerprint(self):
+        self.assertEqual(self.base.file_fingerprint, '1.' + self.base.file_hash_sha256)
+        package = self.get_package('12.0.0.0', self.base.file_fingerprint)
+        self.assertEqual(package.get('fp'), self.version.file_fingerprint)
+        self.assertEqual(package.get('namediff'), 'chrome_patch.bin')
+        # e.g. a rebuilt 12.0.0.0, the patch would not apply to its file
+        self.assertIsNone(self.get_package('12.0.0.0', '1.' + 'ef' * 32).get('namediff'))
+        # installed before manifests carried a fingerprint
+        self.assertEqual(self.get_package('12.0.0.0', '').get('namediff'), 'chrome_patch.bin')
+
+
+class UploadPatchesTest(VersionTestCase):
+    def test_queued_once_stored(self):
+        path = os.path.join(self.media_root, 'staged.upload')
+        with open(path, 'wb') as staged:
+            staged.write(b'new build')
+        upload = FileUpload.objects.create(model='omaha.version', object_id=str(self.version.pk), field_name='file',
+                                           name=self.version.file.name, path=path, size=9, enable=True)
+        with mock.patch.object(models, 'GENERATE_PATCHES', True), \
+                mock.patch.object(models, 'signature') as signature, \
+                self.captureOnCommitCallbacks(execute=True):
+            uploads.run_upload(upload.pk)
+        signature.assert_called_once_with('tasks.generate_patches', args=(self.version.pk,))
+
+
+class UserIdsTest(SimpleTestCase):
+    """
+    Ids allocated in the statistics Redis, under a key prefix of their own.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            utils.redis.ping()
+        except Exception as e:
+            raise unittest.SkipTest('Redis is not available: %s' % e)
+
+    def setUp(self):
+        self.prefix = 'test:%s' % uuid.uuid4().hex
+        for target, value in (('KEY_PREFIX', self.prefix), ('id_cache', utils.IdCache(10))):
+            patcher = mock.patch.object(utils, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: utils.redis.delete(*utils.redis.keys(self.prefix + ':*')))
+
+    def test_ids(self):
+        first, second = '{8C65E04C-0383-4AE2-893F-4EC7C58F70DC}', '{D0BBD725-742D-44AE-8D46-0231E881D58E}'
+        ids = utils.get_ids([first, second, first])
+        self.assertEqual(ids, [ids[0], ids[0] + 1, ids[0]])
+        self.assertEqual(utils.get_id(first), ids[0])
+        self.assertEqual(utils.create_id(second), ids[1])
+        utils.id_cache.ids.clear()
+        self.assertEqual(utils.get_ids([second, first]), [ids[1], ids[0]])
+
+
+@override_settings(REQUEST_LOG_BUFFERED=False)
+class ActiveUsersViewTest(TestCase):
+    def setUp(self):
+        backend = pings.LocalBackend()
+        day = date(2016, 3, 4)
+        backend.add({(day, (APP_ID, '1.0.0.0', 'stable', 'win')): {'a', 'b'},
+                     (day, (APP_ID, '2.0.0.0', 'stable', 'win')): {'b', 'c'},
+                     (day - timedelta(days=3), (APP_ID, '1.0.0.0', 'beta', 'win')): {'d'}})
+        patcher = mock.patch.object(pings, 'backend', backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+
+    def get(self, **params):
+        return self.client.get(reverse('active_users_report'), params)
+
+    def test_counts(self):
+        self.assertEqual(self.get(appid=APP_ID, day='2016-03-04').json(),
+                         dict(appid=APP_ID, period='day', count=3))
+        self.assertEqual(self.get(appid=APP_ID, day='2016-03-04', period='week').json()['count'], 4)
+        self.assertEqual(self.get(appid=APP_ID, day='2016-03-04', version='2.0.0.0').json()['count'], 2)
+        self.assertEqual(self.get(appid=APP_ID, day='2016-03-04', channel='beta').json()['count'], 0)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get(day='2016-03-04').status_code, 400)
+        self.assertEqual(self.get(appid=APP_ID, day='03/04/2016').status_code, 400)
+        self.assertEqual(self.get(appid=APP_ID, period='year').status_code, 400)
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.get(appid=APP_ID).status_code, 302)
+
+
+@override_settings(CACHEOPS_ENABLED=False)
+class RollupsTest(TestCase):
+    def setUp(self):
+        self.os = Os.objects.create(platform='win', version='6.1')
+
+    def add_request(self, version):
+        request = Request.objects.create(os=self.os, version='1.3.23.0')
+        return AppRequest.objects.create(request=request, appid=APP_ID, version=version, tag='stable')
+
+    def test_refresh_twice(self):
+        # new installs send version="", stored as NULL
+        self.add_request(None)
+        self.add_request('1.0.0.0')
+        self.assertEqual(rollups.refresh_rollups(lag=0), 2)
+        self.add_request(None)
+        self.add_request('1.0.0.0')
+        self.assertEqual(rollups.refresh_rollups(lag=0), 2)
+        self.assertEqual(dict((str(rollup.version), rollup.requests) for rollup in RequestRollup.objects.all()),
+                         {'0.0.0.0': 2, '1.0.0.0': 2})
+
+    def test_safety_lag(self):
+        now = rollups.timezone.now()
+        self.add_request('1.0.0.0')
+        with mock.patch.object(rollups.timezone, 'now', return_value=now):
+            # the first run only records the highest id
+            self.assertEqual(rollups.refresh_rollups(lag=60), 0)
+        # e.g. a transaction that commits after the run with a lower id
+        self.add_request('1.0.0.0')
+        with mock.patch.object(rollups.timezone, 'now', return_value=now + timedelta(seconds=30)):
+            self.assertEqual(rollups.refresh_rollups(lag=60), 0)
+        with mock.patch.object(rollups.timezone, 'now', return_value=now + timedelta(seconds=61)):
+            self.assertEqual(rollups.refresh_rollups(lag=60), 1)
+        with mock.patch.object(rollups.timezone, 'now', return_value=now + timedelta(seconds=122)):
+            self.assertEqual(rollups.refresh_rollups(lag=60), 1)
+        self.assertEqual(RequestRollup.objects.get().requests, 2)
+
+
+DOWNLOAD_REQUEST = b"""<?xml version="1.0" encoding="UTF-8"?>
+<request protocol="3.0" version="1.3.23.0" ismachine="0" userid="%s">
+    <os platform="win" version="6.1" sp="" arch="x64"/>
+    <app appid="{430FD4D0-B729-4F61-AA34-91526481799D}" version="1.0.0.0" nextversion="13.0.782.112" lang="en">
+        <event eventtype="14" eventresult="1" errorcode="0" downloaded="1000" total="1000"
+               download_time_ms="10" source_url_index="0"/>
+    </app>
+</request>"""
+
+
+@override_settings(CACHEOPS_ENABLED=False, CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'statistics': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+class MirrorStatsTest(TestCase):
+    def setUp(self):
+        mirror_ranking.clear()
+        self.first = Mirror.objects.create(name='first', url='http://first.example.com', priority=0)
+        self.second = Mirror.objects.create(name='second', url='http://second.example.com', priority=1)
+
+    def add_download(self, userid):
+        root = etree.fromstring(DOWNLOAD_REQUEST % userid.encode())
+        mirrors.add_records([get_request_record(root, ip='127.0.0.1')])
+
+    def test_served_order(self):
+        served = '{D0BBD725-742D-44AE-8D46-0231E881D58E}'
+        # served while the second mirror ranked first
+        served_orders.write([(served, [APP_ID.lower()], ((self.second.pk, self.second.url),
+                                                          (self.first.pk, self.first.url)))])
+        self.add_download(served.lower())
+        # no order was served to this client, two mirrors leave the index ambiguous
+        self.add_download('{8C65E04C-0383-4AE2-893F-4EC7C58F70DC}')
+        stats = MirrorStats.objects.get()
+        self.assertEqual((stats.mirror, stats.downloads, stats.bytes), (self.second, 1, 1000))
+
+    def test_expired_order(self):
+        ranking = mirrors.MirrorRanking(ttl=0)
+        order = ranking.get('')
+        self.assertIn((self.first.pk, self.first.url), order)
+        with ranking._lock, mock.patch.object(ranking, 'compute') as compute:
+            # served while another thread computes
+            self.assertEqual(ranking.get(''), order)
+        compute.assert_not_called()
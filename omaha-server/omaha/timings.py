@@ -0,0 +1,139 @@
+# coding: utf8
+
+"""
+This software is licensed under the Apache 2 license, quoted below.
+
+Copyright 2014 Crystalnix Limited
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not
+use this file except in compliance with the License. You may obtain a copy of
+the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations under
+the License.
+
+Event counts, error counts and timing percentiles per day, app version
+and event type.
+
+Statistics workers summarize each batch of records into DDSketches and
+merge them into the EventSummary rows in the transaction that inserts
+the batch. Reports merge the rows of a date range, so no query reads raw
+Event rows.
+"""
+
+from django.utils import timezone
+from versionfield.utils import convert_version_string_to_int
+
+from omaha.catalog import get_day
+from omaha.ddsketch import DDSketch
+from omaha.models import EventSummary, is_error_event
+
+
+__all__ = ['METRICS', 'QUANTILES', 'add_records', 'get_event_summary']
+
+
+METRICS = ('download_time_ms', 'install_time_ms', 'update_check_time_ms', 'downloaded', 'total')
+QUANTILES = dict(p50=0.5, p95=0.95, p99=0.99)
+
+NUMBER_BITS = EventSummary._meta.get_field('version').number_bits
+
+
+def summarize(records):
+    summaries = {}
+    now = timezone.now()
+    for record in records:
+        day = get_day(record['request'].get('created') or now)
+        for app in record['apps']:
+            version = convert_version_string_to_int(app['app']['version'] or '0', NUMBER_BITS)
+            for event in app['events']:
+                if event['eventtype'] is None:
+                    continue
+                key = (day, app['app']['appid'], version, event['eventtype'])
+                summary = summaries.get(key)
+                if summary is None:
+                    summary = summaries[key] = dict(events=0, errors=0, sketches={})
+                summary['events'] += 1
+                summary['errors'] += is_error_event(event['eventtype'], event['eventresult'], event['errorcode'])
+                for metric in METRICS:
+                    value = event[metric]
+                    if value is not None:
+                        sketch = summary['sketches'].get(metric)
+                        if sketch is None:
+                            sketch = summary['sketches'][metric] = DDSketch()
+                        sketch.add(value)
+    return summaries
+
+
+def add_records(records):
+    """
+    Merge the events of records built by omaha.statistics into the
+    summaries. Run inside the transaction inserting the records: rows are
+    created without conflicts first and then locked, so concurrent
+    workers merge one after the other.
+    """
+    summaries = summarize(records)
+    if not summaries:
+        return
+    EventSummary.objects.bulk_create(
+        [EventSummary(day=day, appid=appid, version=version, eventtype=eventtype)
+         for day, appid, version, eventtype in summaries],
+        ignore_conflicts=True)
+    rows = (EventSummary.objects.select_for_update()
+            .filter(day__in=set(key[0] for key in summaries),
+                    appid__in=set(key[1] for key in summaries),
+                    eventtype__in=set(key[3] for key in summaries))
+            .order_by('pk'))
+    updated = []
+    for row in rows:
+        summary = summaries.get((row.day, row.appid, int(row.version), row.eventtype))
+        if summary is None:
+            continue
+        row.events += summary['events']
+        row.errors += summary['errors']
+        sketches = row.sketches or {}
+        for metric, sketch in summary['sketches'].items():
+            if metric in sketches:
+                sketch.merge(DDSketch.from_dict(sketches[metric]))
+            sketches[metric] = sketch.to_dict()
+        row.sketches = sketches
+        updated.append(row)
+    EventSummary.objects.bulk_update(updated, ['events', 'errors', 'sketches'])
+
+
+def get_event_summary(appid, start, end, version=None, eventtype=None):
+    """
+    Merged counts and percentiles of appid's events between the start
+    and end days, optionally for one version and event type.
+
+        >>> import datetime
+        >>> get_event_summary('{430FD4D0-B729-4F61-AA34-91526481799D}',
+        ...                   datetime.date(2016, 3, 1), datetime.date(2016, 3, 4))
+        {'events': 0, 'errors': 0, 'error_rate': None, 'metrics': {}}
+    """
+    rows = EventSummary.objects.filter(appid=appid, day__gte=start, day__lte=end)
+    if version:
+        rows = rows.filter(version=version)
+    if eventtype is not None:
+        rows = rows.filter(eventtype=eventtype)
+    events = errors = 0
+    sketches = {}
+    for row in rows.iterator():
+        events += row.events
+        errors += row.errors
+        for metric, data in (row.sketches or {}).items():
+            sketch = DDSketch.from_dict(data)
+            if metric in sketches:
+                sketches[metric].merge(sketch)
+            else:
+                sketches[metric] = sketch
+    metrics = {}
+    for metric, sketch in sketches.items():
+        metrics[metric] = dict(count=sketch.count)
+        metrics[metric].update((name, sketch.quantile(q)) for name, q in QUANTILES.items())
+    return dict(events=events, errors=errors, error_rate=errors / events if events else None,
+                metrics=metrics)
@@ -2,8 +2,14 @@
 from django.urls import path
 from django.conf.urls import include
 from omaha import views
+from omaha.settings import ASYNC_UPDATE_VIEW
+
+UpdateView = views.AsyncUpdateView if ASYNC_UPDATE_VIEW else views.UpdateView
 
 urlpatterns = [
-    path('service/update2/', views.UpdateView.as_view(), name='update'),
+    path('service/update2/', UpdateView.as_view(), name='update'),
+    path('api/reports/events/', views.EventReportView.as_view(), name='event_report'),
+    path('api/reports/active-users/', views.ActiveUsersView.as_view(), name='active_users_report'),
+    path('api/reports/<str:report>/', views.ReportView.as_view(), name='report'),
 ]
 
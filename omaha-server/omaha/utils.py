@@ -18,24 +18,27 @@ License for the specific language governing permissions and limitations under
 the License.
 """
 
-from functools import wraps
+from collections import OrderedDict
+from functools import lru_cache, wraps
 import datetime
 import calendar
+import threading
 
 from django.db.models import Q
 
 from singledispatch import singledispatch
-# from django_redis import get_redis_connection
-from redis.exceptions import WatchError
+from django_redis import get_redis_connection
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 
-from omaha.settings import KEY_PREFIX, KEY_LAST_ID
+from omaha.settings import KEY_PREFIX, KEY_LAST_ID, USER_ID_CACHE_SIZE
 from omaha.models import Platform
 from sparkle.models import SparkleVersion
 
-__all__ = ['get_sec_since_midnight', 'get_id', 'valuedispatch', 'redis', 'get_days_since_20070101']
+__all__ = ['get_sec_since_midnight', 'get_id', 'get_ids', 'valuedispatch', 'redis', 'get_days_since_20070101']
 
-# redis = get_redis_connection('statistics')
+# Connected on first use, so importing this module needs no Redis
+redis = SimpleLazyObject(lambda: get_redis_connection('statistics'))
 
 
 def get_sec_since_midnight(date):
@@ -64,40 +67,108 @@ def get_days_since_20070101(date):
     return delta.days
 
 
-# def get_id(uuid):
-#     """
-#     >>> get_id('{8C65E04C-0383-4AE2-893F-4EC7C58F70DC}')
-#     1
-#     >>> get_id('{8C65E04C-0383-4AE2-893F-4EC7C58F70DC}')
-#     1
-#     """
-#     id = redis.get('{}:{}'.format(KEY_PREFIX, uuid))
-#     if id is None:
-#         id = create_id(uuid)
-#     return int(id)
+# KEYS: uuid key, last id key. Scripts run atomically, so concurrent
+# requests for a new uuid get the same id and ids stay dense.
+CREATE_ID_SCRIPT = """
+local id = redis.call('GET', KEYS[1])
+if not id then
+    id = redis.call('INCR', KEYS[2])
+    redis.call('SET', KEYS[1], id)
+end
+return id
+"""
 
 
-# def create_id(uuid):
-#     """
-#     >>> create_id('{8C65E04C-0383-4AE2-893F-4EC7C58F70DC}')
-#     1
-#     """
-#     with redis.pipeline() as pipe:
-#         while True:
-#             try:
-#                 pipe.watch(KEY_LAST_ID)
-#                 current_id = pipe.get(KEY_LAST_ID) or 0
-#                 next_id = int(current_id) + 1
-#                 pipe.multi()
-#                 pipe.set(KEY_LAST_ID, next_id)
-#                 pipe.execute()
-
-#                 redis.set('{}:{}'.format(KEY_PREFIX, uuid), next_id)
-#                 return next_id
-#             except WatchError:
-#                 continue
-#             except:
-#                 raise
+class IdCache(object):
+    """
+    LRU of allocated ids. Ids never change once allocated, so the cache
+    never has to be invalidated.
+
+        >>> cache = IdCache(2)
+        >>> cache.update({'a': 1, 'b': 2})
+        >>> cache.get_many(['a', 'c'])
+        [1, None]
+        >>> cache.update({'c': 3})
+        >>> cache.get_many(['a', 'b', 'c'])
+        [1, None, 3]
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, uuids):
+        result = []
+        with self.lock:
+            for uuid in uuids:
+                id = self.ids.get(uuid)
+                if id is not None:
+                    self.ids.move_to_end(uuid)
+                result.append(id)
+        return result
+
+    def update(self, ids):
+        with self.lock:
+            for uuid, id in ids.items():
+                self.ids[uuid] = id
+                self.ids.move_to_end(uuid)
+            while len(self.ids) > self.size:
+                self.ids.popitem(last=False)
+
+
+id_cache = IdCache(USER_ID_CACHE_SIZE)
+
+
+def get_key(uuid):
+    return '{}:{}'.format(KEY_PREFIX, uuid)
+
+
+@lru_cache(maxsize=None)
+def get_create_id_script():
+    """
+    CREATE_ID_SCRIPT registered once, on first use like the connection.
+    """
+    return redis.register_script(CREATE_ID_SCRIPT)
+
+
+def get_id(uuid):
+    return get_ids([uuid])[0]
+
+
+def allocate_ids(keys, last_id_key=KEY_LAST_ID):
+    """
+    Return the ids stored at keys, allocating the missing ones: one MGET
+    for all the keys and one pipeline of allocations for the new ones.
+    """
+    ids = redis.mget(keys)
+    new = [key for key, id in zip(keys, ids) if id is None]
+    if new:
+        create = get_create_id_script()
+        with redis.pipeline(transaction=False) as pipe:
+            for key in new:
+                create(keys=[key, last_id_key], client=pipe)
+            created = dict(zip(new, pipe.execute()))
+        ids = [created[key] if id is None else id for key, id in zip(keys, ids)]
+    return [int(id) for id in ids]
+
+
+def get_ids(uuids):
+    """
+    Return the id of each uuid, allocating ids for the unknown ones.
+    Uuids found in the local cache cost no round trip.
+    """
+    ids = id_cache.get_many(uuids)
+    missing = list(OrderedDict.fromkeys(uuid for uuid, id in zip(uuids, ids) if id is None))
+    if not missing:
+        return ids
+    found = dict(zip(missing, allocate_ids([get_key(uuid) for uuid in missing])))
+    id_cache.update(found)
+    return [found[uuid] if id is None else id for uuid, id in zip(uuids, ids)]
+
+
+def create_id(uuid):
+    return int(get_create_id_script()(keys=[get_key(uuid), KEY_LAST_ID]))
 
 
 # def valuedispatch(func):
@@ -1,15 +1,64 @@
 from django.shortcuts import render
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import close_old_connections
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
 from django.views.generic import View
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 
 from lxml.etree import XMLSyntaxError
 
 from omaha.builder import build_response
+from omaha.parser import RequestError
 from config.utils import get_client_ip
 from omaha.models import Request
+from omaha.pings import PERIOD_DAYS, count_active_users
+from omaha.rollups import REPORTS, get_report
+from omaha.timings import get_event_summary
+from omaha.settings import ASYNC_UPDATE_WORKERS
+
+
+logger = logging.getLogger(__name__)
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        with executor_lock:
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=ASYNC_UPDATE_WORKERS,
+                                              thread_name_prefix='omaha-update')
+    return executor
+
+
+def build_response_in_executor(body, ip):
+    try:
+        return build_response(body, ip=ip)
+    finally:
+        # executor threads live outside the request cycle, so nothing
+        # else closes the connections a catalog reload may have opened
+        close_old_connections()
+
+
+def bad_request(request):
+    logger.error('UpdateView', exc_info=True, extra=dict(request=request))
+    msg = b"""<?xml version="1.0" encoding="utf-8"?>
+                    <data>
+                        <message>
+                            Bad Request
+                        </message>
+                    </data>"""
+    return HttpResponse(msg, status=400, content_type="text/html; charset=utf-8")
+
 
 class UpdateView(View):
     http_method_names = ['post']
@@ -21,14 +70,103 @@ class UpdateView(View):
     def post(self, request):
         try:
             response = build_response(request.body, ip=get_client_ip(request))
-        except XMLSyntaxError:
-            logger.error('UpdateView', exc_info=True, extra=dict(request=request))
-            msg = b"""<?xml version="1.0" encoding="utf-8"?>
-                    <data>
-                        <message>
-                            Bad Request
-                        </message>
-                    </data>"""
-            return HttpResponse(msg, status=400, content_type="text/html; charset=utf-8")
+        except (XMLSyntaxError, RequestError):
+            return bad_request(request)
+        return HttpResponse(response, content_type="text/xml; charset=utf-8")
+
+
+class AsyncUpdateView(UpdateView):
+    """
+    Update endpoint for the ASGI stack.
+
+    Resolution runs on the in-memory release catalog, so the only work
+    left is CPU-bound parsing and serialization. It is handed to a
+    bounded thread pool (OMAHA_ASYNC_UPDATE_WORKERS) and the event loop
+    stays free to serve slow clients.
+    """
+
+    async def post(self, request):
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(
+                get_executor(), build_response_in_executor, request.body, get_client_ip(request))
+        except (XMLSyntaxError, RequestError):
+            return bad_request(request)
         return HttpResponse(response, content_type="text/xml; charset=utf-8")
 
+
+@method_decorator(staff_member_required, name='dispatch')
+class ReportView(View):
+    """
+    JSON rows of an omaha.rollups report:
+    ?appid=...&start=YYYY-MM-DD&end=YYYY-MM-DD[&channel=...][&platform=...]
+    """
+    http_method_names = ['get']
+
+    def get(self, request, report):
+        if report not in REPORTS:
+            return HttpResponseBadRequest('Unknown report')
+        params = request.GET
+        try:
+            start, end = parse_date(params['start']), parse_date(params['end'])
+            appid = params['appid']
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest('appid, start and end are required')
+        if start is None or end is None:
+            return HttpResponseBadRequest('start and end must be YYYY-MM-DD')
+        rows = get_report(report, appid, start, end,
+                          channel=params.get('channel'), platform=params.get('platform'))
+        return JsonResponse(dict(report=report, rows=rows))
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class EventReportView(View):
+    """
+    JSON event counts, error rate and timing percentiles from
+    omaha.timings:
+    ?appid=...&start=YYYY-MM-DD&end=YYYY-MM-DD[&version=...][&eventtype=...]
+    """
+    http_method_names = ['get']
+
+    def get(self, request):
+        params = request.GET
+        try:
+            start, end = parse_date(params['start']), parse_date(params['end'])
+            appid = params['appid']
+            eventtype = int(params['eventtype']) if params.get('eventtype') else None
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest('appid, start and end are required, eventtype is a number')
+        if start is None or end is None:
+            return HttpResponseBadRequest('start and end must be YYYY-MM-DD')
+        try:
+            summary = get_event_summary(appid, start, end, version=params.get('version'),
+                                        eventtype=eventtype)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid version')
+        return JsonResponse(summary)
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ActiveUsersView(View):
+    """
+    JSON estimate of the distinct users that pinged an app, from
+    omaha.pings:
+    ?appid=...[&period=day|week|month][&day=YYYY-MM-DD][&version=...][&channel=...][&platform=...]
+    """
+    http_method_names = ['get']
+
+    def get(self, request):
+        params = request.GET
+        period = params.get('period', 'day')
+        try:
+            appid = params['appid']
+            day = parse_date(params['day']) if params.get('day') else None
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest('appid is required, day must be YYYY-MM-DD')
+        if params.get('day') and day is None:
+            return HttpResponseBadRequest('day must be YYYY-MM-DD')
+        if period not in PERIOD_DAYS:
+            return HttpResponseBadRequest('period must be one of %s' % ', '.join(PERIOD_DAYS))
+        count = count_active_users(appid, period=period, day=day, version=params.get('version'),
+                                   channel=params.get('channel'), platform=params.get('platform'))
+        return JsonResponse(dict(appid=appid, period=period, count=count))
@@ -19,16 +19,19 @@ the License.
 """
 
 from django.contrib import admin
+
+from common.admin import FileUploadMixin
 from sparkle.models import SparkleVersion
 from sparkle.forms import SparkleVersionAdminForm
 
 
 @admin.register(SparkleVersion)
-class VersionAdmin(admin.ModelAdmin):
+class VersionAdmin(FileUploadMixin, admin.ModelAdmin):
     list_display = (
         'created', 'modified', 'app', 'version', 'short_version',
         'minimum_system_version', 'channel', 'is_enabled', 'is_critical'
     )
     list_display_links = ('created', 'modified', 'version',)
     list_filter = ('channel__name', 'app__name', 'is_enabled',)
+    readonly_fields = ('file_upload',)
     form = SparkleVersionAdminForm
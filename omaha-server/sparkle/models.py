@@ -24,10 +24,11 @@ import os
 
 from django.db import models
 from django.dispatch import receiver
-from django.db.models.signals import pre_delete,pre_save
+from django.db.models.signals import pre_delete, pre_save, post_save
 
 from versionfield import VersionField
 
+from common.uploads import defer_upload, schedule_uploads
 from omaha.models import BaseModel, Application, Channel
 from sparkle.managers import VersionManager
 # Comment out S3 import for later use
@@ -107,6 +108,12 @@ def pre_sparkle_save(sender, instance, *args, **kwargs):
         else:
             old.file.delete(save=False)
             old.file_size = 0
+    defer_upload(instance)
+
+
+@receiver(post_save, sender=SparkleVersion)
+def post_sparkle_save(sender, instance, *args, **kwargs):
+    schedule_uploads(instance)
 
 
 @receiver(pre_delete, sender=SparkleVersion)